@@ -0,0 +1,65 @@
+"""Compare deadband and swinging-door compression on synthetic process signals.
+
+For each signal shape and deviation, reports how many of a day's 5 s
+samples are kept, the largest error after re-interpolating the kept points
+back onto the 5 s grid, and the compression time:
+
+- sine:  fake_historian's slow sine with small noise
+- drift: a slow random walk with a step change and a few bad (NaN) samples
+- flat:  a constant setpoint
+
+    python benchmarks/bench_compression.py --deviations 0.1 0.5 1.0
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+import series_compression  # noqa: E402
+from fake_historian import synthetic_frame  # noqa: E402
+
+
+def signals(sample_seconds, days):
+    end = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=days)
+    frame = synthetic_frame('BENCH', end - datetime.timedelta(days=days), end, sample_seconds)
+    timestamps = frame['timestamp'].to_numpy()
+    n = len(timestamps)
+    drift = np.round(20.0 + np.cumsum(np.random.default_rng(0).normal(0.0, 0.002, n)), 2)
+    drift[n // 2:] += 5.0
+    drift[n // 3:n // 3 + 3] = np.nan
+    return timestamps, {'sine': frame['value'].to_numpy(), 'drift': drift, 'flat': np.full(n, 42.0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--deviations', type=float, nargs='+', default=[0.1, 0.5, 1.0])
+    parser.add_argument('--days', type=int, default=1, help='days of data (default: 1)')
+    parser.add_argument('--sample-seconds', type=int, default=5, help='sample interval (default: 5)')
+    args = parser.parse_args()
+
+    timestamps, series = signals(args.sample_seconds, args.days)
+    print(f"{len(timestamps)} samples per signal")
+    print(f"{'signal':7} {'method':14} {'deviation':>9} {'kept':>7} {'ratio':>7} {'max error':>10} {'ms':>7}")
+    for name, values in series.items():
+        valid = ~np.isnan(values)
+        for method in series_compression.METHODS:
+            for deviation in args.deviations:
+                start = time.perf_counter()
+                kept_timestamps, kept_values = series_compression.compress_series(timestamps, values, method,
+                                                                                  deviation)
+                elapsed = time.perf_counter() - start
+                rebuilt = series_compression.reinterpolate(kept_timestamps, kept_values, timestamps)
+                error = np.nanmax(np.abs(rebuilt[valid] - values[valid]))
+                print(f"{name:7} {method:14} {deviation:>9g} {len(kept_values):>7} "
+                      f"{len(values) / len(kept_values):>6.1f}x {error:>10.4f} {elapsed * 1000:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
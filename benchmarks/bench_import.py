@@ -0,0 +1,128 @@
+"""Compare rows/sec of the legacy row-by-row insert with the columnar path.
+
+Also loads the same data into the narrow Tags/TagFacts schema and reports the
+database size and the cost of a GetTagDataInRange-style range aggregate for
+both schemas. Runs entirely against the SQLite stand-in backends:
+
+    python benchmarks/bench_import.py --rows 172800 --tags 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from db_backend import SQLiteBackend, SQLiteNarrowBackend  # noqa: E402
+from sql_import import SQLImporter  # noqa: E402
+
+
+def write_sample_csv(path, rows, start='2024-01-01'):
+    """Write one tag worth of 5-second samples."""
+    timestamps = pd.date_range(start, periods=rows, freq='5s')
+    values = np.random.default_rng(0).normal(50.0, 5.0, rows)
+    pd.DataFrame({'timestamp': timestamps, 'value': values}).to_csv(path, index=False)
+
+
+def legacy_import(conn, tag_name, file_path, batch_size=1000):
+    """The pre-columnar import loop, kept here only as a baseline."""
+    df = pd.read_csv(file_path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    cursor = conn.cursor()
+    insert_sql = "INSERT INTO TagData (TagName, Timestamp, Value) VALUES (?, ?, ?)"
+    for i in range(0, len(df), batch_size):
+        batch = df.iloc[i:i + batch_size]
+        values = [(tag_name, row['timestamp'].strftime('%Y-%m-%d %H:%M:%S'), float(row['value']))
+                  for _, row in batch.iterrows()]
+        cursor.executemany(insert_sql, values)
+        conn.commit()
+    return len(df)
+
+
+RANGE_SQL = {
+    'wide': """
+        SELECT COUNT(*), AVG(Value), MIN(Value), MAX(Value) FROM TagData
+        WHERE TagName = ? AND Timestamp BETWEEN ? AND ?
+    """,
+    'narrow': """
+        SELECT COUNT(*), AVG(Value), MIN(Value), MAX(Value) FROM TagFacts
+        WHERE TagId = (SELECT TagId FROM Tags WHERE TagName = ?) AND Timestamp BETWEEN ? AND ?
+    """,
+}
+
+
+def import_schema(backend, csv_paths, args):
+    """Import every CSV with SQLImporter; returns (elapsed seconds, database bytes, range query seconds)."""
+    importer = SQLImporter(backend=backend)
+    importer.batch_size = args.batch_size
+    importer.commit_batches = args.commit_batches
+    conn = backend.connect()
+    start = time.perf_counter()
+    for csv_path in csv_paths:
+        importer.import_file(csv_path, conn, 1, 1)
+    elapsed = time.perf_counter() - start
+    conn.execute("VACUUM")
+
+    schema = 'narrow' if backend.uses_tag_ids else 'wide'
+    tag_name = importer.get_full_tag_name(csv_paths[0])
+    start = time.perf_counter()
+    for _ in range(20):
+        conn.execute(RANGE_SQL[schema], (tag_name, '2024-01-02T00:00:00', '2024-01-03T00:00:00')).fetchall()
+    query_elapsed = (time.perf_counter() - start) / 20
+    conn.close()
+    return elapsed, os.path.getsize(backend.path), query_elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=172800, help='rows per tag (default: 10 days at 5 s)')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--commit-batches', type=int, default=0)
+    parser.add_argument('--tags', type=int, default=4, help='tags for the schema comparison (default: 4)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'BENCH.TAG.F_CV.csv')
+        write_sample_csv(csv_path, args.rows)
+
+        backend = SQLiteBackend(os.path.join(tmp, 'legacy.db'))
+        conn = backend.connect()
+        start = time.perf_counter()
+        rows = legacy_import(conn, 'BENCH.TAG', csv_path)
+        legacy_elapsed = time.perf_counter() - start
+        conn.close()
+
+        importer = SQLImporter(backend=SQLiteBackend(os.path.join(tmp, 'columnar.db')))
+        importer.batch_size = args.batch_size
+        importer.commit_batches = args.commit_batches
+        conn = importer.backend.connect()
+        start = time.perf_counter()
+        importer.import_file(csv_path, conn, 1, 1)
+        columnar_elapsed = time.perf_counter() - start
+        conn.close()
+
+    print(f"rows:     {rows}")
+    print(f"legacy:   {rows / legacy_elapsed:12.1f} rows/sec ({legacy_elapsed:.2f} s)")
+    print(f"columnar: {rows / columnar_elapsed:12.1f} rows/sec ({columnar_elapsed:.2f} s)")
+    print(f"speedup:  {legacy_elapsed / columnar_elapsed:.1f}x")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_paths = []
+        for i in range(args.tags):
+            csv_paths.append(os.path.join(tmp, f'BENCH.TAG{i:03d}.F_CV.csv'))
+            write_sample_csv(csv_paths[-1], args.rows)
+        total_rows = args.rows * args.tags
+        print(f"\nschema comparison: {args.tags} tags, {total_rows} rows")
+        for name, backend in (('wide', SQLiteBackend(os.path.join(tmp, 'wide.db'))),
+                              ('narrow', SQLiteNarrowBackend(os.path.join(tmp, 'narrow.db')))):
+            elapsed, size, query_elapsed = import_schema(backend, csv_paths, args)
+            print(f"{name + ':':9} {total_rows / elapsed:12.1f} rows/sec, {size / total_rows:6.1f} bytes/row, "
+                  f"1-day range query {query_elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Compare CSV parse time of the legacy reader with csv_codec.
+
+Writes one tag of synthetic samples (10 days at 5 s by default, the size of a
+busy tag's retained CSV) and times each way of reading it back:
+
+- legacy:       pd.read_csv followed by pd.to_datetime, as before csv_codec
+- codec:        csv_codec.read_csv (pyarrow when installed)
+- codec-c:      csv_codec.read_csv forced onto the pandas C engine
+- codec-since:  csv_codec.read_csv_since for the last day only, as an append import does
+
+    python benchmarks/bench_parse.py --days 10 --sample-seconds 5 --repeat 5
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+import csv_codec  # noqa: E402
+from fake_historian import synthetic_frame  # noqa: E402
+
+
+def legacy_read(path):
+    df = pd.read_csv(path)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+def c_engine_read(path):
+    arrow = csv_codec.pyarrow
+    csv_codec.pyarrow = None
+    try:
+        return csv_codec.read_csv(path)
+    finally:
+        csv_codec.pyarrow = arrow
+
+
+def best_time(read, repeat):
+    """Fastest of repeat runs, in seconds, and the frame of the last run."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=10, help='days of data (default: 10)')
+    parser.add_argument('--sample-seconds', type=int, default=5, help='sample interval (default: 5)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per reader, fastest is kept (default: 5)')
+    args = parser.parse_args()
+
+    end = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=args.days)
+    frame = synthetic_frame('BENCH', end - datetime.timedelta(days=args.days), end, args.sample_seconds)
+    since = end - datetime.timedelta(days=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'BENCH.csv')
+        frame.to_csv(path, index=False)
+        size_mb = os.path.getsize(path) / 1e6
+        readers = [
+            ('legacy', lambda: legacy_read(path)),
+            (f'codec ({csv_codec.engine()})', lambda: csv_codec.read_csv(path)),
+            ('codec-c', lambda: c_engine_read(path)),
+            ('codec-since', lambda: csv_codec.read_csv_since(path, since)),
+        ]
+        print(f"{len(frame)} rows, {size_mb:.1f} MB")
+        print(f"{'reader':16} {'rows':>8} {'ms':>8} {'Mrows/sec':>10} {'MB/sec':>8} {'speedup':>8}")
+        legacy_seconds = None
+        for name, read in readers:
+            seconds, df = best_time(read, max(1, args.repeat))
+            legacy_seconds = legacy_seconds or seconds
+            print(f"{name:16} {len(df):>8} {seconds * 1000:>8.1f} {len(frame) / seconds / 1e6:>10.2f} "
+                  f"{size_mb / seconds:>8.1f} {legacy_seconds / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""End-to-end pipeline benchmark against local stand-ins, with stored baselines.
+
+Runs the three stages on synthetic data without the production systems:
+
+- export:   windows_historian_export against fake_historian.FakeHistorian
+- transfer: HistorianTransfer pulling the export over local_sftp.LocalSFTPServer
+- import:   SQLImporter into a SQLite database (db_backend.SQLiteBackend)
+
+Each stage runs in its own Python process, so wall time and peak RSS are
+measured per stage. The rows and bytes come from that stage's RunMetrics.
+Results are compared with benchmarks/baselines.json for the same profile
+(tags x days @ sample rate, workers). The exit status is 1 when a stage's
+rows/sec fell, or its peak RSS grew, by more than --tolerance:
+
+    python benchmarks/bench_pipeline.py --tags 50 --days 2 --repeat 3
+    python benchmarks/bench_pipeline.py --tags 50 --days 2 --repeat 3 --save-baseline
+
+Baselines are only comparable on the machine that recorded them; re-save
+them after changing hardware.
+
+A stage run without the stage before it (e.g. --stages import) reads CSVs
+written directly by fake_historian.write_synthetic_csvs. --keep DIR is
+cleared before each run so every run starts from the same state.
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baselines.json')
+STAGES = ('export', 'transfer', 'import')
+
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def run_export(args, workdir):
+    import windows_historian_export as exporter
+    from fake_historian import FakeHistorian
+
+    historian = FakeHistorian(tag_count=args.tags, latency=args.latency)
+    exporter.CONNECTION_FACTORY = historian.connect
+    exporter.EXPORT_PATH = os.path.join(workdir, 'export')
+    exporter.LOG_FILE = os.path.join(workdir, 'export.log')
+    exporter.SAMPLE_INTERVAL_SECONDS = args.sample_seconds
+    exporter.WIRE_COMPRESSION = args.compression
+    exporter.EXPORT_WORKERS = args.workers
+    exporter.METRICS.directory = workdir
+    os.makedirs(exporter.EXPORT_PATH, exist_ok=True)
+
+    end_time = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_time = end_time - datetime.timedelta(days=args.days)
+    exporter.METRICS.reset()
+    start = time.perf_counter()
+    if args.workers > 1:
+        exporter.export_parallel(historian.tags, start_time, end_time)
+    else:
+        conn = historian.connect()
+        exporter.export_serial(conn.cursor(), historian.tags, start_time, end_time)
+    wall = time.perf_counter() - start
+    summary, _ = exporter.METRICS.summary()
+    return summary['counters'].get('rows_fetched', 0), directory_bytes(exporter.EXPORT_PATH), wall
+
+
+def run_transfer(args, workdir):
+    import sftp_script
+    from local_sftp import LocalSFTPServer
+    from fake_historian import write_synthetic_csvs
+
+    export_dir = os.path.join(workdir, 'export')
+    if not os.path.isdir(export_dir):
+        write_synthetic_csvs(export_dir, args.tags, args.sample_seconds, args.days)
+
+    sftp_script.setup_logging()
+    transfer = sftp_script.HistorianTransfer()
+    transfer.local_path = os.path.join(workdir, 'local')
+    transfer.temp_path = os.path.join(workdir, 'temp')
+    transfer.retention_days = None
+    transfer.transfer_workers = args.workers
+    transfer.metrics.directory = workdir
+    os.makedirs(transfer.local_path, exist_ok=True)
+    os.makedirs(transfer.temp_path, exist_ok=True)
+    with LocalSFTPServer(export_dir) as server:
+        transfer.hostname, transfer.port = "127.0.0.1", server.port
+        transfer.remote_path = "/"
+        start = time.perf_counter()
+        transfer.transfer_files()
+        wall = time.perf_counter() - start
+    summary, _ = transfer.metrics.summary()
+    return summary['counters'].get('rows_parsed', 0), summary['counters'].get('bytes_transferred', 0), wall
+
+
+def run_import(args, workdir):
+    from db_backend import SQLiteBackend
+    from sql_import import SQLImporter
+    from fake_historian import write_synthetic_csvs
+
+    local_dir = os.path.join(workdir, 'local')
+    if not os.path.isdir(local_dir):
+        write_synthetic_csvs(local_dir, args.tags, args.sample_seconds, args.days)
+
+    importer = SQLImporter(backend=SQLiteBackend(os.path.join(workdir, 'bench.db')))
+    importer.csv_dir = local_dir
+    importer.watermark_path = os.path.join(workdir, 'watermarks.db')
+    importer.workers = args.workers
+    importer.metrics.directory = workdir
+    start = time.perf_counter()
+    importer.import_all()
+    wall = time.perf_counter() - start
+    summary, _ = importer.metrics.summary()
+    return summary['counters'].get('rows_inserted', 0), directory_bytes(importer.csv_dir), wall
+
+
+def run_stage(args):
+    """Child process: run one stage in --workdir and write <stage>.json.
+
+    Each runner returns (rows, bytes, wall seconds), timing only the stage
+    itself and not stand-in setup such as generating the SFTP host key.
+    """
+    workdir = os.path.abspath(args.workdir)
+    os.chdir(workdir)  # logs/ and transfer.lock stay inside the work directory
+    runner = {'export': run_export, 'transfer': run_transfer, 'import': run_import}[args.run_stage]
+    rows, data_bytes, wall = runner(args, workdir)
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result = {
+        'rows': rows,
+        'bytes': data_bytes,
+        'wall_seconds': round(wall, 3),
+        'rows_per_sec': round(rows / wall, 1) if wall else 0.0,
+        'bytes_per_sec': round(data_bytes / wall, 1) if wall else 0.0,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+    }
+    with open(os.path.join(workdir, f"{args.run_stage}.json"), 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def profile_key(args):
+    key = f"{args.tags}x{args.days}d@{args.sample_seconds}s/w{args.workers}"
+    if args.compression:
+        key += f"/{args.compression}"
+    return key
+
+
+def load_baselines():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(baselines):
+    with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(result, baseline, tolerance):
+    """Regression messages for one stage against its baseline."""
+    problems = []
+    if result['rows_per_sec'] < baseline['rows_per_sec'] * (1 - tolerance):
+        problems.append(f"rows/sec {result['rows_per_sec']:.0f} < baseline {baseline['rows_per_sec']:.0f}")
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        problems.append(f"peak RSS {result['peak_rss_mb']:.0f} MB > baseline {baseline['peak_rss_mb']:.0f} MB")
+    return problems
+
+
+def stage_command(args, stage, workdir):
+    command = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--workdir', workdir,
+               '--tags', str(args.tags), '--days', str(args.days), '--sample-seconds', str(args.sample_seconds),
+               '--workers', str(args.workers), '--latency', str(args.latency)]
+    if args.compression:
+        command += ['--compression', args.compression]
+    return command
+
+
+def run_benchmark(args, workdir):
+    results = {}
+    for stage in args.stages:
+        with open(os.path.join(workdir, f"{stage}.out"), 'w', encoding='utf-8') as out:
+            completed = subprocess.run(stage_command(args, stage, workdir), stdout=out, stderr=subprocess.STDOUT)
+        if completed.returncode != 0:
+            print(f"{stage} failed with exit code {completed.returncode}; see {workdir}/{stage}.out")
+            return None
+        with open(os.path.join(workdir, f"{stage}.json"), 'r', encoding='utf-8') as f:
+            results[stage] = json.load(f)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--tags', type=int, default=20, help='synthetic tags (default: 20)')
+    parser.add_argument('--days', type=int, default=1, help='days of data per tag (default: 1)')
+    parser.add_argument('--sample-seconds', type=int, default=5, help='sample interval (default: 5)')
+    parser.add_argument('--workers', type=int, default=1, help='workers/connections per stage (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.0, help='fake Historian seconds per query')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], help='exporter WIRE_COMPRESSION')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='run the pipeline N times and keep each stage\'s fastest run (default: 1)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed fractional drop in rows/sec or growth in peak RSS (default: 0.2)')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--keep', metavar='DIR', help='run in DIR and keep the data, logs and metrics')
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args)
+        return 0
+
+    results = {}
+    for _ in range(max(1, args.repeat)):
+        if args.keep:
+            shutil.rmtree(args.keep, ignore_errors=True)
+            os.makedirs(args.keep)
+            run = run_benchmark(args, os.path.abspath(args.keep))
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                run = run_benchmark(args, tmp)
+        if run is None:
+            return 1
+        for stage, result in run.items():
+            if stage not in results or result['rows_per_sec'] > results[stage]['rows_per_sec']:
+                results[stage] = result
+
+    key = profile_key(args)
+    baselines = load_baselines()
+    baseline = baselines.get(key, {})
+    regressions = 0
+    print(f"profile {key}")
+    print(f"{'stage':9} {'rows':>10} {'rows/sec':>11} {'MB/sec':>8} {'wall s':>8} {'peak RSS MB':>12}  baseline")
+    for stage, result in results.items():
+        status = "-"
+        if stage in baseline:
+            problems = compare(result, baseline[stage], args.tolerance)
+            regressions += bool(problems)
+            status = "REGRESSION: " + "; ".join(problems) if problems else "ok"
+        print(f"{stage:9} {result['rows']:>10} {result['rows_per_sec']:>11.0f} "
+              f"{result['bytes_per_sec'] / 1e6:>8.1f} {result['wall_seconds']:>8.2f} "
+              f"{result['peak_rss_mb']:>12.1f}  {status}")
+
+    if args.save_baseline:
+        baselines[key] = {**baseline, **results}
+        save_baselines(baselines)
+        print(f"saved baseline for {key} to {BASELINE_FILE}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
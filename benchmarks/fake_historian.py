@@ -0,0 +1,135 @@
+"""In-memory stand-in for a PyADO connection to the Historian.
+
+Understands the two query shapes the exporter issues against ``ihtags`` and
+``ihrawdata`` (single tag or ``tagname = A OR tagname = B`` groups) and
+returns deterministic synthetic interpolated samples. An optional per-query
+latency models the network round-trip to the Historian:
+
+    historian = FakeHistorian(tag_count=200, latency=0.02)
+    windows_historian_export.CONNECTION_FACTORY = historian.connect
+
+The same signal can be written straight to per-tag CSVs with
+write_synthetic_csvs, for benchmarks that skip the export stage.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+_TAG_RE = re.compile(r"tagname\s*=\s*([^\s()]+)")
+_RANGE_RE = re.compile(r"timestamp\s*>=\s*'([^']+)'\s*AND\s*timestamp\s*<\s*'([^']+)'")
+_INTERVAL_RE = re.compile(r"intervalmilliseconds\s*=\s*(\d+)(ms|s)?")
+
+
+def tag_names(tag_count):
+    return [f"SYNTH.TAG{i:05d}.F_CV" for i in range(tag_count)]
+
+
+def synthetic_values(tag, timestamps):
+    """Deterministic process-like signal per tag: slow sine plus small noise."""
+    seed = sum(ord(c) for c in tag)
+    seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+    rng = np.random.default_rng(seed + int(seconds[0]) if len(seconds) else seed)
+    base = 50.0 + (seed % 40)
+    return np.round(base + 10.0 * np.sin(seconds / 3600.0 + seed) + rng.normal(0.0, 0.2, len(seconds)), 3)
+
+
+def synthetic_frame(tag, start, end, sample_seconds=5):
+    """One tag's samples in [start, end) as a timestamp/value DataFrame."""
+    timestamps = pd.date_range(start, end, freq=f"{sample_seconds}s", inclusive="left").to_numpy()
+    return pd.DataFrame({'timestamp': timestamps, 'value': synthetic_values(tag, timestamps)})
+
+
+def write_synthetic_csvs(directory, tag_count, sample_seconds=5, days=1, end=None):
+    """Write days of samples per tag to <directory>/<tag>.csv; returns the row count.
+
+    end defaults to today's midnight so the files fall inside the retention window.
+    """
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.now().normalize()
+    start = end - pd.Timedelta(days=days)
+    os.makedirs(directory, exist_ok=True)
+    rows = 0
+    for tag in tag_names(tag_count):
+        frame = synthetic_frame(tag, start, end, sample_seconds)
+        frame.to_csv(os.path.join(directory, f"{tag}.csv"), index=False)
+        rows += len(frame)
+    return rows
+
+
+class FakeHistorianCursor:
+    def __init__(self, historian):
+        self.historian = historian
+        self._rows = []
+        self._position = 0
+
+    def execute(self, query):
+        self.historian.record_query()
+        if "ihtags" in query:
+            self._rows = [[tag] for tag in self.historian.tags]
+        else:
+            self._rows = self._raw_rows(query)
+        self._position = 0
+
+    def _raw_rows(self, query):
+        tags = _TAG_RE.findall(query)
+        start, end = (datetime.fromisoformat(value) for value in _RANGE_RE.search(query).groups())
+        amount, unit = _INTERVAL_RE.search(query).groups()
+        step_ms = int(amount) * (1 if unit == "ms" else 1000)
+        timestamps = pd.date_range(start, end, freq=f"{step_ms}ms", inclusive="left").to_numpy()
+        with_tagname = query.lstrip().upper().startswith("SELECT TAGNAME")
+        stamps = pd.DatetimeIndex(timestamps).to_pydatetime().tolist()
+        rows = []
+        for tag in tags:
+            values = synthetic_values(tag, timestamps).tolist()
+            if with_tagname:
+                rows.extend([tag, ts, value] for ts, value in zip(stamps, values))
+            else:
+                rows.extend([ts, value] for ts, value in zip(stamps, values))
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeHistorianConnection:
+    def __init__(self, historian):
+        self.historian = historian
+
+    def cursor(self):
+        return FakeHistorianCursor(self.historian)
+
+    def close(self):
+        pass
+
+
+class FakeHistorian:
+    """Factory for fake connections sharing one tag set and query counter."""
+
+    def __init__(self, tag_count=10, latency=0.0, tags=None):
+        self.tags = list(tags) if tags is not None else tag_names(tag_count)
+        self.latency = latency
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def record_query(self):
+        with self._lock:
+            self.queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def connect(self):
+        return FakeHistorianConnection(self)
@@ -0,0 +1,153 @@
+"""Local paramiko-based SFTP server standing in for the Windows export host.
+
+Serves a local directory on 127.0.0.1, accepts any username/password and
+translates Windows-style backslash paths, so HistorianTransfer can run
+unmodified against it:
+
+    with LocalSFTPServer(export_dir) as server:
+        transfer = HistorianTransfer()
+        transfer.hostname, transfer.port = "127.0.0.1", server.port
+        transfer.remote_path = "/"
+        transfer.transfer_files()
+"""
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, ServerInterface
+
+
+class _Server(ServerInterface):
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        f = getattr(self, 'readfile', None) or getattr(self, 'writefile')
+        return SFTPAttributes.from_stat(os.fstat(f.fileno()))
+
+
+class _SFTPInterface(SFTPServerInterface):
+    def __init__(self, server, *args, root=None, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        path = path.replace("\\", "/")
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def _attrs(self, path):
+        return SFTPAttributes.from_stat(os.stat(path))
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            result = []
+            for name in os.listdir(local):
+                attr = self._attrs(os.path.join(local, name))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return self._attrs(self._local(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        local = self._local(path)
+        try:
+            mode = "rb"
+            if flags & os.O_WRONLY:
+                mode = "ab" if flags & os.O_APPEND else "wb"
+            elif flags & os.O_RDWR:
+                mode = "r+b"
+            f = open(local, mode)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        handle = _Handle(flags)
+        if "r" in mode or "+" in mode:
+            handle.readfile = f
+        if "r" not in mode or "+" in mode:
+            handle.writefile = f
+        handle.filename = local
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def canonicalize(self, path):
+        return path
+
+
+class LocalSFTPServer:
+    """Threaded SFTP server rooted at a local directory on an ephemeral port."""
+
+    def __init__(self, root, host="127.0.0.1", port=0):
+        self.root = os.path.abspath(root)
+        self.host = host
+        self.port = port
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self._socket = None
+        self._transports = []
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(16)
+        self._socket.settimeout(0.5)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, name="local-sftp", daemon=True)
+        self._thread.start()
+        return self
+
+    def _serve(self):
+        while not self._stopping.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, _SFTPInterface, root=self.root)
+            transport.start_server(server=_Server())
+            self._transports.append(transport)
+
+    def stop(self):
+        self._stopping.set()
+        if self._socket:
+            self._socket.close()
+        for transport in self._transports:
+            transport.close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,141 @@
+-- Add the rollup tables to an existing HistorianData database and switch
+-- GetTagAverage / GetTagDataInRange to read from them.
+-- Run while the scheduler is stopped; sql_import.py maintains the rollups from
+-- then on (SQLImporter.rollups).
+
+USE HistorianData;
+GO
+
+CREATE TABLE TagRollup1m (
+    TagName NVARCHAR(255) NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the minute
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1m PRIMARY KEY CLUSTERED (TagName, BucketStart)
+);
+GO
+
+CREATE TABLE TagRollup1h (
+    TagName NVARCHAR(255) NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the hour
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1h PRIMARY KEY CLUSTERED (TagName, BucketStart)
+);
+GO
+
+-- Build the rollups of the existing samples
+INSERT INTO dbo.TagRollup1m (TagName, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+SELECT TagName,
+       DATEADD(MINUTE, DATEDIFF(MINUTE, '2000-01-01', Timestamp), '2000-01-01'),
+       MIN(Value), MAX(Value), SUM(Value), COUNT(*)
+FROM dbo.TagData
+WHERE Status = 0
+GROUP BY TagName, DATEADD(MINUTE, DATEDIFF(MINUTE, '2000-01-01', Timestamp), '2000-01-01');
+GO
+
+INSERT INTO dbo.TagRollup1h (TagName, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+SELECT TagName,
+       DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', BucketStart), '2000-01-01'),
+       MIN(MinValue), MAX(MaxValue), SUM(SumValue), SUM(SampleCount)
+FROM dbo.TagRollup1m
+GROUP BY TagName, DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', BucketStart), '2000-01-01');
+GO
+
+CREATE OR ALTER FUNCTION dbo.GetTagAverage
+(
+    @TagName NVARCHAR(255),
+    @StartTime DATETIME2,
+    @EndTime DATETIME2
+)
+RETURNS FLOAT
+AS
+BEGIN
+    DECLARE @Result FLOAT;
+    -- Whole hours inside the range come from TagRollup1h, the edges from raw samples
+    DECLARE @RollStart DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @StartTime), '2000-01-01');
+    IF @RollStart < @StartTime SET @RollStart = DATEADD(HOUR, 1, @RollStart);
+    DECLARE @RollEnd DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @EndTime), '2000-01-01');
+    
+    SELECT @Result = SUM(SumValue) / NULLIF(SUM(SampleCount), 0)
+    FROM (
+        SELECT SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Value, 1
+        FROM dbo.TagData
+        WHERE TagName = @TagName
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0  -- Only consider normal values
+    ) AS parts;
+    
+    RETURN @Result;
+END;
+GO
+
+-- Create stored procedures for common operations
+CREATE OR ALTER PROCEDURE dbo.GetTagDataInRange
+    @TagName NVARCHAR(255),
+    @StartTime DATETIME2,
+    @EndTime DATETIME2,
+    @Interval INT = 60  -- Default interval in seconds
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    -- Intervals made of whole hours (or minutes) read the rollup buckets that
+    -- lie fully inside the range; only the partial buckets at the edges, and
+    -- any other interval, read raw samples
+    DECLARE @Bucket INT = CASE WHEN @Interval % 3600 = 0 THEN 3600
+                               WHEN @Interval % 60 = 0 THEN 60
+                               ELSE 0 END;
+    DECLARE @RollStart DATETIME2 = @EndTime;
+    DECLARE @RollEnd DATETIME2 = @EndTime;
+    IF @Bucket > 0
+    BEGIN
+        SET @RollStart = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @StartTime) / @Bucket * @Bucket, '2000-01-01');
+        IF @RollStart < @StartTime SET @RollStart = DATEADD(SECOND, @Bucket, @RollStart);
+        SET @RollEnd = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @EndTime) / @Bucket * @Bucket, '2000-01-01');
+    END
+    
+    SELECT 
+        @TagName AS TagName,
+        DATEADD(SECOND, 
+                DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
+                '2000-01-01') as IntervalStart,
+        SUM(SumValue) / SUM(SampleCount) as AverageValue,
+        MIN(MinValue) as MinValue,
+        MAX(MaxValue) as MaxValue,
+        SUM(SampleCount) as SampleCount
+    FROM (
+        SELECT BucketStart AS Timestamp, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE @Bucket = 3600 AND TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT BucketStart, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1m
+        WHERE @Bucket = 60 AND TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Timestamp, Value, Value, Value, 1
+        FROM dbo.TagData
+        WHERE TagName = @TagName
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0
+    ) AS parts
+    GROUP BY 
+        DATEADD(SECOND, 
+                DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
+                '2000-01-01')
+    ORDER BY IntervalStart;
+END;
+GO
\ No newline at end of file
@@ -0,0 +1,23 @@
+-- Migrate an existing HistorianData database to a unique (TagName, Timestamp) key.
+-- Required before running sql_import.py in merge mode against a database
+-- created with an older db_setup.sql.
+
+USE HistorianData;
+GO
+
+-- Remove duplicate samples, keeping the most recently inserted row
+WITH Ranked AS (
+    SELECT ID,
+           ROW_NUMBER() OVER (PARTITION BY TagName, Timestamp ORDER BY ID DESC) AS RowNum
+    FROM TagData
+)
+DELETE FROM Ranked
+WHERE RowNum > 1;
+GO
+
+-- Rebuild the lookup index as unique
+CREATE UNIQUE NONCLUSTERED INDEX IX_TagData_TagName_Timestamp 
+ON TagData(TagName, Timestamp)
+INCLUDE (Value, Status, Quality)
+WITH (DROP_EXISTING = ON);
+GO
@@ -36,7 +36,9 @@ CREATE TABLE TagData (
 GO
 
 -- Create indices for better performance
-CREATE NONCLUSTERED INDEX IX_TagData_TagName_Timestamp 
+-- Unique so that each (TagName, Timestamp) sample is stored once; the
+-- importer's merge mode upserts on this key
+CREATE UNIQUE NONCLUSTERED INDEX IX_TagData_TagName_Timestamp 
 ON TagData(TagName, Timestamp)
 INCLUDE (Value, Status, Quality);
 GO
@@ -50,6 +52,30 @@ CREATE STATISTICS ST_TagData_TagName_Timestamp
 ON TagData(TagName, Timestamp);
 GO
 
+-- Rollup tables, kept up to date by sql_import.py as it imports each tag.
+-- Sum and count (rather than the average) are stored so buckets combine exactly.
+CREATE TABLE TagRollup1m (
+    TagName NVARCHAR(255) NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the minute
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1m PRIMARY KEY CLUSTERED (TagName, BucketStart)
+);
+GO
+
+CREATE TABLE TagRollup1h (
+    TagName NVARCHAR(255) NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the hour
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1h PRIMARY KEY CLUSTERED (TagName, BucketStart)
+);
+GO
+
 -- Create user-defined functions for data analysis
 CREATE FUNCTION dbo.GetTagAverage
 (
@@ -61,12 +87,25 @@ RETURNS FLOAT
 AS
 BEGIN
     DECLARE @Result FLOAT;
+    -- Whole hours inside the range come from TagRollup1h, the edges from raw samples
+    DECLARE @RollStart DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @StartTime), '2000-01-01');
+    IF @RollStart < @StartTime SET @RollStart = DATEADD(HOUR, 1, @RollStart);
+    DECLARE @RollEnd DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @EndTime), '2000-01-01');
     
-    SELECT @Result = AVG(Value)
-    FROM TagData
-    WHERE TagName = @TagName
-    AND Timestamp BETWEEN @StartTime AND @EndTime
-    AND Status = 0;  -- Only consider normal values
+    SELECT @Result = SUM(SumValue) / NULLIF(SUM(SampleCount), 0)
+    FROM (
+        SELECT SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Value, 1
+        FROM dbo.TagData
+        WHERE TagName = @TagName
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0  -- Only consider normal values
+    ) AS parts;
     
     RETURN @Result;
 END;
@@ -82,21 +121,49 @@ AS
 BEGIN
     SET NOCOUNT ON;
     
+    -- Intervals made of whole hours (or minutes) read the rollup buckets that
+    -- lie fully inside the range; only the partial buckets at the edges, and
+    -- any other interval, read raw samples
+    DECLARE @Bucket INT = CASE WHEN @Interval % 3600 = 0 THEN 3600
+                               WHEN @Interval % 60 = 0 THEN 60
+                               ELSE 0 END;
+    DECLARE @RollStart DATETIME2 = @EndTime;
+    DECLARE @RollEnd DATETIME2 = @EndTime;
+    IF @Bucket > 0
+    BEGIN
+        SET @RollStart = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @StartTime) / @Bucket * @Bucket, '2000-01-01');
+        IF @RollStart < @StartTime SET @RollStart = DATEADD(SECOND, @Bucket, @RollStart);
+        SET @RollEnd = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @EndTime) / @Bucket * @Bucket, '2000-01-01');
+    END
+    
     SELECT 
-        TagName,
+        @TagName AS TagName,
         DATEADD(SECOND, 
                 DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
                 '2000-01-01') as IntervalStart,
-        AVG(Value) as AverageValue,
-        MIN(Value) as MinValue,
-        MAX(Value) as MaxValue,
-        COUNT(*) as SampleCount
-    FROM TagData
-    WHERE TagName = @TagName
-    AND Timestamp BETWEEN @StartTime AND @EndTime
-    AND Status = 0
+        SUM(SumValue) / SUM(SampleCount) as AverageValue,
+        MIN(MinValue) as MinValue,
+        MAX(MaxValue) as MaxValue,
+        SUM(SampleCount) as SampleCount
+    FROM (
+        SELECT BucketStart AS Timestamp, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE @Bucket = 3600 AND TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT BucketStart, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1m
+        WHERE @Bucket = 60 AND TagName = @TagName
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Timestamp, Value, Value, Value, 1
+        FROM dbo.TagData
+        WHERE TagName = @TagName
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0
+    ) AS parts
     GROUP BY 
-        TagName,
         DATEADD(SECOND, 
                 DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
                 '2000-01-01')
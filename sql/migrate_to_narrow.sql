@@ -0,0 +1,83 @@
+-- Copy an existing TagData table into the narrow Tags/TagFacts schema.
+--
+-- 1. Stop the scheduler so nothing writes to TagData.
+-- 2. Run sql/narrow_schema.sql with the storage options you want.
+-- 3. Run this script:  sqlcmd -S localhost -U SA -C -i sql/migrate_to_narrow.sql
+-- 4. Switch the importer to the narrow schema (`--schema narrow`, or
+--    SQLImporter.schema = "narrow") and run `sql_import.py --resync-watermarks` once.
+--
+-- Tags are copied one at a time, each in its own transaction, using the
+-- (TagName, Timestamp) index of TagData. An interrupted migration can simply be
+-- re-run: tags that already have rows in TagFacts are skipped. Duplicate
+-- samples keep the most recently inserted row. TagData is renamed to
+-- TagData_Legacy at the end; drop it once the new tables have been checked.
+
+USE HistorianData;
+GO
+SET NOCOUNT ON;
+GO
+
+INSERT INTO dbo.Tags (TagName)
+SELECT DISTINCT d.TagName
+FROM dbo.TagData d
+WHERE NOT EXISTS (SELECT 1 FROM dbo.Tags t WHERE t.TagName = d.TagName);
+GO
+
+DECLARE @TagId INT, @TagName NVARCHAR(255), @Rows BIGINT;
+DECLARE tag_cursor CURSOR LOCAL FAST_FORWARD FOR
+    SELECT t.TagId, t.TagName
+    FROM dbo.Tags t
+    WHERE NOT EXISTS (SELECT 1 FROM dbo.TagFacts f WHERE f.TagId = t.TagId)
+    ORDER BY t.TagId;
+
+OPEN tag_cursor;
+FETCH NEXT FROM tag_cursor INTO @TagId, @TagName;
+WHILE @@FETCH_STATUS = 0
+BEGIN
+    -- TABLOCK allows minimally logged (and, for columnstore, directly compressed) loads
+    INSERT INTO dbo.TagFacts WITH (TABLOCK) (TagId, Timestamp, Value, Status)
+    SELECT @TagId, Timestamp, Value, ISNULL(Status, 0)
+    FROM (
+        SELECT Timestamp, Value, Status,
+               ROW_NUMBER() OVER (PARTITION BY Timestamp ORDER BY ID DESC) AS RowNum
+        FROM dbo.TagData
+        WHERE TagName = @TagName
+    ) AS samples
+    WHERE RowNum = 1;
+    SET @Rows = @@ROWCOUNT;
+    RAISERROR('%s: %I64d rows', 0, 1, @TagName, @Rows) WITH NOWAIT;
+    FETCH NEXT FROM tag_cursor INTO @TagId, @TagName;
+END
+CLOSE tag_cursor;
+DEALLOCATE tag_cursor;
+GO
+
+-- Rebuild the rollups from the copied samples
+TRUNCATE TABLE dbo.TagRollup1m;
+TRUNCATE TABLE dbo.TagRollup1h;
+GO
+
+INSERT INTO dbo.TagRollup1m (TagId, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+SELECT TagId,
+       DATEADD(MINUTE, DATEDIFF(MINUTE, '2000-01-01', Timestamp), '2000-01-01'),
+       MIN(Value), MAX(Value), SUM(Value), COUNT(*)
+FROM dbo.TagFacts
+WHERE Status = 0
+GROUP BY TagId, DATEADD(MINUTE, DATEDIFF(MINUTE, '2000-01-01', Timestamp), '2000-01-01');
+GO
+
+INSERT INTO dbo.TagRollup1h (TagId, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+SELECT TagId,
+       DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', BucketStart), '2000-01-01'),
+       MIN(MinValue), MAX(MaxValue), SUM(SumValue), SUM(SampleCount)
+FROM dbo.TagRollup1m
+GROUP BY TagId, DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', BucketStart), '2000-01-01');
+GO
+
+-- Row counts of both tables, for a last check before the rename
+SELECT (SELECT COUNT_BIG(*) FROM dbo.TagData) AS TagDataRows,
+       (SELECT COUNT_BIG(*) FROM dbo.TagFacts) AS TagFactsRows;
+GO
+
+EXEC sp_rename 'dbo.TagData', 'TagData_Legacy';
+GO
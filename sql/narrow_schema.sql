@@ -0,0 +1,227 @@
+-- Narrow HistorianData schema: a Tags dimension and a TagFacts table keyed by
+-- (TagId, Timestamp), instead of repeating TagName on every 5-second sample.
+--
+-- Run with sqlcmd against an existing HistorianData database (new installs:
+-- run db_setup.sql first, or create the database by hand):
+--   sqlcmd -S localhost -U SA -C -i sql/narrow_schema.sql
+-- then load it with `sql_import.py --schema narrow`. To move the data of an
+-- existing TagData table across, run sql/migrate_to_narrow.sql afterwards.
+-- Requires SQL Server 2016 SP1 or later.
+
+-- FactStorage: rowstore    = clustered (TagId, Timestamp) key, PAGE compressed
+--              columnstore = clustered columnstore index plus a unique
+--                            nonclustered (TagId, Timestamp) key for merge mode
+:setvar FactStorage rowstore
+-- PartitionByDay: 1 partitions TagFacts by day on Timestamp from PartitionStart.
+-- The importer adds upcoming days at the start of every run.
+:setvar PartitionByDay 0
+:setvar PartitionStart 2024-01-01
+:setvar PartitionDaysAhead 30
+
+USE HistorianData;
+GO
+
+CREATE TABLE dbo.Tags (
+    TagId INT IDENTITY(1,1) NOT NULL CONSTRAINT PK_Tags PRIMARY KEY,
+    TagName NVARCHAR(255) NOT NULL CONSTRAINT UQ_Tags_TagName UNIQUE
+);
+GO
+
+-- Daily partitions (RANGE RIGHT: each boundary is the first instant of a day)
+IF '$(PartitionByDay)' = '1'
+    AND NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pfTagFactsDay')
+BEGIN
+    DECLARE @FirstDay DATETIME2(3) = '$(PartitionStart)';
+    CREATE PARTITION FUNCTION pfTagFactsDay (DATETIME2(3)) AS RANGE RIGHT FOR VALUES (@FirstDay);
+    CREATE PARTITION SCHEME psTagFactsDay AS PARTITION pfTagFactsDay ALL TO ([PRIMARY]);
+END
+GO
+
+-- Add day boundaries up to @DaysAhead days from today; a no-op when TagFacts
+-- is not partitioned. Splitting the empty trailing partition is metadata only.
+CREATE OR ALTER PROCEDURE dbo.EnsureTagFactsPartitions
+    @DaysAhead INT = $(PartitionDaysAhead)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pfTagFactsDay')
+        RETURN;
+
+    DECLARE @Target DATETIME2(3) = DATEADD(DAY, @DaysAhead, CAST(CAST(SYSDATETIME() AS DATE) AS DATETIME2(3)));
+    DECLARE @Last DATETIME2(3) = (
+        SELECT MAX(CAST(rv.value AS DATETIME2(3)))
+        FROM sys.partition_range_values rv
+        JOIN sys.partition_functions pf ON pf.function_id = rv.function_id
+        WHERE pf.name = 'pfTagFactsDay'
+    );
+    WHILE @Last < @Target
+    BEGIN
+        SET @Last = DATEADD(DAY, 1, @Last);
+        ALTER PARTITION SCHEME psTagFactsDay NEXT USED [PRIMARY];
+        ALTER PARTITION FUNCTION pfTagFactsDay() SPLIT RANGE (@Last);
+    END
+END;
+GO
+
+IF '$(PartitionByDay)' = '1'
+    EXEC dbo.EnsureTagFactsPartitions;
+GO
+
+-- Narrow fact table: 4 + 8 + 8 + 1 bytes of payload per sample
+DECLARE @Storage NVARCHAR(200) = CASE WHEN '$(PartitionByDay)' = '1'
+                                      THEN N'psTagFactsDay(Timestamp)' ELSE N'[PRIMARY]' END;
+IF '$(FactStorage)' = 'columnstore'
+BEGIN
+    EXEC (N'CREATE TABLE dbo.TagFacts (
+        TagId INT NOT NULL,
+        Timestamp DATETIME2(3) NOT NULL,
+        Value FLOAT NOT NULL,
+        Status TINYINT NOT NULL CONSTRAINT DF_TagFacts_Status DEFAULT 0,  -- 0: Normal, 1: Suspect, 2: Error
+        CONSTRAINT PK_TagFacts PRIMARY KEY NONCLUSTERED (TagId, Timestamp)
+    ) ON ' + @Storage + N';
+    CREATE CLUSTERED COLUMNSTORE INDEX CCI_TagFacts ON dbo.TagFacts ON ' + @Storage + N';');
+END
+ELSE
+BEGIN
+    EXEC (N'CREATE TABLE dbo.TagFacts (
+        TagId INT NOT NULL,
+        Timestamp DATETIME2(3) NOT NULL,
+        Value FLOAT NOT NULL,
+        Status TINYINT NOT NULL CONSTRAINT DF_TagFacts_Status DEFAULT 0,  -- 0: Normal, 1: Suspect, 2: Error
+        CONSTRAINT PK_TagFacts PRIMARY KEY CLUSTERED (TagId, Timestamp)
+            WITH (DATA_COMPRESSION = PAGE)
+    ) ON ' + @Storage + N';');
+END
+GO
+
+-- TagName-based view of the samples for ad-hoc queries
+CREATE OR ALTER VIEW dbo.TagSamples
+AS
+SELECT t.TagName, f.Timestamp, f.Value, f.Status
+FROM dbo.TagFacts f
+JOIN dbo.Tags t ON t.TagId = f.TagId;
+GO
+
+-- Rollup tables, kept up to date by sql_import.py as it imports each tag
+CREATE TABLE dbo.TagRollup1m (
+    TagId INT NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the minute
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1m PRIMARY KEY CLUSTERED (TagId, BucketStart)
+        WITH (DATA_COMPRESSION = PAGE)
+);
+GO
+
+CREATE TABLE dbo.TagRollup1h (
+    TagId INT NOT NULL,
+    BucketStart DATETIME2(0) NOT NULL,  -- start of the hour
+    MinValue FLOAT NOT NULL,
+    MaxValue FLOAT NOT NULL,
+    SumValue FLOAT NOT NULL,
+    SampleCount INT NOT NULL,
+    CONSTRAINT PK_TagRollup1h PRIMARY KEY CLUSTERED (TagId, BucketStart)
+        WITH (DATA_COMPRESSION = PAGE)
+);
+GO
+
+-- Same signatures as in db_setup.sql; the tag name is resolved to its TagId
+-- once, whole buckets come from the rollups and the edges seek on (TagId, Timestamp)
+CREATE OR ALTER FUNCTION dbo.GetTagAverage
+(
+    @TagName NVARCHAR(255),
+    @StartTime DATETIME2,
+    @EndTime DATETIME2
+)
+RETURNS FLOAT
+AS
+BEGIN
+    DECLARE @Result FLOAT;
+    DECLARE @TagId INT = (SELECT TagId FROM dbo.Tags WHERE TagName = @TagName);
+    
+    -- Whole hours inside the range come from TagRollup1h, the edges from raw samples
+    DECLARE @RollStart DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @StartTime), '2000-01-01');
+    IF @RollStart < @StartTime SET @RollStart = DATEADD(HOUR, 1, @RollStart);
+    DECLARE @RollEnd DATETIME2 = DATEADD(HOUR, DATEDIFF(HOUR, '2000-01-01', @EndTime), '2000-01-01');
+    
+    SELECT @Result = SUM(SumValue) / NULLIF(SUM(SampleCount), 0)
+    FROM (
+        SELECT SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE TagId = @TagId
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Value, 1
+        FROM dbo.TagFacts
+        WHERE TagId = @TagId
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0  -- Only consider normal values
+    ) AS parts;
+    
+    RETURN @Result;
+END;
+GO
+
+CREATE OR ALTER PROCEDURE dbo.GetTagDataInRange
+    @TagName NVARCHAR(255),
+    @StartTime DATETIME2,
+    @EndTime DATETIME2,
+    @Interval INT = 60  -- Default interval in seconds
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    DECLARE @TagId INT = (SELECT TagId FROM dbo.Tags WHERE TagName = @TagName);
+    
+    -- Intervals made of whole hours (or minutes) read the rollup buckets that
+    -- lie fully inside the range; only the partial buckets at the edges, and
+    -- any other interval, read raw samples
+    DECLARE @Bucket INT = CASE WHEN @Interval % 3600 = 0 THEN 3600
+                               WHEN @Interval % 60 = 0 THEN 60
+                               ELSE 0 END;
+    DECLARE @RollStart DATETIME2 = @EndTime;
+    DECLARE @RollEnd DATETIME2 = @EndTime;
+    IF @Bucket > 0
+    BEGIN
+        SET @RollStart = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @StartTime) / @Bucket * @Bucket, '2000-01-01');
+        IF @RollStart < @StartTime SET @RollStart = DATEADD(SECOND, @Bucket, @RollStart);
+        SET @RollEnd = DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', @EndTime) / @Bucket * @Bucket, '2000-01-01');
+    END
+    
+    SELECT 
+        @TagName AS TagName,
+        DATEADD(SECOND, 
+                DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
+                '2000-01-01') as IntervalStart,
+        SUM(SumValue) / SUM(SampleCount) as AverageValue,
+        MIN(MinValue) as MinValue,
+        MAX(MaxValue) as MaxValue,
+        SUM(SampleCount) as SampleCount
+    FROM (
+        SELECT BucketStart AS Timestamp, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1h
+        WHERE @Bucket = 3600 AND TagId = @TagId
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT BucketStart, MinValue, MaxValue, SumValue, SampleCount
+        FROM dbo.TagRollup1m
+        WHERE @Bucket = 60 AND TagId = @TagId
+        AND BucketStart >= @RollStart AND BucketStart < @RollEnd
+        UNION ALL
+        SELECT Timestamp, Value, Value, Value, 1
+        FROM dbo.TagFacts
+        WHERE TagId = @TagId
+        AND Timestamp BETWEEN @StartTime AND @EndTime
+        AND (Timestamp < @RollStart OR Timestamp >= @RollEnd)
+        AND Status = 0
+    ) AS parts
+    GROUP BY 
+        DATEADD(SECOND, 
+                DATEDIFF(SECOND, '2000-01-01', Timestamp) / @Interval * @Interval,
+                '2000-01-01')
+    ORDER BY IntervalStart;
+END;
+GO
@@ -0,0 +1,145 @@
+-- Partition TagData by day on Timestamp, so retention (retention.py) drops
+-- whole days as partition metadata operations instead of deleting rows.
+--
+-- Run once with sqlcmd against an existing HistorianData database:
+--   sqlcmd -S localhost -U SA -C -i sql/partition_tagdata.sql
+-- Moving the existing rows onto the partition scheme rebuilds TagData and its
+-- indexes once; run it in a maintenance window. The importer adds upcoming
+-- days at the start of every run. Requires SQL Server 2016 or later.
+--
+-- dbo.DropDayPartitions also serves TagFacts when narrow_schema.sql was run
+-- with PartitionByDay = 1.
+
+:setvar PartitionDaysAhead 30
+
+USE HistorianData;
+GO
+
+-- Daily partitions (RANGE RIGHT: each boundary is the first instant of a day),
+-- starting at the day of the oldest sample
+IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pfTagDataDay')
+BEGIN
+    DECLARE @FirstDay DATETIME2(3) = CAST(CAST(ISNULL((SELECT MIN(Timestamp) FROM dbo.TagData), SYSDATETIME()) AS DATE) AS DATETIME2(3));
+    CREATE PARTITION FUNCTION pfTagDataDay (DATETIME2(3)) AS RANGE RIGHT FOR VALUES (@FirstDay);
+    CREATE PARTITION SCHEME psTagDataDay AS PARTITION pfTagDataDay ALL TO ([PRIMARY]);
+END
+GO
+
+-- Add day boundaries up to @DaysAhead days from today; a no-op when TagData
+-- is not partitioned. Splitting the empty trailing partition is metadata only.
+CREATE OR ALTER PROCEDURE dbo.EnsureTagDataPartitions
+    @DaysAhead INT = $(PartitionDaysAhead)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF NOT EXISTS (SELECT 1 FROM sys.partition_functions WHERE name = 'pfTagDataDay')
+        RETURN;
+
+    DECLARE @Target DATETIME2(3) = DATEADD(DAY, @DaysAhead, CAST(CAST(SYSDATETIME() AS DATE) AS DATETIME2(3)));
+    DECLARE @Last DATETIME2(3) = (
+        SELECT MAX(CAST(rv.value AS DATETIME2(3)))
+        FROM sys.partition_range_values rv
+        JOIN sys.partition_functions pf ON pf.function_id = rv.function_id
+        WHERE pf.name = 'pfTagDataDay'
+    );
+    WHILE @Last < @Target
+    BEGIN
+        SET @Last = DATEADD(DAY, 1, @Last);
+        ALTER PARTITION SCHEME psTagDataDay NEXT USED [PRIMARY];
+        ALTER PARTITION FUNCTION pfTagDataDay() SPLIT RANGE (@Last);
+    END
+END;
+GO
+
+-- Boundaries for every day already in the table, while the function is unused
+EXEC dbo.EnsureTagDataPartitions;
+GO
+
+-- Move TagData onto the scheme. Every index must be aligned (keyed or
+-- partitioned on Timestamp) for partitions to be truncated, so the identity
+-- primary key becomes (ID, Timestamp); (TagName, Timestamp) stays unique.
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes i
+    JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+    WHERE i.object_id = OBJECT_ID('dbo.TagData') AND i.index_id = 1
+)
+BEGIN
+    DECLARE @PrimaryKey SYSNAME = (
+        SELECT name FROM sys.key_constraints
+        WHERE parent_object_id = OBJECT_ID('dbo.TagData') AND type = 'PK'
+    );
+    IF @PrimaryKey IS NOT NULL
+        EXEC (N'ALTER TABLE dbo.TagData DROP CONSTRAINT ' + @PrimaryKey);
+
+    ALTER TABLE dbo.TagData ADD CONSTRAINT PK_TagData PRIMARY KEY CLUSTERED (ID, Timestamp)
+        ON psTagDataDay(Timestamp);
+
+    CREATE UNIQUE NONCLUSTERED INDEX IX_TagData_TagName_Timestamp
+    ON dbo.TagData(TagName, Timestamp)
+    INCLUDE (Value, Status, Quality)
+    WITH (DROP_EXISTING = ON)
+    ON psTagDataDay(Timestamp);
+
+    CREATE NONCLUSTERED INDEX IX_TagData_ImportDate
+    ON dbo.TagData(ImportDate)
+    WITH (DROP_EXISTING = ON)
+    ON psTagDataDay(Timestamp);
+END
+GO
+
+-- Empty every day partition of @Table that ends on or before @Before, then
+-- merge the emptied boundaries so the partition count stays bounded. Cost is
+-- per partition, not per row. A no-op when @Table is not partitioned.
+CREATE OR ALTER PROCEDURE dbo.DropDayPartitions
+    @Table SYSNAME,
+    @Before DATETIME2(3)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @ObjectId INT = OBJECT_ID(@Table);
+    IF @ObjectId IS NULL
+    BEGIN
+        RAISERROR('Table %s does not exist', 16, 1, @Table);
+        RETURN;
+    END
+
+    DECLARE @FunctionId INT, @Function SYSNAME;
+    SELECT @FunctionId = pf.function_id, @Function = pf.name
+    FROM sys.indexes i
+    JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+    JOIN sys.partition_functions pf ON pf.function_id = ps.function_id
+    WHERE i.object_id = @ObjectId AND i.index_id IN (0, 1);
+    IF @FunctionId IS NULL
+        RETURN;
+
+    -- RANGE RIGHT: partition n holds [boundary n-1, boundary n), so partitions
+    -- 1 to the one ending at the last boundary <= @Before lie entirely before it
+    DECLARE @Last INT, @Keep DATETIME2(3);
+    SELECT TOP 1 @Last = boundary_id, @Keep = CAST(value AS DATETIME2(3))
+    FROM sys.partition_range_values
+    WHERE function_id = @FunctionId AND CAST(value AS DATETIME2(3)) <= @Before
+    ORDER BY boundary_id DESC;
+    IF @Last IS NULL
+        RETURN;
+
+    DECLARE @Name NVARCHAR(600) = QUOTENAME(OBJECT_SCHEMA_NAME(@ObjectId)) + N'.' + QUOTENAME(OBJECT_NAME(@ObjectId));
+    DECLARE @Sql NVARCHAR(MAX) = N'TRUNCATE TABLE ' + @Name
+        + N' WITH (PARTITIONS (1 TO ' + CAST(@Last AS NVARCHAR(10)) + N'))';
+    EXEC (@Sql);
+
+    -- Merging two empty partitions is metadata only; @Keep stays as the lower
+    -- edge of the retained data
+    DECLARE @Boundary DATETIME2(3);
+    SET @Sql = N'ALTER PARTITION FUNCTION ' + QUOTENAME(@Function) + N'() MERGE RANGE (@Boundary)';
+    WHILE 1 = 1
+    BEGIN
+        SET @Boundary = (
+            SELECT MIN(CAST(value AS DATETIME2(3))) FROM sys.partition_range_values
+            WHERE function_id = @FunctionId
+        );
+        IF @Boundary IS NULL OR @Boundary >= @Keep
+            BREAK;
+        EXEC sp_executesql @Sql, N'@Boundary DATETIME2(3)', @Boundary;
+    END
+END;
+GO
@@ -0,0 +1,330 @@
+"""Resumable parallel backfill of historian data for arbitrary date ranges.
+
+A backfill job is split into (day, tag) work units that go through three
+stages, each run where it normally runs:
+
+    # Windows server: pull the range from the Historian into per-day CSVs
+    python backfill.py export --start 2024-01-01 --end 2024-02-01 --workers 4
+
+    # Linux server: fetch those files over SFTP, then upsert them into SQL Server
+    python backfill.py transfer import --start 2024-01-01 --end 2024-02-01 --workers 4
+
+Files live in per-day directories (<root>/<YYYY-MM-DD>/<tag>.csv) outside the
+nightly export directories and are never trimmed by retention. Every
+completed unit is appended to a state journal, so an interrupted backfill
+resumes where it stopped when re-run with the same arguments.
+"""
+import argparse
+import datetime
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging.handlers import RotatingFileHandler
+
+import csv_store
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Windows side: where the export stage writes per-day files
+EXPORT_ROOT = os.path.join(SCRIPT_DIR, "historian_backfill")
+# Linux side: the same directory as seen over SFTP, and the local copy
+REMOTE_ROOT = r"C:\Users\Administrador\Desktop\PROCESS_SERVER_BACKUP_SCRIPT\historian_backfill"
+LOCAL_ROOT = "/home/mpp/historian_export/backfill"
+STATE_FILE = "backfill_state.log"
+DAY_FORMAT = "%Y-%m-%d"
+STAGES = ("export", "transfer", "import")
+
+
+def setup_logging():
+    os.makedirs('logs', exist_ok=True)
+    logger = logging.getLogger('Backfill')
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler('logs/backfill.log', maxBytes=10*1024*1024, backupCount=5)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger
+
+
+class BackfillState:
+    """Append-only journal of completed (stage, unit) pairs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._done = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 2:
+                        self._done.add((parts[0], parts[1]))
+
+    def is_done(self, stage, unit):
+        return (stage, unit) in self._done
+
+    def mark_done(self, stage, unit):
+        with self._lock:
+            if (stage, unit) in self._done:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{stage}\t{unit}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._done.add((stage, unit))
+
+
+def days_in_range(start, end):
+    """Days from start (inclusive) to end (exclusive)."""
+    day = start
+    while day < end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def unit_key(day, tag):
+    return f"{day.strftime(DAY_FORMAT)}/{tag}"
+
+
+class Backfill:
+    def __init__(self, start, end, tags=None, workers=4, state_file=STATE_FILE):
+        self.logger = setup_logging()
+        self.start = start
+        self.end = end
+        self.tags = tags
+        self.workers = workers
+        self.state = BackfillState(state_file)
+
+    def run_units(self, stage, units, work):
+        """Run work(*unit) on a pool for units not yet journaled; returns (done, failed).
+
+        work returns the list of unit keys it completed.
+        """
+        pending = [unit for unit in units if not all(self.state.is_done(stage, key) for key in unit[0])]
+        skipped = len(units) - len(pending)
+        if skipped:
+            self.logger.info(f"{stage}: {skipped} work items already completed, resuming")
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"backfill-{stage}") as executor:
+            futures = {executor.submit(work, *unit): unit for unit in pending}
+            for i, future in enumerate(as_completed(futures), 1):
+                keys = futures[future][0]
+                try:
+                    completed = future.result()
+                except Exception as e:
+                    completed = []
+                    self.logger.error(f"{stage}: error in {keys[0]}..: {e}")
+                for key in completed:
+                    self.state.mark_done(stage, key)
+                done += len(completed)
+                failed += len(keys) - len(completed)
+                if i % 50 == 0 or i == len(pending):
+                    self.logger.info(f"{stage}: {i}/{len(pending)} work items processed")
+        self.logger.info(f"{stage} completed: {done} units done, {failed} failed")
+        return done, failed
+
+    def export(self):
+        """Windows stage: fetch each (day, tag) from the Historian into a per-day CSV."""
+        import windows_historian_export as exporter
+
+        if self.tags is None:
+            conn = exporter.connect_historian()
+            try:
+                self.tags = exporter.get_tags(conn.cursor())
+            finally:
+                conn.close()
+
+        local = threading.local()
+        connections = []
+        connections_lock = threading.Lock()
+
+        def work(keys, day, tag):
+            cursor = getattr(local, 'cursor', None)
+            if cursor is None:
+                if exporter.pythoncom is not None:
+                    exporter.pythoncom.CoInitialize()
+                conn = exporter.connect_historian()
+                with connections_lock:
+                    connections.append(conn)
+                cursor = local.cursor = conn.cursor()
+            day_dir = os.path.join(EXPORT_ROOT, day.strftime(DAY_FORMAT))
+            os.makedirs(day_dir, exist_ok=True)
+            writer = csv_store.CSVStreamWriter(os.path.join(day_dir, f"{tag}.csv"), retention_days=None,
+                                               mirror_compression=exporter.WIRE_COMPRESSION)
+            compressor = exporter.tag_compressor(tag)
+            try:
+                # strict: a failed window fails the unit, so it stays pending in the journal
+                for frame in exporter.stream_tag_data(cursor, tag, day, day + datetime.timedelta(days=1),
+                                                      strict=True):
+                    writer.write(frame if compressor is None else exporter.compress_frame(compressor, frame))
+                if compressor is not None:
+                    writer.write(exporter.flush_frame(compressor))
+            except Exception:
+                writer.discard()
+                raise
+            writer.close()
+            return keys
+
+        units = [([unit_key(day, tag)], day, tag)
+                 for day in days_in_range(self.start, self.end) for tag in self.tags]
+        try:
+            return self.run_units("export", units, work)
+        finally:
+            for conn in connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def transfer(self):
+        """Linux stage: download each day's files and merge them with merge_csv_files."""
+        import paramiko
+        import sftp_script
+
+        transfer = sftp_script.HistorianTransfer()
+        transfer.remote_path = REMOTE_ROOT
+        transfer.local_path = LOCAL_ROOT
+        # Not the shared temp directory: the nightly transfer empties it when it finishes
+        transfer.temp_path = os.path.join(LOCAL_ROOT, ".temp")
+        os.makedirs(transfer.temp_path, exist_ok=True)
+        transfer.retention_days = None
+        transfer.storage_format = "csv"
+
+        ssh = transfer.connect()
+        local = threading.local()
+        channels = []
+        channels_lock = threading.Lock()
+
+        def channel():
+            sftp = getattr(local, 'sftp', None)
+            if sftp is None:
+                sftp = paramiko.SFTPClient.from_transport(ssh.get_transport())
+                local.sftp = sftp
+                with channels_lock:
+                    channels.append(sftp)
+            return sftp
+
+        def work(keys, day):
+            day_name = day.strftime(DAY_FORMAT)
+            os.makedirs(os.path.join(LOCAL_ROOT, day_name), exist_ok=True)
+            sftp = channel()
+            try:
+                entries = transfer.list_remote_files(sftp, subdir=day_name)
+            except FileNotFoundError:
+                self.logger.warning(f"transfer: no remote directory for {day_name}, skipping")
+                return []
+            failed = 0
+            for name, _, _ in entries:
+                tag = os.path.basename(transfer.local_target(name))[:-len(".csv")]
+                key = unit_key(day, tag)
+                if (self.tags and tag not in self.tags) or self.state.is_done("transfer", key):
+                    continue
+                if transfer.transfer_file(sftp, name):
+                    # Checkpoint per file so a failed day resumes mid-way
+                    self.state.mark_done("transfer", key)
+                else:
+                    failed += 1
+            # The day marker is only written once every remote file has been merged
+            return keys if not failed else []
+
+        units = [([f"{day.strftime(DAY_FORMAT)}/*"], day) for day in days_in_range(self.start, self.end)]
+        try:
+            return self.run_units("transfer", units, work)
+        finally:
+            for sftp in channels:
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+            ssh.close()
+
+    def import_(self):
+        """Linux stage: upsert each local (day, tag) file with SQLImporter in merge mode."""
+        from run_lock import RunLock
+        from sql_import import IMPORT_LOCK, SQLImporter
+
+        # Never alongside the nightly or arrival import, or retention truncating partitions
+        lock = RunLock(IMPORT_LOCK)
+        if not lock.acquire():
+            self.logger.warning("import: another import is in progress. Skipping; re-run the same command later.")
+            return 0, 0
+        try:
+            importer = SQLImporter()
+            importer.ingest_mode = 'merge'
+            importer.dedupe_tags = False
+            importer.start_run()
+
+            # One work item per tag so a tag's days are imported in order by one worker
+            files_by_tag = {}
+            for day in days_in_range(self.start, self.end):
+                day_dir = os.path.join(LOCAL_ROOT, day.strftime(DAY_FORMAT))
+                if not os.path.isdir(day_dir):
+                    continue
+                for name in sorted(os.listdir(day_dir)):
+                    if not name.endswith(".csv"):
+                        continue
+                    tag = name[:-len(".csv")]
+                    if self.tags and tag not in self.tags:
+                        continue
+                    files_by_tag.setdefault(tag, []).append((unit_key(day, tag), os.path.join(day_dir, name)))
+
+            def work(keys, files):
+                completed = []
+                for key, path in files:
+                    if self.state.is_done("import", key):
+                        continue
+                    if importer.import_source(path):
+                        completed.append(key)
+                return completed
+
+            units = [([key for key, _ in files], files) for files in files_by_tag.values()]
+            try:
+                return self.run_units("import", units, work)
+            finally:
+                importer.finish_run()
+        finally:
+            lock.release()
+
+    def run(self, stages):
+        failed = 0
+        for stage in stages:
+            self.logger.info(f"Starting backfill {stage} for {self.start:%Y-%m-%d}..{self.end:%Y-%m-%d}")
+            _, stage_failed = getattr(self, "import_" if stage == "import" else stage)()
+            failed += stage_failed
+        return failed
+
+
+def parse_day(value):
+    return datetime.datetime.strptime(value, DAY_FORMAT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historian data for a date range")
+    parser.add_argument('stages', nargs='+', choices=STAGES, help="stages to run, in order")
+    parser.add_argument('--start', type=parse_day, required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_day, required=True, help="day after the last day (YYYY-MM-DD)")
+    parser.add_argument('--tags', nargs='*', help="tag names (default: all tags)")
+    parser.add_argument('--tags-file', help="file with one tag name per line")
+    parser.add_argument('--workers', type=int, default=4, help="parallel work units (default: 4)")
+    parser.add_argument('--state', default=STATE_FILE, help=f"checkpoint journal (default: {STATE_FILE})")
+    args = parser.parse_args()
+
+    tags = args.tags or None
+    if args.tags_file:
+        with open(args.tags_file, "r", encoding="utf-8") as f:
+            tags = [line.strip() for line in f if line.strip()]
+
+    backfill = Backfill(args.start, args.end, tags=tags, workers=max(1, args.workers), state_file=args.state)
+    failed = backfill.run(args.stages)
+    if failed:
+        backfill.logger.warning(f"{failed} units failed; re-run the same command to retry them")
+
+
+if __name__ == "__main__":
+    main()
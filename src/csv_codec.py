@@ -0,0 +1,120 @@
+"""Typed parsing of the per-tag ``timestamp,value`` CSVs shared by all stages.
+
+Every reader goes through read_csv/iter_csv, so files are parsed the same
+way everywhere: timestamps as datetime64[ns] in TIMESTAMP_FORMAT (ISO 8601
+as a fallback), values as float64 parsed exactly, so a value reads back
+bit-for-bit as it was written. With pyarrow installed, files are memory
+mapped and parsed by its multi-threaded CSV reader. Otherwise pandas' C
+engine is used with explicit dtypes and a fixed timestamp format instead
+of per-file inference.
+"""
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:  # pyarrow is optional; the pandas C engine is always available
+    pyarrow = None
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+COLUMNS = ['timestamp', 'value']
+# Rows per chunk for iter_csv
+CHUNK_ROWS = 100000
+# Rough bytes per CSV row, to size pyarrow's read blocks from CHUNK_ROWS
+ROW_BYTES = 40
+
+
+def engine():
+    """Name of the parser in use: 'pyarrow' or 'c'."""
+    return 'pyarrow' if pyarrow is not None else 'c'
+
+
+def parse_timestamps(values):
+    """Parse timestamp strings with the fixed format, falling back to ISO 8601."""
+    try:
+        return pd.to_datetime(values, format=TIMESTAMP_FORMAT)
+    except (ValueError, TypeError):
+        return pd.to_datetime(values, format='ISO8601')
+
+
+def to_frame(df):
+    """Coerce a frame to the codec's column types; columns that are already typed are left as they are.
+
+    Missing values become NaN, but a value that is not a number raises
+    ValueError instead of being stored as NaN.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = parse_timestamps(df['timestamp'])
+    elif df['timestamp'].dtype != 'datetime64[ns]':
+        df['timestamp'] = df['timestamp'].astype('datetime64[ns]')
+    if df['value'].dtype != 'float64':
+        df['value'] = pd.to_numeric(df['value'], errors='raise').astype('float64')
+    return df
+
+
+def _arrow_options():
+    return pyarrow_csv.ConvertOptions(
+        column_types={'timestamp': pyarrow.timestamp('us'), 'value': pyarrow.float64()},
+        include_columns=COLUMNS,
+    )
+
+
+def _arrow_frame(table):
+    df = table.to_pandas()
+    df['timestamp'] = df['timestamp'].astype('datetime64[ns]')
+    return df
+
+
+def _pandas_reader(source, **kwargs):
+    return pd.read_csv(source, usecols=COLUMNS, dtype={'timestamp': str, 'value': 'float64'},
+                       float_precision='round_trip', memory_map=isinstance(source, str), **kwargs)
+
+
+def read_csv(source):
+    """Read a whole ``timestamp,value`` CSV from a path or binary file object."""
+    if pyarrow is None:
+        return to_frame(_pandas_reader(source))
+    if isinstance(source, str):
+        with pyarrow.memory_map(source, 'r') as mapped:
+            return _arrow_frame(pyarrow_csv.read_csv(mapped, convert_options=_arrow_options()))
+    # File objects, e.g. a decompressing SFTP stream, are read as they are
+    return _arrow_frame(pyarrow_csv.read_csv(source, convert_options=_arrow_options()))
+
+
+def _arrow_batches(source, chunk_rows):
+    read_options = pyarrow_csv.ReadOptions(block_size=max(chunk_rows * ROW_BYTES, 1 << 16))
+    reader = pyarrow_csv.open_csv(source, read_options=read_options, convert_options=_arrow_options())
+    for batch in reader:
+        yield _arrow_frame(pyarrow.Table.from_batches([batch]))
+
+
+def iter_csv(source, chunk_rows=CHUNK_ROWS):
+    """Yield a CSV as typed DataFrame chunks of roughly chunk_rows rows."""
+    if pyarrow is None:
+        for df in _pandas_reader(source, chunksize=chunk_rows):
+            yield to_frame(df)
+    elif isinstance(source, str):
+        with pyarrow.memory_map(source, 'r') as mapped:
+            yield from _arrow_batches(mapped, chunk_rows)
+    else:
+        yield from _arrow_batches(source, chunk_rows)
+
+
+def read_csv_since(source, since, chunk_rows=CHUNK_ROWS):
+    """Rows with timestamp > since, parsed in chunks so older rows are never held together."""
+    try:
+        since = pd.Timestamp(since)
+    except (OverflowError, ValueError):  # e.g. datetime.min for a tag without a watermark
+        return read_csv(source)
+    parts = []
+    for chunk in iter_csv(source, chunk_rows):
+        chunk = chunk[chunk['timestamp'] > since]
+        if len(chunk):
+            parts.append(chunk)
+    if not parts:
+        return empty_frame()
+    return pd.concat(parts, ignore_index=True)
+
+
+def empty_frame():
+    return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'), 'value': pd.Series(dtype='float64')})
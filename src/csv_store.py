@@ -0,0 +1,406 @@
+"""Incremental maintenance of the per-tag ``timestamp,value`` CSV files.
+
+New data is almost always a strictly later time range than what a file
+already holds, so it is appended after reading only the file's last line.
+The full read/dedupe/sort/rewrite is reserved for overlapping ranges, and the
+retention cutoff is applied by an occasional compaction instead of on every
+write. Compaction drops whole days from the head of a file: rows are in time
+order, so the first kept row is found by bisecting the file on byte offsets
+and the rest is copied across without being parsed.
+
+Every write can also be mirrored to a compressed copy (``<tag>.csv.gz`` or
+``<tag>.csv.zst``) for transfer over the WAN. Appends add a new gzip member /
+zstd frame, so the compressed copy stays a valid stream of the same CSV.
+Every rewrite (an overlapping merge, compaction) also replaces a small
+``<tag>.csv.gen`` marker with a new token, so a reader that resumes from a
+byte offset can tell that the bytes before it have changed.
+
+CSVStreamWriter applies the same rules chunk by chunk, so an exporter can
+write rows as they come off the cursor instead of collecting a whole day.
+"""
+import gzip
+import io
+import mmap
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+import pandas as pd
+
+import csv_codec
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; gzip is always available
+    zstandard = None
+
+RETENTION_DAYS = 10
+# Let files grow this far past the retention window before compacting them
+COMPACTION_SLACK_DAYS = 1
+TAIL_BLOCK_SIZE = 4096
+COPY_BLOCK_SIZE = 1 << 20
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+GENERATION_SUFFIX = '.gen'
+
+
+def _parse_timestamp(line):
+    field = line.split(b',', 1)[0].strip().decode('utf-8')
+    if not field or field == 'timestamp':
+        return None
+    return pd.Timestamp(field)
+
+
+def read_last_timestamp(path):
+    """Return the timestamp on the last data line, reading only the file tail."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        tail = b''
+        while position > 0:
+            step = min(TAIL_BLOCK_SIZE, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            lines = tail.rstrip(b'\r\n').split(b'\n')
+            # The first line may be incomplete unless we reached the file start
+            if len(lines) > 1 or position == 0:
+                return _parse_timestamp(lines[-1])
+    return None
+
+
+@contextmanager
+def open_complete_rows(path):
+    """Open a CSV for reading up to the end of its last complete row.
+
+    A transfer may be appending to the file while it is read; a partial last
+    row is left out, to be read once it is complete. The file is opened once,
+    so a concurrent rewrite (an atomic replace) is seen either whole or not
+    at all. Yields a read-only memory map.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        end = 0
+        if size:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as whole:
+                end = whole.rfind(b'\n') + 1
+        if not end:
+            yield io.BytesIO(b'')
+            return
+        with mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def read_first_timestamp(path):
+    """Return the timestamp on the first data line."""
+    with open(path, 'rb') as f:
+        f.readline()  # header
+        return _parse_timestamp(f.readline())
+
+
+def retention_cutoff(retention_days):
+    """Start of the oldest day inside the retention window; retention keeps or drops whole days."""
+    return datetime.combine(date.today() - timedelta(days=retention_days), time.min)
+
+
+def find_offset(f, cutoff):
+    """Byte offset of the first data line with a timestamp at or after cutoff.
+
+    The lines of f must be in time order; only O(log size) lines are read.
+    Returns the file size when every row is older than cutoff.
+    """
+    f.seek(0)
+    header_end = len(f.readline())
+    size = f.seek(0, os.SEEK_END)
+    cutoff = pd.Timestamp(cutoff)
+
+    def line_start(position):
+        # First line starting at or after position
+        if position <= header_end:
+            return header_end
+        f.seek(position - 1)
+        f.readline()
+        return f.tell()
+
+    low, high = header_end, size
+    while low < high:
+        middle = (low + high) // 2
+        start = line_start(middle)
+        if start >= size:
+            high = middle
+            continue
+        f.seek(start)
+        timestamp = _parse_timestamp(f.readline())
+        if timestamp is None or timestamp >= cutoff:
+            high = middle
+        else:
+            low = middle + 1
+    return line_start(low)
+
+
+def _normalize(df):
+    df = csv_codec.to_frame(df[['timestamp', 'value']].copy())
+    return df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+
+
+def compressed_path(path, compression):
+    """Path of the compressed mirror of a CSV."""
+    return f"{path}{COMPRESSION_SUFFIXES[compression]}"
+
+
+def generation_path(path):
+    """Path of the rewrite-generation marker of a CSV."""
+    return f"{path}{GENERATION_SUFFIX}"
+
+
+def _bump_generation(path):
+    # Only once the new bytes and the mirror are in place: a reader takes the
+    # marker before the data, so it never pairs a new token with old bytes
+    tmp_path = f"{generation_path(path)}.tmp"
+    with open(tmp_path, 'w', encoding='ascii') as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp_path, generation_path(path))
+
+
+def compression_for(name):
+    """Compression of a file from its suffix, or None for plain CSV."""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if name.endswith(suffix):
+            return compression
+    return None
+
+
+def open_compressed(path, compression, append=False):
+    """Binary writer producing a gzip member / zstd frame in path."""
+    mode = 'ab' if append else 'wb'
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, mode), closefd=True)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def _open_compressed_writer(path, compression, append):
+    return io.TextIOWrapper(open_compressed(path, compression, append), encoding='utf-8', newline='')
+
+
+def open_decompressed(fileobj, compression):
+    """Wrap a binary file object (local or remote) in a streaming decompressor."""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def _write_mirror(path, df, compression, append):
+    if compression is None:
+        return
+    target = compressed_path(path, compression)
+    if append:
+        with _open_compressed_writer(target, compression, append=True) as f:
+            df.to_csv(f, header=False, index=False)
+    else:
+        tmp_path = f"{target}.tmp"
+        with _open_compressed_writer(tmp_path, compression, append=False) as f:
+            df.to_csv(f, index=False)
+        os.replace(tmp_path, target)
+
+
+def rewrite(path, df, mirror_compression=None):
+    """Replace a file atomically so readers never see a partial write."""
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    _write_mirror(path, df, mirror_compression, append=False)
+    _bump_generation(path)
+
+
+def append(path, df, mirror_compression=None):
+    """Append rows (without header) to a file and its compressed mirror."""
+    df.to_csv(path, mode='a', header=False, index=False)
+    _write_mirror(path, df, mirror_compression, append=True)
+
+
+def compact(path, retention_days=RETENTION_DAYS, mirror_compression=None):
+    """Drop the whole days before the retention window from the head of a file.
+
+    The rows kept are copied byte for byte after the header, so the cost is
+    a bisect plus a sequential copy, with no parsing. Returns the number of
+    bytes dropped.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(path, 'rb') as source:
+        offset = find_offset(source, retention_cutoff(retention_days))
+        source.seek(0)
+        header = source.readline()
+        with open(tmp_path, 'wb') as target:
+            target.write(header)
+            source.seek(offset)
+            shutil.copyfileobj(source, target, COPY_BLOCK_SIZE)
+    os.replace(tmp_path, path)
+    if mirror_compression is not None:
+        # Compressed streams cannot be cut; recompress the kept bytes
+        mirror = compressed_path(path, mirror_compression)
+        with open(path, 'rb') as source, open_compressed(f"{mirror}.tmp", mirror_compression) as target:
+            shutil.copyfileobj(source, target, COPY_BLOCK_SIZE)
+        os.replace(f"{mirror}.tmp", mirror)
+    _bump_generation(path)
+    return offset - len(header)
+
+
+def compact_if_due(path, retention_days=RETENTION_DAYS, slack_days=COMPACTION_SLACK_DAYS,
+                   mirror_compression=None):
+    """Compact a file only once its oldest row is more than slack_days past retention."""
+    if retention_days is None:
+        return False
+    first = read_first_timestamp(path)
+    if first is not None and first < retention_cutoff(retention_days + slack_days):
+        compact(path, retention_days, mirror_compression)
+        return True
+    return False
+
+
+def merge_into_csv(path, new_data, retention_days=RETENTION_DAYS, mirror_compression=None):
+    """Merge new rows into a per-tag CSV, keeping an optional compressed mirror in step.
+
+    retention_days=None keeps all history (used for backfill files). Returns
+    'created', 'appended' or 'rewritten' depending on the path taken.
+    """
+    new_data = _normalize(new_data)
+
+    if not os.path.exists(path):
+        rewrite(path, new_data, mirror_compression)
+        return 'created'
+
+    last_timestamp = read_last_timestamp(path)
+    mirror_missing = mirror_compression and not os.path.exists(compressed_path(path, mirror_compression))
+    if (last_timestamp is not None and not mirror_missing
+            and (new_data.empty or new_data['timestamp'].iloc[0] > last_timestamp)):
+        if not new_data.empty:
+            append(path, new_data, mirror_compression)
+        compact_if_due(path, retention_days, mirror_compression=mirror_compression)
+        return 'appended'
+
+    # Overlapping ranges: fall back to a full merge and rewrite
+    existing_data = csv_codec.read_csv(path)
+    if existing_data.empty:
+        merged_data = new_data
+    else:
+        merged_data = _normalize(pd.concat([existing_data, new_data]))
+    if retention_days is not None:
+        merged_data = merged_data[merged_data['timestamp'] >= retention_cutoff(retention_days)]
+    rewrite(path, merged_data, mirror_compression)
+    return 'rewritten'
+
+
+class CSVStreamWriter:
+    """Stream chunks of new rows into a per-tag CSV without holding the whole range.
+
+    The first chunk decides how the file is written:
+
+    - no file yet: chunks go to ``<path>.tmp`` (and its mirror), renamed on close;
+    - strictly later than the file: chunks are appended as they arrive, the
+      mirror gets one gzip member / zstd frame for the whole session;
+    - overlapping: chunks are spooled to ``<path>.spool`` and merged on close
+      with merge_into_csv, as a rewrite needs the whole file anyway.
+
+    Chunks must arrive in time order; rows at or before the last written
+    timestamp are dropped. close() returns 'created', 'appended', 'rewritten',
+    'replaced' (the existing file could not be read and was replaced by the new
+    rows) or None when nothing was written.
+    """
+
+    def __init__(self, path, retention_days=RETENTION_DAYS, mirror_compression=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.mirror_compression = mirror_compression
+        self.mode = None
+        self.rows = 0
+        self._target = None
+        self._file = None
+        self._mirror = None
+        self._last_written = None
+
+    def _open(self, first_timestamp):
+        if not os.path.exists(self.path):
+            self.mode = 'created'
+            self._target = f"{self.path}.tmp"
+        else:
+            last_timestamp = read_last_timestamp(self.path)
+            mirror_missing = (self.mirror_compression
+                              and not os.path.exists(compressed_path(self.path, self.mirror_compression)))
+            if last_timestamp is not None and not mirror_missing and first_timestamp > last_timestamp:
+                self.mode = 'appended'
+                self._target = self.path
+                self._last_written = last_timestamp
+            else:
+                self.mode = 'rewritten'
+                self._target = f"{self.path}.spool"
+        append = self.mode == 'appended'
+        self._file = open(self._target, 'a' if append else 'w', encoding='utf-8', newline='')
+        if self.mirror_compression and self.mode != 'rewritten':
+            mirror_target = compressed_path(self.path if append else self._target, self.mirror_compression)
+            self._mirror = _open_compressed_writer(mirror_target, self.mirror_compression, append)
+
+    def write(self, df):
+        """Write one chunk of (timestamp, value) rows."""
+        df = _normalize(df)
+        if self._last_written is not None:
+            df = df[df['timestamp'] > self._last_written]
+        if df.empty:
+            return 0
+        if self.mode is None:
+            self._open(df['timestamp'].iloc[0])
+        header = self.mode != 'appended' and self.rows == 0
+        df.to_csv(self._file, header=header, index=False)
+        if self._mirror is not None:
+            df.to_csv(self._mirror, header=header, index=False)
+        self._last_written = df['timestamp'].iloc[-1]
+        self.rows += len(df)
+        return len(df)
+
+    def _close_handles(self):
+        for handle in (self._file, self._mirror):
+            if handle is not None:
+                handle.close()
+        self._file = self._mirror = None
+
+    def close(self):
+        """Finish the file; see the class docstring for the return value."""
+        self._close_handles()
+        if self.mode == 'created':
+            if self.mirror_compression:
+                os.replace(compressed_path(self._target, self.mirror_compression),
+                           compressed_path(self.path, self.mirror_compression))
+            os.replace(self._target, self.path)
+            _bump_generation(self.path)
+        elif self.mode == 'appended':
+            compact_if_due(self.path, self.retention_days, mirror_compression=self.mirror_compression)
+        elif self.mode == 'rewritten':
+            spooled = csv_codec.read_csv(self._target)
+            try:
+                merge_into_csv(self.path, spooled, self.retention_days, self.mirror_compression)
+            except Exception:
+                rewrite(self.path, _normalize(spooled), self.mirror_compression)
+                self.mode = 'replaced'
+            finally:
+                os.remove(self._target)
+        return self.mode
+
+    def discard(self):
+        """Abandon the session; rows already appended to an existing file stay."""
+        self._close_handles()
+        if self.mode in ('created', 'rewritten'):
+            paths = [self._target]
+            if self.mirror_compression:
+                paths.append(compressed_path(self._target, self.mirror_compression))
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
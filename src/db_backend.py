@@ -0,0 +1,369 @@
+import sqlite3
+from datetime import datetime
+
+
+class DBBackend:
+    """Base class for the database the importer writes to.
+
+    A backend knows how to open a connection, how to prepare a cursor for
+    bulk inserts and which SQL statements to use against its dialect.
+    """
+    insert_sql = "INSERT INTO TagData (TagName, Timestamp, Value) VALUES (?, ?, ?)"
+    latest_timestamp_sql = "SELECT MAX(Timestamp) FROM TagData WHERE TagName = ?"
+    all_latest_timestamps_sql = "SELECT TagName, MAX(Timestamp) FROM TagData GROUP BY TagName"
+
+    # Narrow schema: samples are keyed by an integer TagId from the Tags table,
+    # which the importer resolves (and creates) once per tag and caches
+    uses_tag_ids = False
+    tag_ids_sql = "SELECT TagName, TagId FROM Tags"
+    tag_id_sql = "SELECT TagId FROM Tags WHERE TagName = ?"
+    ensure_tag_sql = None
+    # Run once at the start of an import run, e.g. partition maintenance
+    start_run_sql = None
+
+    # Rollup tables kept in step with the raw samples: bucket seconds -> table.
+    # The rollup statements are templates formatted with the raw fact table,
+    # its tag key column and type, the rollup table and the bucket width.
+    rollup_tables = {60: 'TagRollup1m', 3600: 'TagRollup1h'}
+    fact_table = 'TagData'
+    key_column = 'TagName'
+    key_type = None
+    create_rollup_staging_sql = None
+    load_rollup_staging_sql = (
+        "INSERT INTO TagRollupStaging ({key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    apply_rollup_sql = None
+    clear_rollup_staging_sql = "DELETE FROM TagRollupStaging"
+    delete_rollups_sql = "DELETE FROM {table} WHERE {key} = ? AND BucketStart >= ? AND BucketStart < ?"
+    rebuild_rollups_sql = None
+
+    # Replaces a changed block in the diff ingestion mode
+    delete_range_sql = "DELETE FROM {facts} WHERE {key} = ? AND Timestamp >= ? AND Timestamp < ?"
+    # Rows hashed when a block has no recorded checksum yet (any Status)
+    checksum_rows_sql = (
+        "SELECT Timestamp, Value FROM {facts} "
+        "WHERE {key} = ? AND Timestamp >= ? AND Timestamp < ? ORDER BY Timestamp"
+    )
+
+    # Range reads used by tag_reader.TagReader; formatted like the rollup SQL
+    read_samples_sql = (
+        "SELECT Timestamp, Value FROM {facts} "
+        "WHERE {key} = ? AND Timestamp >= ? AND Timestamp < ? AND Status = 0 ORDER BY Timestamp"
+    )
+    read_rollups_sql = (
+        "SELECT BucketStart, MinValue, MaxValue, SumValue, SampleCount FROM {table} "
+        "WHERE {key} = ? AND BucketStart >= ? AND BucketStart < ? ORDER BY BucketStart"
+    )
+
+    # Retention (retention.py): the fact table's day partitions ending on or before
+    # a cutoff as (first instant or NULL, end, rows), the statement dropping them
+    # and the rows archived from one partition
+    day_partitions_sql = None
+    drop_days_sql = None
+    archive_rows_sql = (
+        "SELECT TagName, Timestamp, Value, Status FROM TagData "
+        "WHERE Timestamp >= ? AND Timestamp < ? ORDER BY TagName, Timestamp"
+    )
+
+    # Staging table used by the merge ingestion mode; session scoped
+    create_staging_sql = None
+    load_staging_sql = None
+    apply_staging_sql = None
+    clear_staging_sql = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def prepare_cursor(self, cursor):
+        """Hook to tune a cursor before executemany."""
+        return cursor
+
+    def to_datetime(self, value):
+        """Normalize a timestamp returned by the driver to a datetime."""
+        if isinstance(value, str):
+            return datetime.fromisoformat(value)
+        return value
+
+
+class SQLServerBackend(DBBackend):
+    """SQL Server through pyodbc (production)."""
+
+    start_run_sql = (
+        "IF OBJECT_ID('dbo.EnsureTagDataPartitions') IS NOT NULL "
+        "EXEC dbo.EnsureTagDataPartitions"
+    )
+
+    def __init__(self, conn_str):
+        self.conn_str = conn_str
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.conn_str)
+
+    create_staging_sql = (
+        "IF OBJECT_ID('tempdb..#TagDataStaging') IS NULL "
+        "CREATE TABLE #TagDataStaging ("
+        "TagName NVARCHAR(255) NOT NULL, "
+        "Timestamp DATETIME2(3) NOT NULL, "
+        "Value FLOAT NOT NULL)"
+    )
+    load_staging_sql = "INSERT INTO #TagDataStaging (TagName, Timestamp, Value) VALUES (?, ?, ?)"
+    apply_staging_sql = """
+        MERGE TagData WITH (HOLDLOCK) AS target
+        USING #TagDataStaging AS source
+        ON target.TagName = source.TagName AND target.Timestamp = source.Timestamp
+        WHEN MATCHED AND target.Value <> source.Value THEN
+            UPDATE SET Value = source.Value, ImportDate = GETDATE()
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (TagName, Timestamp, Value)
+            VALUES (source.TagName, source.Timestamp, source.Value);
+    """
+    clear_staging_sql = "TRUNCATE TABLE #TagDataStaging"
+
+    key_type = "NVARCHAR(255)"
+    create_rollup_staging_sql = (
+        "IF OBJECT_ID('tempdb..#TagRollupStaging') IS NULL "
+        "CREATE TABLE #TagRollupStaging ("
+        "{key} {key_type} NOT NULL, "
+        "BucketStart DATETIME2(0) NOT NULL, "
+        "MinValue FLOAT NOT NULL, "
+        "MaxValue FLOAT NOT NULL, "
+        "SumValue FLOAT NOT NULL, "
+        "SampleCount INT NOT NULL)"
+    )
+    load_rollup_staging_sql = DBBackend.load_rollup_staging_sql.replace("TagRollupStaging", "#TagRollupStaging")
+    # New samples only ever widen a bucket: combine the partial aggregates
+    apply_rollup_sql = """
+        MERGE {table} WITH (HOLDLOCK) AS target
+        USING #TagRollupStaging AS source
+        ON target.{key} = source.{key} AND target.BucketStart = source.BucketStart
+        WHEN MATCHED THEN
+            UPDATE SET MinValue = CASE WHEN source.MinValue < target.MinValue THEN source.MinValue ELSE target.MinValue END,
+                       MaxValue = CASE WHEN source.MaxValue > target.MaxValue THEN source.MaxValue ELSE target.MaxValue END,
+                       SumValue = target.SumValue + source.SumValue,
+                       SampleCount = target.SampleCount + source.SampleCount
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT ({key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+            VALUES (source.{key}, source.BucketStart, source.MinValue, source.MaxValue, source.SumValue, source.SampleCount);
+    """
+    clear_rollup_staging_sql = "TRUNCATE TABLE #TagRollupStaging"
+    rebuild_rollups_sql = """
+        INSERT INTO {table} ({key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+        SELECT {key},
+               DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', Timestamp) / {seconds} * {seconds}, '2000-01-01'),
+               MIN(Value), MAX(Value), SUM(Value), COUNT(*)
+        FROM {facts}
+        WHERE {key} = ? AND Timestamp >= ? AND Timestamp < ? AND Status = 0
+        GROUP BY {key}, DATEADD(SECOND, DATEDIFF(SECOND, '2000-01-01', Timestamp) / {seconds} * {seconds}, '2000-01-01')
+    """
+
+    # Day partitions from sql/partition_tagdata.sql (narrow_schema.sql for TagFacts);
+    # none are listed while the table is not partitioned
+    day_partitions_sql = """
+        SELECT CAST(lower.value AS DATETIME2(3)), CAST(upper.value AS DATETIME2(3)), p.rows
+        FROM sys.partitions p
+        JOIN sys.indexes i ON i.object_id = p.object_id AND i.index_id = p.index_id
+        JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+        JOIN sys.partition_range_values upper
+            ON upper.function_id = ps.function_id AND upper.boundary_id = p.partition_number
+        LEFT JOIN sys.partition_range_values lower
+            ON lower.function_id = ps.function_id AND lower.boundary_id = p.partition_number - 1
+        WHERE p.object_id = OBJECT_ID('{facts}') AND p.index_id IN (0, 1)
+        AND CAST(upper.value AS DATETIME2(3)) <= ?
+        ORDER BY p.partition_number
+    """
+    drop_days_sql = "EXEC dbo.DropDayPartitions '{facts}', ?"
+
+    def prepare_cursor(self, cursor):
+        cursor.fast_executemany = True
+        return cursor
+
+
+class SQLServerNarrowBackend(SQLServerBackend):
+    """SQL Server with the narrow Tags/TagFacts schema (sql/narrow_schema.sql)."""
+
+    uses_tag_ids = True
+    fact_table = 'TagFacts'
+    key_column = 'TagId'
+    key_type = "INT"
+    insert_sql = "INSERT INTO TagFacts (TagId, Timestamp, Value) VALUES (?, ?, ?)"
+    latest_timestamp_sql = (
+        "SELECT MAX(f.Timestamp) FROM TagFacts f "
+        "JOIN Tags t ON t.TagId = f.TagId WHERE t.TagName = ?"
+    )
+    # One seek on (TagId, Timestamp) per tag instead of grouping the whole table
+    all_latest_timestamps_sql = (
+        "SELECT t.TagName, (SELECT MAX(f.Timestamp) FROM TagFacts f WHERE f.TagId = t.TagId) FROM Tags t"
+    )
+    ensure_tag_sql = (
+        "MERGE Tags WITH (HOLDLOCK) AS target "
+        "USING (SELECT ? AS TagName) AS source ON target.TagName = source.TagName "
+        "WHEN NOT MATCHED THEN INSERT (TagName) VALUES (source.TagName);"
+    )
+    start_run_sql = (
+        "IF OBJECT_ID('dbo.EnsureTagFactsPartitions') IS NOT NULL "
+        "EXEC dbo.EnsureTagFactsPartitions"
+    )
+
+    create_staging_sql = (
+        "IF OBJECT_ID('tempdb..#TagFactsStaging') IS NULL "
+        "CREATE TABLE #TagFactsStaging ("
+        "TagId INT NOT NULL, "
+        "Timestamp DATETIME2(3) NOT NULL, "
+        "Value FLOAT NOT NULL)"
+    )
+    load_staging_sql = "INSERT INTO #TagFactsStaging (TagId, Timestamp, Value) VALUES (?, ?, ?)"
+    apply_staging_sql = """
+        MERGE TagFacts WITH (HOLDLOCK) AS target
+        USING #TagFactsStaging AS source
+        ON target.TagId = source.TagId AND target.Timestamp = source.Timestamp
+        WHEN MATCHED AND target.Value <> source.Value THEN
+            UPDATE SET Value = source.Value
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (TagId, Timestamp, Value)
+            VALUES (source.TagId, source.Timestamp, source.Value);
+    """
+    clear_staging_sql = "TRUNCATE TABLE #TagFactsStaging"
+    archive_rows_sql = (
+        "SELECT t.TagName, f.Timestamp, f.Value, f.Status FROM TagFacts f "
+        "JOIN Tags t ON t.TagId = f.TagId "
+        "WHERE f.Timestamp >= ? AND f.Timestamp < ? ORDER BY t.TagName, f.Timestamp"
+    )
+
+
+class SQLiteBackend(DBBackend):
+    """Local SQLite stand-in used for development and benchmarks."""
+
+    schema_sql = """
+        CREATE TABLE IF NOT EXISTS TagData (
+            ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            TagName TEXT NOT NULL,
+            Timestamp TEXT NOT NULL,
+            Value REAL NOT NULL,
+            ImportDate TEXT DEFAULT CURRENT_TIMESTAMP,
+            Status INTEGER DEFAULT 0,
+            Quality TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS IX_TagData_TagName_Timestamp
+        ON TagData(TagName, Timestamp);
+    """
+    rollup_schema_sql = """
+        CREATE TABLE IF NOT EXISTS {table} (
+            {key} {key_type} NOT NULL,
+            BucketStart TEXT NOT NULL,
+            MinValue REAL NOT NULL,
+            MaxValue REAL NOT NULL,
+            SumValue REAL NOT NULL,
+            SampleCount INTEGER NOT NULL,
+            PRIMARY KEY ({key}, BucketStart)
+        ) WITHOUT ROWID;
+    """
+    create_staging_sql = (
+        "CREATE TEMP TABLE IF NOT EXISTS TagDataStaging ("
+        "TagName TEXT NOT NULL, "
+        "Timestamp TEXT NOT NULL, "
+        "Value REAL NOT NULL)"
+    )
+    load_staging_sql = "INSERT INTO TagDataStaging (TagName, Timestamp, Value) VALUES (?, ?, ?)"
+    apply_staging_sql = """
+        INSERT INTO TagData (TagName, Timestamp, Value)
+        SELECT TagName, Timestamp, Value FROM TagDataStaging WHERE true
+        ON CONFLICT (TagName, Timestamp) DO UPDATE
+        SET Value = excluded.Value, ImportDate = CURRENT_TIMESTAMP
+        WHERE Value <> excluded.Value
+    """
+    clear_staging_sql = "DELETE FROM TagDataStaging"
+
+    key_type = "TEXT"
+    create_rollup_staging_sql = (
+        "CREATE TEMP TABLE IF NOT EXISTS TagRollupStaging ("
+        "{key} {key_type} NOT NULL, "
+        "BucketStart TEXT NOT NULL, "
+        "MinValue REAL NOT NULL, "
+        "MaxValue REAL NOT NULL, "
+        "SumValue REAL NOT NULL, "
+        "SampleCount INTEGER NOT NULL)"
+    )
+    apply_rollup_sql = """
+        INSERT INTO {table} ({key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+        SELECT {key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount FROM TagRollupStaging WHERE true
+        ON CONFLICT ({key}, BucketStart) DO UPDATE
+        SET MinValue = min(MinValue, excluded.MinValue),
+            MaxValue = max(MaxValue, excluded.MaxValue),
+            SumValue = SumValue + excluded.SumValue,
+            SampleCount = SampleCount + excluded.SampleCount
+    """
+    rebuild_rollups_sql = """
+        INSERT INTO {table} ({key}, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+        SELECT {key},
+               strftime('%Y-%m-%dT%H:%M:%S', CAST(strftime('%s', Timestamp) AS INTEGER) / {seconds} * {seconds}, 'unixepoch') AS Bucket,
+               MIN(Value), MAX(Value), SUM(Value), COUNT(*)
+        FROM {facts}
+        WHERE {key} = ? AND Timestamp >= ? AND Timestamp < ? AND Status = 0
+        GROUP BY {key}, Bucket
+    """
+
+    # No partitions: each day before the cutoff stands in for one, and dropping
+    # them is a range delete
+    day_partitions_sql = (
+        "SELECT date(Timestamp) AS Day, date(Timestamp, '+1 day'), COUNT(*) FROM {facts} "
+        "WHERE Timestamp < ? GROUP BY Day ORDER BY Day"
+    )
+    drop_days_sql = "DELETE FROM {facts} WHERE Timestamp < ?"
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+
+    def connect(self):
+        # Connections are owned by one import worker but closed by the pool
+        conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.schema_sql)
+        for table in self.rollup_tables.values():
+            conn.executescript(self.rollup_schema_sql.format(table=table, key=self.key_column, key_type=self.key_type))
+        return conn
+
+
+class SQLiteNarrowBackend(SQLiteBackend):
+    """SQLite stand-in for the narrow Tags/TagFacts schema."""
+
+    uses_tag_ids = True
+    fact_table = 'TagFacts'
+    key_column = 'TagId'
+    key_type = "INTEGER"
+    schema_sql = """
+        CREATE TABLE IF NOT EXISTS Tags (
+            TagId INTEGER PRIMARY KEY,
+            TagName TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS TagFacts (
+            TagId INTEGER NOT NULL,
+            Timestamp TEXT NOT NULL,
+            Value REAL NOT NULL,
+            Status INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (TagId, Timestamp)
+        ) WITHOUT ROWID;
+    """
+    insert_sql = "INSERT INTO TagFacts (TagId, Timestamp, Value) VALUES (?, ?, ?)"
+    latest_timestamp_sql = SQLServerNarrowBackend.latest_timestamp_sql
+    all_latest_timestamps_sql = SQLServerNarrowBackend.all_latest_timestamps_sql
+    ensure_tag_sql = "INSERT INTO Tags (TagName) VALUES (?) ON CONFLICT (TagName) DO NOTHING"
+    archive_rows_sql = SQLServerNarrowBackend.archive_rows_sql
+
+    create_staging_sql = (
+        "CREATE TEMP TABLE IF NOT EXISTS TagFactsStaging ("
+        "TagId INTEGER NOT NULL, "
+        "Timestamp TEXT NOT NULL, "
+        "Value REAL NOT NULL)"
+    )
+    load_staging_sql = "INSERT INTO TagFactsStaging (TagId, Timestamp, Value) VALUES (?, ?, ?)"
+    apply_staging_sql = """
+        INSERT INTO TagFacts (TagId, Timestamp, Value)
+        SELECT TagId, Timestamp, Value FROM TagFactsStaging WHERE true
+        ON CONFLICT (TagId, Timestamp) DO UPDATE
+        SET Value = excluded.Value
+        WHERE Value <> excluded.Value
+    """
+    clear_staging_sql = "DELETE FROM TagFactsStaging"
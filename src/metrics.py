@@ -0,0 +1,250 @@
+"""Run metrics shared by the exporter, HistorianTransfer and SQLImporter.
+
+Each stage keeps a RunMetrics for the current run:
+
+    metrics = RunMetrics("import", throughput="rows_inserted")
+    metrics.add("rows_parsed", len(df))
+    with metrics.timer("db_roundtrip_seconds"):
+        cursor.executemany(sql, params)
+    metrics.record_tag(tag, elapsed, rows=len(df))
+    metrics.finish(logger.info)
+
+finish() appends the run summary as one JSON line to <directory>/metrics.jsonl
+and rewrites <directory>/historian_<stage>.prom in the Prometheus textfile
+format (for node_exporter's textfile collector). It also logs the totals, the
+slowest tags and a warning when throughput fell well below the previous run.
+Recording is a dict update or a bisect under a lock, cheap enough for
+per-batch calls.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_DIR = "logs"
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Slowest tags kept in the summary and exported to Prometheus
+SLOW_TAGS = 10
+# Warn when throughput drops by more than this fraction against the previous run
+REGRESSION_THRESHOLD = 0.25
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, plus sum, count and max."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 6),
+        }
+
+
+class RunMetrics:
+    """Counters, latency histograms and per-tag totals for one run of a stage."""
+
+    def __init__(self, stage, throughput=None, directory=METRICS_DIR):
+        self.stage = stage
+        # Counter whose rate is compared between runs to flag regressions
+        self.throughput = throughput
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new run."""
+        with self._lock:
+            self.started = datetime.now()
+            self._start_time = time.time()
+            self.counters = {}
+            self.histograms = {}
+            self.tags = {}
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the duration of the block in histogram name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def record_tag(self, tag, seconds, **counts):
+        """Add time and counts (rows=..., bytes=...) to a tag's totals."""
+        with self._lock:
+            totals = self.tags.get(tag)
+            if totals is None:
+                totals = self.tags[tag] = {'seconds': 0.0}
+            totals['seconds'] += seconds
+            for name, amount in counts.items():
+                totals[name] = totals.get(name, 0) + amount
+
+    def summary(self):
+        with self._lock:
+            wall_seconds = time.time() - self._start_time
+            slowest = sorted(self.tags.items(), key=lambda item: item[1]['seconds'], reverse=True)[:SLOW_TAGS]
+            summary = {
+                'stage': self.stage,
+                'started': self.started.isoformat(timespec='seconds'),
+                'wall_seconds': round(wall_seconds, 3),
+                'counters': dict(self.counters),
+                'rates': {name: round(value / wall_seconds, 1) for name, value in self.counters.items()
+                          if wall_seconds > 0},
+                'latency': {name: histogram.summary() for name, histogram in self.histograms.items()},
+                'tag_count': len(self.tags),
+                'slowest_tags': [dict(tag=tag, **{name: round(value, 3) for name, value in totals.items()})
+                                 for tag, totals in slowest],
+            }
+            histograms = {name: (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                          for name, histogram in self.histograms.items()}
+        return summary, histograms
+
+    def previous_summary(self):
+        """Summary of this stage's last recorded run, or None."""
+        return last_summary(self.stage, self.directory)
+
+    def write(self, summary, histograms):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "metrics.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary) + "\n")
+        path = os.path.join(self.directory, f"historian_{self.stage}.prom")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text(summary, histograms))
+        # Atomic so the textfile collector never reads a partial file
+        os.replace(tmp_path, path)
+
+    def finish(self, log):
+        """Write the run summary to the sinks and log it with log(message)."""
+        summary, histograms = self.summary()
+        previous = self.previous_summary()
+        try:
+            self.write(summary, histograms)
+        except Exception as e:
+            log(f"Could not write {self.stage} metrics: {e}")
+        log(format_summary(summary))
+        for tag in summary['slowest_tags'][:5]:
+            details = ", ".join(f"{name}={value}" for name, value in tag.items() if name != 'tag')
+            log(f"Slow tag {tag['tag']}: {details}")
+        regression = throughput_change(summary, previous, self.throughput)
+        if regression is not None and regression < -REGRESSION_THRESHOLD:
+            log(f"Possible regression: {self.throughput} rate {summary['rates'][self.throughput]}/s is "
+                f"{-regression:.0%} below the previous run ({previous['rates'][self.throughput]}/s)")
+        return summary
+
+
+def throughput_change(summary, previous, counter):
+    """Relative change of a counter's rate against the previous run, or None."""
+    if counter is None or previous is None:
+        return None
+    current_rate = summary['rates'].get(counter)
+    previous_rate = previous.get('rates', {}).get(counter)
+    if not current_rate or not previous_rate:
+        return None
+    return current_rate / previous_rate - 1
+
+
+def last_summary(stage, directory=METRICS_DIR):
+    """Most recent summary of a stage from <directory>/metrics.jsonl, or None."""
+    path = os.path.join(directory, "metrics.jsonl")
+    if not os.path.exists(path):
+        return None
+    found = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('stage') == stage:
+                found = record
+    return found
+
+
+def format_summary(summary):
+    """One log line with a run's wall time, counters and mean latencies."""
+    counters = ", ".join(f"{name}={value} ({summary['rates'].get(name, 0)}/s)"
+                         for name, value in sorted(summary['counters'].items()))
+    latency = ", ".join(f"{name} mean={stats['mean'] * 1000:.1f}ms p95<={stats['p95'] * 1000:.0f}ms"
+                        for name, stats in sorted(summary['latency'].items()))
+    line = f"{summary['stage']} run took {summary['wall_seconds']:.1f}s over {summary['tag_count']} tags"
+    if counters:
+        line += f": {counters}"
+    if latency:
+        line += f"; {latency}"
+    return line
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(summary, histograms):
+    """Render a run summary in the Prometheus text exposition format."""
+    stage = f'stage="{_escape(summary["stage"])}"'
+    lines = [
+        "# TYPE historian_run_wall_seconds gauge",
+        f"historian_run_wall_seconds{{{stage}}} {summary['wall_seconds']}",
+        "# TYPE historian_run_finished_timestamp_seconds gauge",
+        f"historian_run_finished_timestamp_seconds{{{stage}}} {time.time():.0f}",
+    ]
+    for name, value in sorted(summary['counters'].items()):
+        lines.append(f"# TYPE historian_{name} gauge")
+        lines.append(f"historian_{name}{{{stage}}} {value}")
+    for name, (buckets, counts, total, count) in sorted(histograms.items()):
+        lines.append(f"# TYPE historian_{name} histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'historian_{name}_bucket{{{stage},le="{bound}"}} {cumulative}')
+        lines.append(f'historian_{name}_bucket{{{stage},le="+Inf"}} {count}')
+        lines.append(f"historian_{name}_sum{{{stage}}} {total}")
+        lines.append(f"historian_{name}_count{{{stage}}} {count}")
+    if summary['slowest_tags']:
+        lines.append("# TYPE historian_slow_tag_seconds gauge")
+        for tag in summary['slowest_tags']:
+            lines.append(f'historian_slow_tag_seconds{{{stage},tag="{_escape(tag["tag"])}"}} {tag["seconds"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,125 @@
+"""Day-partitioned Parquet storage for per-tag historian data.
+
+Each tag is a directory holding one file per calendar day::
+
+    <root>/<tag>/2024-01-01.parquet
+
+with a typed ``timestamp`` (datetime64) column and a ``value`` (float64)
+column. Readers open only the partitions they need and retention is a matter
+of deleting whole day files.
+"""
+import argparse
+import glob
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import csv_codec
+
+PARTITION_SUFFIX = ".parquet"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def tag_directory(root, tag_name):
+    return os.path.join(root, tag_name)
+
+
+def partition_path(tag_dir, day):
+    return os.path.join(tag_dir, f"{day.strftime(DAY_FORMAT)}{PARTITION_SUFFIX}")
+
+
+def partition_day(path):
+    """Day covered by a partition file, from its name."""
+    name = os.path.basename(path)[:-len(PARTITION_SUFFIX)]
+    return datetime.strptime(name, DAY_FORMAT)
+
+
+def list_partitions(tag_dir):
+    """Partition files of a tag, oldest first."""
+    return sorted(glob.glob(os.path.join(tag_dir, f"*{PARTITION_SUFFIX}")))
+
+
+def _normalize(df):
+    df = csv_codec.to_frame(df[['timestamp', 'value']].copy())
+    return df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+
+
+def read_partition(path):
+    return pd.read_parquet(path, columns=['timestamp', 'value'])
+
+
+def write_partition(path, df):
+    """Write one day file atomically."""
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def write_partitions(tag_dir, new_data):
+    """Merge new rows into the day partitions they fall in.
+
+    Only the days present in new_data are read and rewritten. Returns the
+    number of partitions written.
+    """
+    new_data = _normalize(new_data)
+    if new_data.empty:
+        return 0
+    os.makedirs(tag_dir, exist_ok=True)
+
+    written = 0
+    for day, day_data in new_data.groupby(new_data['timestamp'].dt.floor('D')):
+        path = partition_path(tag_dir, day)
+        if os.path.exists(path):
+            day_data = _normalize(pd.concat([read_partition(path), day_data]))
+        write_partition(path, day_data)
+        written += 1
+    return written
+
+
+def read_partitions(tag_dir, since=None):
+    """Read a tag's rows, opening only partitions that can hold rows after since."""
+    paths = list_partitions(tag_dir)
+    if since is not None and since > datetime.min:
+        first_day = pd.Timestamp(since).floor('D')
+        paths = [p for p in paths if partition_day(p) >= first_day]
+    if not paths:
+        return pd.DataFrame({'timestamp': pd.Series(dtype='datetime64[ns]'),
+                             'value': pd.Series(dtype='float64')})
+    return pd.concat([read_partition(p) for p in paths], ignore_index=True)
+
+
+def drop_partitions_before(tag_dir, retention_days):
+    """Delete day files that lie entirely outside the retention window."""
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    removed = 0
+    for path in list_partitions(tag_dir):
+        if partition_day(path) + timedelta(days=1) <= cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def convert_csv_dir(csv_dir, root):
+    """Convert a directory of flat per-tag CSVs into the partitioned layout."""
+    converted = 0
+    for csv_file in sorted(glob.glob(os.path.join(csv_dir, "*.csv"))):
+        tag_name = os.path.basename(csv_file)[:-len(".csv")]
+        df = csv_codec.read_csv(csv_file)
+        days = write_partitions(tag_directory(root, tag_name), df)
+        print(f"{tag_name}: {len(df)} rows -> {days} partitions")
+        converted += 1
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert per-tag CSV exports to day-partitioned Parquet")
+    parser.add_argument('csv_dir', help="directory holding <tag>.csv files")
+    parser.add_argument('output_dir', help="root of the partitioned store")
+    args = parser.parse_args()
+    count = convert_csv_dir(args.csv_dir, args.output_dir)
+    print(f"Converted {count} CSV files into {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Retention by whole days, for the local export files and the database.
+
+Disk: each tag in the local export directory keeps the last RETENTION_DAYS
+days. Parquet day partitions outside the window are deleted as files; a CSV
+drops its oldest days with csv_store.compact, a bisect on byte offsets and
+a copy of the rest, without parsing rows. Files are also trimmed as they are
+written; the sweep catches tags that stopped updating.
+
+Database: the fact table (TagData, or TagFacts with the narrow schema) is
+partitioned by day (sql/partition_tagdata.sql, or narrow_schema.sql with
+PartitionByDay = 1), and days older than DB_RETENTION_DAYS are removed by
+dbo.DropDayPartitions, which truncates and merges whole partitions. Each
+partition can first be archived to a gzip CSV. The rollup tables are kept
+as the long-term history.
+
+    python retention.py disk
+    python retention.py db --keep-days 365 --archive-dir /home/mpp/historian_export/archive
+"""
+import argparse
+import glob
+import io
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+import csv_codec
+import csv_store
+import partition_store
+from run_lock import RunLock
+
+TARGETS = ("disk", "db")
+# Days of raw samples kept in the database; must exceed csv_store.RETENTION_DAYS,
+# or merge and diff imports would load dropped days again from the local files
+DB_RETENTION_DAYS = 365
+# Partitions are archived to <ARCHIVE_DIR>/<table>/<first day>.csv.gz before they
+# are dropped; None drops without archiving
+ARCHIVE_DIR = "/home/mpp/historian_export/archive"
+ARCHIVE_COLUMNS = ['tag', 'timestamp', 'value', 'status']
+ARCHIVE_FETCH_ROWS = 100000
+
+
+def setup_logging():
+    os.makedirs('logs', exist_ok=True)
+    logger = logging.getLogger('Retention')
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler('logs/retention.log', maxBytes=10*1024*1024, backupCount=5)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger
+
+
+def mirror_of(path):
+    """Compression of a CSV's compressed mirror, or None when it has none."""
+    for compression in csv_store.COMPRESSION_SUFFIXES:
+        if os.path.exists(csv_store.compressed_path(path, compression)):
+            return compression
+    return None
+
+
+def sweep_directory(root, retention_days, logger):
+    """Trim every per-tag CSV and partition directory under root to retention_days.
+
+    Returns (CSV files compacted, partition files deleted).
+    """
+    compacted = 0
+    for path in sorted(glob.glob(os.path.join(root, "*.csv"))):
+        try:
+            if csv_store.compact_if_due(path, retention_days, slack_days=0, mirror_compression=mirror_of(path)):
+                compacted += 1
+        except Exception as e:
+            logger.error(f"Error compacting {os.path.basename(path)}: {e}")
+    dropped = 0
+    for tag_dir in sorted(glob.glob(os.path.join(root, "*", ""))):
+        try:
+            dropped += partition_store.drop_partitions_before(tag_dir, retention_days)
+        except Exception as e:
+            logger.error(f"Error dropping partitions of {os.path.basename(tag_dir.rstrip(os.sep))}: {e}")
+    return compacted, dropped
+
+
+def run_disk(root, retention_days, logger):
+    import sftp_script
+
+    # Compaction replaces a file; it must not race a transfer appending to it
+    lock = RunLock(sftp_script.TRANSFER_LOCK)
+    if not lock.acquire():
+        logger.info("Transfer in progress. Skipping disk retention.")
+        return False
+    try:
+        start = time.time()
+        compacted, dropped = sweep_directory(root, retention_days, logger)
+        logger.info(f"Disk retention of {root} ({retention_days} days): {compacted} CSV files compacted, "
+                    f"{dropped} partitions deleted in {time.time() - start:.1f}s")
+        return True
+    finally:
+        lock.release()
+
+
+def old_partitions(backend, cursor, cutoff):
+    """(first instant, end, rows) of the fact table's day partitions ending by cutoff, oldest first.
+
+    The first instant is None for the lowest partition, which holds everything
+    before its end.
+    """
+    cursor.execute(backend.day_partitions_sql.format(facts=backend.fact_table), (cutoff.isoformat(),))
+    return [(backend.to_datetime(lower) if lower is not None else None, backend.to_datetime(upper), rows)
+            for lower, upper, rows in cursor.fetchall()]
+
+
+def archive_path(archive_dir, table, lower, upper):
+    name = f"{lower:%Y-%m-%d}" if lower is not None else f"before-{upper:%Y-%m-%d}"
+    return os.path.join(archive_dir, table, f"{name}.csv.gz")
+
+
+def archive_partition(backend, cursor, lower, upper, path):
+    """Write one partition's rows to a gzip CSV, chunk by chunk; returns the row count."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # DATETIME2's lowest value stands in for the open lower end of the first partition
+    lower = lower.isoformat() if lower is not None else "0001-01-01T00:00:00"
+    cursor.execute(backend.archive_rows_sql.format(facts=backend.fact_table), (lower, upper.isoformat()))
+    tmp_path = f"{path}.tmp"
+    rows = 0
+    with io.TextIOWrapper(csv_store.open_compressed(tmp_path, 'gzip'), encoding='utf-8', newline='') as f:
+        f.write(",".join(ARCHIVE_COLUMNS) + "\n")
+        while True:
+            chunk = cursor.fetchmany(ARCHIVE_FETCH_ROWS)
+            if not chunk:
+                break
+            df = pd.DataFrame.from_records([tuple(row) for row in chunk], columns=ARCHIVE_COLUMNS)
+            df['timestamp'] = csv_codec.parse_timestamps(df['timestamp'].astype(str))
+            df.to_csv(f, header=False, index=False, date_format=csv_codec.TIMESTAMP_FORMAT)
+            rows += len(df)
+    os.replace(tmp_path, path)
+    return rows
+
+
+def drop_partitions(backend, conn, cutoff, archive_dir, logger, dry_run=False):
+    """Archive (when archive_dir is set) and drop the day partitions ending by cutoff."""
+    table = backend.fact_table
+    cursor = conn.cursor()
+    start = time.time()
+    partitions = old_partitions(backend, cursor, cutoff)
+    total_rows = sum(rows for _, _, rows in partitions)
+    logger.info(f"{table}: {len(partitions)} partitions ({total_rows} rows) before {cutoff:%Y-%m-%d}")
+    if dry_run or not partitions:
+        return True
+
+    if archive_dir is not None:
+        for lower, upper, rows in partitions:
+            if not rows:
+                continue
+            path = archive_path(archive_dir, table, lower, upper)
+            archived = archive_partition(backend, cursor, lower, upper, path)
+            logger.info(f"Archived {archived} rows to {path}")
+
+    cursor.execute(backend.drop_days_sql.format(facts=table), (cutoff.isoformat(),))
+    conn.commit()
+    logger.info(f"Dropped {len(partitions)} partitions of {table} in {time.time() - start:.1f}s")
+    return True
+
+
+def run_db(backend, keep_days, archive_dir, logger, dry_run=False):
+    """Archive and drop the fact table's day partitions older than keep_days."""
+    from sql_import import IMPORT_LOCK
+
+    if keep_days <= csv_store.RETENTION_DAYS:
+        raise ValueError(f"Database retention ({keep_days} days) must exceed the "
+                         f"{csv_store.RETENTION_DAYS} days kept in the local files")
+    cutoff = csv_store.retention_cutoff(keep_days)
+
+    # Imports insert into the newest partitions, retention truncates the oldest; they
+    # still take turns, as TRUNCATE needs a schema lock on the whole table
+    lock = RunLock(IMPORT_LOCK)
+    if not lock.acquire():
+        logger.info("Import in progress. Skipping database retention.")
+        return False
+    try:
+        conn = backend.connect()
+        try:
+            return drop_partitions(backend, conn, cutoff, archive_dir, logger, dry_run)
+        finally:
+            conn.close()
+    finally:
+        lock.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop data older than the retention window by whole days")
+    parser.add_argument('targets', nargs='+', choices=TARGETS,
+                        help="'disk' trims the local export files, 'db' drops database partitions")
+    parser.add_argument('--dir', help="local export directory (default: the importer's)")
+    parser.add_argument('--disk-days', type=int, default=csv_store.RETENTION_DAYS,
+                        help=f"days kept on disk (default: {csv_store.RETENTION_DAYS})")
+    parser.add_argument('--keep-days', type=int, default=DB_RETENTION_DAYS,
+                        help=f"days kept in the database (default: {DB_RETENTION_DAYS})")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR,
+                        help="directory for the gzip CSV archives of dropped partitions")
+    parser.add_argument('--no-archive', action='store_true', help="drop partitions without archiving them")
+    parser.add_argument('--schema', choices=['wide', 'narrow'], default='wide',
+                        help="TagData with TagName per row, or the Tags/TagFacts schema")
+    parser.add_argument('--dry-run', action='store_true', help="list the database partitions that would be dropped")
+    args = parser.parse_args()
+
+    from sql_import import SQLImporter
+
+    logger = setup_logging()
+    importer = SQLImporter()
+    if args.schema != importer.schema:
+        importer.schema = args.schema
+        importer.backend = importer.default_backend()
+    if "disk" in args.targets:
+        run_disk(args.dir or importer.csv_dir, args.disk_days, logger)
+    if "db" in args.targets:
+        archive_dir = None if args.no_archive else args.archive_dir
+        run_db(importer.backend, args.keep_days, archive_dir, logger, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Single-instance locks for the pipeline stages.
+
+A stage holds an exclusive OS lock on its lock file for as long as it runs:
+fcntl.flock on Linux, msvcrt.locking on the Windows exporter host. The lock
+belongs to the open file, so it is released when the process exits or is
+killed, and a crashed run can never leave a stale lock behind. The file
+itself is left in place and only records the holder for troubleshooting.
+
+    lock = RunLock("transfer.lock")
+    if not lock.acquire():
+        return  # a previous run is still going
+    try:
+        ...
+    finally:
+        lock.release()
+"""
+import os
+from datetime import datetime
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class RunLock:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Take the lock without waiting; returns False while another run holds it."""
+        f = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"pid {os.getpid()} since {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
@@ -2,14 +2,41 @@ import schedule
 import time
 import subprocess
 import logging
+import queue
+import threading
 from datetime import datetime
 import os
 from logging.handlers import RotatingFileHandler
+import metrics
+from run_lock import RunLock
+
+# 'subprocess' runs sftp_script.py and sql_import.py one after the other;
+# 'inprocess' streams each tag from download to import through bounded queues
+PIPELINE_MODE = "subprocess"
+PIPELINE_TRANSFER_WORKERS = 4
+PIPELINE_IMPORT_WORKERS = 4
+# Merged tags waiting for import; a full queue pauses the downloaders
+PIPELINE_QUEUE_SIZE = 16
+# Lines of a failed script's output kept in scheduler.log; the scripts keep full logs of their own
+OUTPUT_TAIL_LINES = 20
+# 'daily' runs the pipeline at DAILY_RUN_TIME. 'microbatch' runs it every MICROBATCH_MINUTES,
+# transferring only the rows appended since the previous batch (pair with the exporter's
+# EXPORT_MODE = "incremental" on a Task Scheduler trigger of the same period)
+SCHEDULE_MODE = "daily"
+DAILY_RUN_TIME = "02:00"
+MICROBATCH_MINUTES = 5
+# 'schedule' imports right after each scheduled transfer. 'arrival' imports tag files as
+# soon as they change on disk and no transfer is writing, whatever started the transfer
+IMPORT_TRIGGER = "schedule"
+ARRIVAL_POLL_SECONDS = 15
+# Daily time to run retention.py on the local files and the database partitions; None disables it
+RETENTION_RUN_TIME = None
 
 def setup_logging():
     os.makedirs('logs', exist_ok=True)
     logger = logging.getLogger('Scheduler')
     logger.setLevel(logging.INFO)
+    logger.propagate = False
     
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
     
@@ -23,40 +50,218 @@ def setup_logging():
     
     return logger
 
-def run_scripts(logger):
+def run_script(logger, label, script, stage, args=()):
+    """Run one pipeline script and log its outcome and run metrics, not its whole output.
+    
+    The scripts log to their own files; only the tail of a failed run's
+    output is copied into scheduler.log.
+    """
+    logger.info(f"Starting {label}...")
+    start_time = time.time()
+    result = subprocess.run(["python3", script, *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.time() - start_time
+    if result.returncode != 0:
+        tail = "\n".join(result.stderr.splitlines()[-OUTPUT_TAIL_LINES:])
+        logger.error(f"{label} exited with code {result.returncode} after {elapsed:.1f}s:\n{tail}")
+        return False
+    summary = metrics.last_summary(stage)
+    if summary is not None and summary['started'] >= datetime.fromtimestamp(start_time).isoformat(timespec='seconds'):
+        logger.info(metrics.format_summary(summary))
+    logger.info(f"{label} completed in {elapsed:.1f}s")
+    return True
+
+def run_scripts(logger, microbatch=False):
     try:
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         logger.info(f"Starting scheduled execution at {current_time}")
         
-        logger.info("Starting SFTP transfer...")
-        result_sftp = subprocess.run(["python3", "sftp_script.py"], capture_output=True, text=True)
-        logger.info(f"SFTP Output: {result_sftp.stdout}")
-        if result_sftp.stderr:
-            logger.error(f"SFTP Errors: {result_sftp.stderr}")
-            
-        logger.info("Starting SQL import...")
-        result_sql = subprocess.run(["python3", "sql_import.py"], capture_output=True, text=True)
-        logger.info(f"SQL Import Output: {result_sql.stdout}")
-        if result_sql.stderr:
-            logger.error(f"SQL Import Errors: {result_sql.stderr}")
-            
-        logger.info("Both scripts completed successfully")
+        transfer_args = ["--resume-appends"] if microbatch else []
+        transferred = run_script(logger, "SFTP transfer", "sftp_script.py", "transfer", transfer_args)
+        if IMPORT_TRIGGER == "arrival":
+            # watch_arrivals picks up the merged files
+            return
+        imported = run_script(logger, "SQL import", "sql_import.py", "import")
+        
+        if transferred and imported:
+            logger.info("Both scripts completed successfully")
     except Exception as e:
         logger.error(f"Error in run_scripts: {e}")
 
+def run_pipeline(logger, transfer=None, importer=None, microbatch=False):
+    """Download, merge and import in one process, tag by tag.
+    
+    The SFTP workers hand each merged tag to a bounded queue and the import
+    workers start on it while later tags are still downloading. A configured
+    HistorianTransfer/SQLImporter can be passed in instead of the defaults.
+    """
+    import sftp_script
+    from sql_import import IMPORT_LOCK, SQLImporter
+    
+    import_lock = RunLock(IMPORT_LOCK)
+    if not import_lock.acquire():
+        logger.info("Import already in progress. Skipping pipeline run.")
+        return
+    try:
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        logger.info(f"Starting in-process pipeline at {current_time}")
+        start_time = time.time()
+        sftp_script.setup_logging()
+        
+        if transfer is None:
+            transfer = sftp_script.HistorianTransfer()
+            transfer.transfer_workers = PIPELINE_TRANSFER_WORKERS
+            if microbatch:
+                transfer.skip_unchanged = True
+                transfer.resume_appends = True
+        if importer is None:
+            importer = SQLImporter()
+        importer.csv_dir = transfer.local_path
+        importer.storage_format = transfer.storage_format
+        importer.start_run()
+        
+        ready = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        results = {'imported': 0, 'failed': 0}
+        results_lock = threading.Lock()
+        
+        def import_stage():
+            while True:
+                path = ready.get()
+                if path is None:
+                    break
+                success = importer.import_source(path)
+                with results_lock:
+                    results['imported' if success else 'failed'] += 1
+        
+        importers = [threading.Thread(target=import_stage, name=f"pipeline-import-{i}")
+                     for i in range(PIPELINE_IMPORT_WORKERS)]
+        for thread in importers:
+            thread.start()
+        try:
+            transfer.transfer_files(on_tag_ready=ready.put)
+        finally:
+            for _ in importers:
+                ready.put(None)
+            for thread in importers:
+                thread.join()
+            importer.finish_run()
+        
+        elapsed = time.time() - start_time
+        logger.info(f"Pipeline completed: {results['imported']} tags imported, "
+                    f"{results['failed']} failed in {elapsed/60:.1f} minutes")
+    except Exception as e:
+        logger.error(f"Error in run_pipeline: {e}")
+    finally:
+        import_lock.release()
+
+def source_state(path):
+    """(size, mtime) of a tag file, or of a partition directory's day files"""
+    if os.path.isdir(path):
+        entries = [entry.stat() for entry in os.scandir(path) if entry.is_file()]
+        return (sum(st.st_size for st in entries), max((st.st_mtime_ns for st in entries), default=0))
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime_ns)
+
+def import_arrivals(logger, imported, importer):
+    """Import the tag sources that changed since they were last imported.
+    
+    Sources are only checked while no transfer holds its lock. The lock is
+    released before the import, so scheduled transfers are not skipped
+    during a long import. A transfer may then append to a file while it is
+    being read: CSVs are read up to their last complete row (rewrites and
+    Parquet partitions are atomic replaces), and a file that changes
+    meanwhile is picked up again by the next poll. imported maps each
+    source to its state when it was last imported and is updated in place;
+    failed sources are retried next time.
+    """
+    import sftp_script
+    import sql_import
+    
+    transfer_lock = RunLock(sftp_script.TRANSFER_LOCK)
+    if not transfer_lock.acquire():
+        return
+    try:
+        changed = {}
+        for path in importer.list_tag_sources():
+            try:
+                state = source_state(path)
+            except OSError:
+                continue
+            if imported.get(path) != state:
+                changed[path] = state
+    finally:
+        transfer_lock.release()
+    if not changed:
+        return
+    
+    import_lock = RunLock(sql_import.IMPORT_LOCK)
+    if not import_lock.acquire():
+        return
+    try:
+        logger.info(f"Importing {len(changed)} changed tag files")
+        start_time = time.time()
+        importer.start_run()
+        failed = 0
+        try:
+            for path, state in changed.items():
+                if importer.import_source(path):
+                    imported[path] = state
+                else:
+                    failed += 1
+        finally:
+            importer.finish_run()
+        logger.info(f"Imported {len(changed) - failed}/{len(changed)} changed tag files "
+                    f"in {time.time() - start_time:.1f}s")
+    finally:
+        import_lock.release()
+
+def watch_arrivals(logger):
+    """Poll the local export directory and import files as they arrive (IMPORT_TRIGGER = 'arrival')"""
+    from sql_import import SQLImporter
+    
+    importer = SQLImporter()
+    imported = {}
+    while True:
+        try:
+            import_arrivals(logger, imported, importer)
+        except Exception as e:
+            logger.error(f"Error importing arrived files: {e}")
+        time.sleep(ARRIVAL_POLL_SECONDS)
+
+def run_job(logger, microbatch=False):
+    if PIPELINE_MODE == "inprocess":
+        run_pipeline(logger, microbatch=microbatch)
+    else:
+        run_scripts(logger, microbatch)
+
+def run_retention(logger):
+    try:
+        run_script(logger, "Retention", "retention.py", "retention", ["disk", "db"])
+    except Exception as e:
+        logger.error(f"Error in run_retention: {e}")
+
 def main():
     logger = setup_logging()
     logger.info("Scheduler started")
     
-    # Schedule the job to run at 16:05
-    schedule.every().day.at("02:00").do(run_scripts, logger)
+    if RETENTION_RUN_TIME is not None:
+        schedule.every().day.at(RETENTION_RUN_TIME).do(run_retention, logger)
+        logger.info(f"Running retention daily at {RETENTION_RUN_TIME}")
+    
+    if IMPORT_TRIGGER == "arrival" and PIPELINE_MODE != "inprocess":
+        threading.Thread(target=watch_arrivals, args=(logger,), name="arrival-import", daemon=True).start()
+        logger.info(f"Importing files as they arrive, polling every {ARRIVAL_POLL_SECONDS}s")
     
-    # Check if current time is close to 16:05
-    current_hour = datetime.now().hour
-    current_minute = datetime.now().minute
-    if current_hour == 2 and current_minute == 0:
-        logger.info("Current time matches scheduled time, running immediately...")
-        run_scripts(logger)
+    if SCHEDULE_MODE == "microbatch":
+        schedule.every(MICROBATCH_MINUTES).minutes.do(run_job, logger, True)
+        logger.info(f"Running micro-batches every {MICROBATCH_MINUTES} minutes")
+        run_job(logger, True)
+    else:
+        schedule.every().day.at(DAILY_RUN_TIME).do(run_job, logger)
+        
+        # Run at once if the scheduler starts at the scheduled minute
+        if datetime.now().strftime("%H:%M") == DAILY_RUN_TIME:
+            logger.info("Current time matches scheduled time, running immediately...")
+            run_job(logger)
     
     while True:
         schedule.run_pending()
@@ -0,0 +1,160 @@
+"""Lossy-bounded compression of a tag's samples, and re-interpolation to a grid.
+
+The exporter requests interpolated samples every SAMPLE_INTERVAL_SECONDS,
+so a flat or slowly changing signal yields thousands of near-identical rows
+per day. A compressor keeps only the points needed to rebuild the series
+by linear interpolation with an error of at most deviation (in the tag's
+units):
+
+- Deadband keeps a point once the value leaves a band of +/- deviation/2
+  around the last kept value, together with the last point inside the band.
+- SwingingDoor keeps the end of each segment for as long as one straight
+  line from the last kept point passes within deviation of every sample
+  in between. Ramps compress as well as flat stretches.
+
+Both keep the first and last point, every NaN (bad quality) and its
+neighbours, and at least one point every max_seconds. Points at or before
+the last one received are dropped. Compressors keep
+their state between compress() calls, so a series can be fed chunk by
+chunk as it is fetched; flush() returns the held last point.
+
+    compressor = make_compressor('swinging_door', deviation=0.5)
+    for timestamps, values in chunks:
+        write(*compressor.compress(timestamps, values))
+    write(*compressor.flush())
+
+reinterpolate() rebuilds values on a regular grid from the kept points.
+"""
+import math
+
+import numpy as np
+
+# Longest gap between kept points
+MAX_SECONDS = 3600
+METHODS = ('deadband', 'swinging_door')
+
+
+def _epoch_seconds(timestamps):
+    return np.asarray(timestamps).astype('datetime64[ns]').astype(np.int64) / 1e9
+
+
+class _Compressor:
+    def __init__(self, deviation, max_seconds=MAX_SECONDS):
+        self.deviation = float(deviation)
+        self.max_seconds = max_seconds
+        # Last kept point and the last received point not yet kept, as (seconds, value, timestamp)
+        self._anchor = None
+        self._held = None
+        self._out = []
+
+    def _keep(self, point):
+        self._out.append(point)
+        self._anchor = point
+
+    def _keep_held(self):
+        if self._held is not None:
+            self._keep(self._held)
+            self._held = None
+
+    def _result(self):
+        out, self._out = self._out, []
+        timestamps = np.array([point[2] for point in out], dtype='datetime64[ns]')
+        values = np.array([point[1] for point in out], dtype=np.float64)
+        return timestamps, values
+
+    def compress(self, timestamps, values):
+        """The points of a chunk to keep, as (timestamps, values) arrays.
+
+        Points at or before the last point received are dropped.
+        """
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]')
+        seconds = _epoch_seconds(timestamps).tolist()
+        for point in zip(seconds, np.asarray(values, dtype=np.float64).tolist(), timestamps):
+            last = self._held or self._anchor
+            if last is not None and point[0] <= last[0]:
+                # Repeated or out of order, e.g. a window fetched again after a failed grouped query
+                continue
+            if self._anchor is None:
+                self._keep(point)
+            elif math.isnan(point[1]) or math.isnan(self._anchor[1]):
+                # Bad values are kept as they are and end the segment on both sides
+                self._keep_held()
+                self._keep(point)
+            else:
+                self._add(point)
+        return self._result()
+
+    def flush(self):
+        """The held last point, so the kept series ends where the input did."""
+        self._keep_held()
+        return self._result()
+
+
+class Deadband(_Compressor):
+    def _add(self, point):
+        anchor = self._anchor
+        if abs(point[1] - anchor[1]) > self.deviation / 2 or point[0] - anchor[0] > self.max_seconds:
+            # The last point inside the band marks where the change began
+            self._keep_held()
+            self._keep(point)
+        else:
+            self._held = point
+
+
+class SwingingDoor(_Compressor):
+    def __init__(self, deviation, max_seconds=MAX_SECONDS):
+        super().__init__(deviation, max_seconds)
+        # Slopes from the anchor that pass within deviation of every point since it
+        self._low = -math.inf
+        self._high = math.inf
+
+    def _keep(self, point):
+        super()._keep(point)
+        self._low = -math.inf
+        self._high = math.inf
+
+    def _add(self, point):
+        anchor = self._anchor
+        elapsed = point[0] - anchor[0]
+        slope = (point[1] - anchor[1]) / elapsed
+        if not self._low <= slope <= self._high or elapsed > self.max_seconds:
+            # The line to this point would miss a sample in between: the held point ends the segment
+            self._keep_held()
+            anchor = self._anchor
+            elapsed = point[0] - anchor[0]
+        self._low = max(self._low, (point[1] - self.deviation - anchor[1]) / elapsed)
+        self._high = min(self._high, (point[1] + self.deviation - anchor[1]) / elapsed)
+        self._held = point
+
+
+def make_compressor(method, deviation, max_seconds=MAX_SECONDS):
+    """Compressor for method 'deadband' or 'swinging_door'."""
+    if method == 'deadband':
+        return Deadband(deviation, max_seconds)
+    if method == 'swinging_door':
+        return SwingingDoor(deviation, max_seconds)
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def compress_series(timestamps, values, method, deviation, max_seconds=MAX_SECONDS):
+    """Compress a whole series at once; returns the kept (timestamps, values)."""
+    compressor = make_compressor(method, deviation, max_seconds)
+    kept_timestamps, kept_values = compressor.compress(timestamps, values)
+    last_timestamps, last_values = compressor.flush()
+    return np.concatenate([kept_timestamps, last_timestamps]), np.concatenate([kept_values, last_values])
+
+
+def reinterpolate(timestamps, values, grid):
+    """Values at the grid timestamps, linearly interpolated between kept points.
+
+    Grid times before the first or after the last point are NaN, as are
+    those next to a NaN point.
+    """
+    grid_seconds = _epoch_seconds(grid)
+    result = np.full(len(grid_seconds), np.nan)
+    if len(timestamps) == 0:
+        return result
+    seconds = _epoch_seconds(timestamps)
+    inside = (grid_seconds >= seconds[0]) & (grid_seconds <= seconds[-1])
+    result[inside] = np.interp(grid_seconds[inside], seconds, np.asarray(values, dtype=np.float64))
+    return result
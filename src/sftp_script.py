@@ -1,13 +1,27 @@
+import argparse
 import paramiko
 import os
+import stat
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-import pandas as pd
 from datetime import datetime, timedelta
 from logging.handlers import RotatingFileHandler
+import csv_codec
+import csv_store
+import partition_store
+from metrics import RunMetrics
+from run_lock import RunLock
 
 def setup_logging():
     os.makedirs('logs', exist_ok=True)
     logger = logging.getLogger()
+    if logger.handlers:
+        # Already configured, e.g. when running inside the scheduler's pipeline
+        return
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     
@@ -23,134 +37,403 @@ def setup_logging():
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
 
-def check_and_cleanup_stale_lock():
-    try:
-        if not os.path.exists("transfer.lock"):
-            return False
-            
-        with open("transfer.lock", "r") as f:
-            timestamp_str = f.read().strip()
-            lock_time = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
-            
-        if (datetime.now() - lock_time).total_seconds() > 1800:
-            os.remove("transfer.lock")
-            logging.info("Removed stale lock file")
-            return False
-            
-        return True
-    except Exception as e:
-        logging.error(f"Error checking lock file: {e}")
-        if os.path.exists("transfer.lock"):
-            os.remove("transfer.lock")
-        return False
-
-def create_lock_file():
-    with open("transfer.lock", "w") as f:
-        f.write(str(datetime.now()))
-
-def remove_lock_file():
-    try:
-        if os.path.exists("transfer.lock"):
-            os.remove("transfer.lock")
-    except Exception as e:
-        logging.error(f"Error removing lock file: {e}")
+# Held for the whole transfer so runs never overlap; released by the OS if the process dies
+TRANSFER_LOCK = "transfer.lock"
+# Bytes before a remote file's previous end that must be unchanged to transfer only what was appended
+APPEND_CHECK_BYTES = 64
+CSV_HEADER = b"timestamp,value\n"
 
 class HistorianTransfer:
     def __init__(self):
         self.hostname = "your_hostname"
+        self.port = 22
         self.username = "your_username"
         self.password = "your_PASSWORD"
         self.remote_path = r"C:\Users\Administrador\Desktop\PROCESS_SERVER_BACKUP_SCRIPT\historian_exports"
         self.local_path = "/home/mpp/historian_export/historian_exports"
         self.temp_path = "/home/mpp/historian_export/temp"
+        self.retention_days = csv_store.RETENTION_DAYS
+        # Must match STORAGE_FORMAT of the Windows exporter: 'csv' or 'parquet'
+        self.storage_format = "csv"
+        # Parallel SFTP channels over the shared SSH transport
+        self.transfer_workers = 1
+        self.prefetch_requests = 64
+        # Skip remote files whose size and mtime match the last successful transfer
+        self.skip_unchanged = False
+        # With skip_unchanged, download only the bytes appended to a CSV since its last transfer
+        self.resume_appends = False
+        self.manifest_path = os.path.join(self.local_path, "transfer_manifest.json")
+        self._manifest_lock = threading.Lock()
+        # Per-run counters and latencies, written to logs/metrics.jsonl after each transfer
+        self.metrics = RunMetrics("transfer", throughput="bytes_transferred")
         os.makedirs(self.local_path, exist_ok=True)
         os.makedirs(self.temp_path, exist_ok=True)
 
     def merge_csv_files(self, temp_file, local_file):
         try:
             # Read the new data
-            new_data = pd.read_csv(temp_file)
-            new_data['timestamp'] = pd.to_datetime(new_data['timestamp'])
+            with self.metrics.timer("parse_seconds"):
+                new_data = csv_codec.read_csv(temp_file)
+            return self.merge_csv_data(new_data, local_file)
+        except Exception as e:
+            logging.error(f"Error merging files: {e}")
+            # In case of error, keep the existing file
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+
+    def merge_csv_data(self, new_data, local_file):
+        """Merge already-parsed rows into a local per-tag CSV."""
+        try:
+            new_data = csv_codec.to_frame(new_data)
+            self.metrics.add("rows_parsed", len(new_data))
             
-            # If local file exists, merge with existing data
-            if os.path.exists(local_file):
-                existing_data = pd.read_csv(local_file)
-                existing_data['timestamp'] = pd.to_datetime(existing_data['timestamp'])
-                
-                # Concatenate and remove duplicates based on timestamp
-                merged_data = pd.concat([existing_data, new_data]).drop_duplicates(
-                    subset=['timestamp'], 
-                    keep='last'
-                ).sort_values('timestamp')
-                
-                # Keep only last 90 days of data
-                cutoff_date = datetime.now() - timedelta(days=10)
-                merged_data = merged_data[merged_data['timestamp'] > cutoff_date]
-                
-                # Save merged data
-                merged_data.to_csv(local_file, index=False)
-                logging.info(f"Successfully merged data for {os.path.basename(local_file)}")
-            else:
-                # If no existing file, just save the new data
-                new_data.to_csv(local_file, index=False)
+            # Append when the new rows are strictly later, rewrite only on overlap
+            with self.metrics.timer("merge_seconds"):
+                action = csv_store.merge_into_csv(local_file, new_data, self.retention_days)
+            if action == 'created':
                 logging.info(f"Created new file {os.path.basename(local_file)}")
-                
+            else:
+                logging.info(f"Successfully merged data for {os.path.basename(local_file)} ({action})")
+            return True
         except Exception as e:
             logging.error(f"Error merging files: {e}")
-            # In case of error, keep the existing file
+            return False
+
+    def merge_partition_file(self, temp_file, tag_name):
+        """Merge a downloaded day partition into the local partitioned store."""
+        try:
+            with self.metrics.timer("parse_seconds"):
+                new_data = partition_store.read_partition(temp_file)
+            self.metrics.add("rows_parsed", len(new_data))
+            tag_dir = partition_store.tag_directory(self.local_path, tag_name)
+            with self.metrics.timer("merge_seconds"):
+                partition_store.write_partitions(tag_dir, new_data)
+                partition_store.drop_partitions_before(tag_dir, self.retention_days)
+            logging.info(f"Successfully merged partition {os.path.basename(temp_file)} for {tag_name}")
+            return True
+        except Exception as e:
+            logging.error(f"Error merging partition: {e}")
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return False
+
+    def remote_join(self, *parts):
+        """Join remote path components with the Windows separator."""
+        return "\\".join([self.remote_path, *parts])
+
+    def list_remote_files(self, sftp, subdir=None):
+        """Remote files to transfer as (relative name, size, mtime) tuples.
+        
+        CSV layout yields '<tag>.csv' (or '<subdir>/<tag>.csv' when listing a
+        subdirectory); Parquet layout yields '<tag>/<day>.parquet'.
+        """
+        if self.storage_format == "parquet":
+            entries = []
+            for entry in sftp.listdir_attr(self.remote_path):
+                if stat.S_ISDIR(entry.st_mode):
+                    for day_file in sftp.listdir_attr(self.remote_join(entry.filename)):
+                        if day_file.filename.endswith(partition_store.PARTITION_SUFFIX):
+                            entries.append((f"{entry.filename}/{day_file.filename}",
+                                            day_file.st_size, day_file.st_mtime))
+            return entries
+        # Prefer a compressed copy (<tag>.csv.gz / <tag>.csv.zst) over the plain CSV
+        entries = {}
+        remote_dir = self.remote_join(subdir) if subdir else self.remote_path
+        prefix = f"{subdir}/" if subdir else ""
+        for f in sftp.listdir_attr(remote_dir):
+            compression = csv_store.compression_for(f.filename)
+            base_name = f.filename[:-len(csv_store.COMPRESSION_SUFFIXES[compression])] if compression else f.filename
+            if not base_name.endswith('.csv'):
+                continue
+            if compression or base_name not in entries:
+                entries[base_name] = (f"{prefix}{f.filename}", f.st_size, f.st_mtime)
+        return list(entries.values())
+
+    def load_manifest(self):
+        """Size and mtime of each remote file at its last successful transfer."""
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.error(f"Error reading transfer manifest, transferring everything: {e}")
+            return {}
+
+    def save_manifest(self, manifest):
+        with self._manifest_lock:
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+
+    def is_unchanged(self, manifest, name, size, mtime):
+        entry = manifest.get(name)
+        return entry is not None and entry.get("size") == size and entry.get("mtime") == mtime
+
+    def record_transfer(self, manifest, name, size, mtime, tail=None, generation=None):
+        entry = {"size": size, "mtime": mtime}
+        if tail is not None:
+            entry["tail"] = tail.hex()
+        if generation is not None:
+            entry["generation"] = generation
+        with self._manifest_lock:
+            manifest[name] = entry
+
+    def appended_since(self, manifest, name, size, generation=None):
+        """Manifest entry of a remote CSV that has grown since its last transfer, or None.
+        
+        generation is the file's current rewrite marker (see read_remote_generation);
+        a file whose marker changed was rewritten and needs a full transfer.
+        """
+        if not self.resume_appends or self.storage_format == "parquet":
+            return None
+        entry = manifest.get(name)
+        if entry is None or "tail" not in entry or size <= entry["size"]:
+            return None
+        if entry.get("generation") != generation:
+            logging.info(f"{name} was rewritten since its last transfer, transferring it in full")
+            return None
+        return entry
+
+    def read_remote_generation(self, sftp, name):
+        """Rewrite marker of a remote CSV, or None when the exporter writes none.
+        
+        Read before the file itself: the exporter replaces the marker only
+        after a rewrite is in place, so a rewrite racing this transfer shows
+        up as a changed marker on the next run at the latest.
+        """
+        if not self.resume_appends or self.storage_format == "parquet":
+            return None
+        compression = csv_store.compression_for(name)
+        if compression:
+            name = name[:-len(csv_store.COMPRESSION_SUFFIXES[compression])]
+        try:
+            with sftp.open(self.remote_join(*csv_store.generation_path(name).split('/')), 'rb') as remote_fh:
+                return remote_fh.read().decode('ascii')
+        except FileNotFoundError:
+            return None
+
+    def read_remote_tail(self, sftp, name, size):
+        """The last APPEND_CHECK_BYTES bytes of a remote file up to size."""
+        with sftp.open(self.remote_join(*name.split('/')), 'rb') as remote_fh:
+            remote_fh.seek(max(size - APPEND_CHECK_BYTES, 0))
+            return remote_fh.read(min(size, APPEND_CHECK_BYTES))
+
+    def transfer_appended(self, sftp, name, entry, size):
+        """Download and merge only the bytes appended to a remote CSV since its last transfer.
+        
+        The exporter appends strictly later rows to the CSV, and a new gzip
+        member / zstd frame to its compressed copy, so the bytes after the
+        previous end are complete rows on their own. Returns (size, tail) to
+        record in the manifest, or None when the bytes before the previous end
+        changed and it needs a full transfer. This tail check backs up the
+        rewrite marker for exporters that do not write one.
+        """
+        offset = entry["size"]
+        expected = bytes.fromhex(entry["tail"])
+        with self.metrics.timer("download_seconds"), \
+                sftp.open(self.remote_join(*name.split('/')), 'rb') as remote_fh:
+            remote_fh.seek(offset - len(expected))
+            data = remote_fh.read(size - offset + len(expected))
+        if data[:len(expected)] != expected:
+            logging.info(f"{name} was rewritten since its last transfer, transferring it in full")
+            return None
+        data = data[len(expected):]
+        compression = csv_store.compression_for(name)
+        if compression:
+            with csv_store.open_decompressed(io.BytesIO(data), compression) as stream:
+                rows = stream.read()
+            if rows and not rows.endswith(b"\n"):
+                raise ValueError(f"appended data of {name} ends mid-row")
+        else:
+            # The exporter may be appending right now; leave a partial last row for the next run
+            data = data[:data.rfind(b"\n") + 1]
+            rows = data
+        logging.info(f"Transferring {name} ({len(data)} appended bytes)")
+        if rows:
+            with self.metrics.timer("parse_seconds"):
+                new_data = csv_codec.read_csv(io.BytesIO(CSV_HEADER + rows))
+            if not self.merge_csv_data(new_data, self.local_target(name)):
+                raise RuntimeError(f"merging the appended rows of {name} failed")
+        end = offset + len(data)
+        return end, (expected + data)[-APPEND_CHECK_BYTES:]
+
+    def local_target(self, name):
+        """Local per-tag CSV (or partition directory) that a remote file merges into."""
+        if self.storage_format == "parquet":
+            return partition_store.tag_directory(self.local_path, name.split('/')[0])
+        compression = csv_store.compression_for(name)
+        if compression:
+            name = name[:-len(csv_store.COMPRESSION_SUFFIXES[compression])]
+        return os.path.join(self.local_path, name)
+
+    def transfer_file(self, sftp, name):
+        """Download one remote file to the temp directory and merge it locally.
+        
+        Returns True when the merge succeeded.
+        """
+        parts = name.split('/')
+        remote_file = self.remote_join(*parts)
+        compression = csv_store.compression_for(name)
+        if compression:
+            return self.transfer_compressed_file(sftp, name, remote_file, compression)
+        temp_file = os.path.join(self.temp_path, f"temp_{'_'.join(parts)}")
+        try:
+            # Download to temp location first, with pipelined read-ahead
+            logging.info(f"Transferring {name}")
+            with self.metrics.timer("download_seconds"):
+                sftp.get(remote_file, temp_file, max_concurrent_prefetch_requests=self.prefetch_requests)
+            
+            # Merge with existing data
+            if self.storage_format == "parquet":
+                return self.merge_partition_file(temp_file, parts[0])
+            return self.merge_csv_files(temp_file, self.local_target(name))
+        finally:
+            # Clean up temp file
             if os.path.exists(temp_file):
                 os.remove(temp_file)
 
-    def transfer_files(self):
-        if check_and_cleanup_stale_lock():
+    def transfer_compressed_file(self, sftp, name, remote_file, compression):
+        """Stream a compressed CSV, decompressing on the fly without touching disk."""
+        local_file = self.local_target(name)
+        logging.info(f"Transferring {name} (streaming {compression})")
+        # Download, decompression and parsing overlap, so they are timed together
+        with self.metrics.timer("download_seconds"), sftp.open(remote_file, 'rb') as remote_fh:
+            remote_fh.prefetch(max_concurrent_requests=self.prefetch_requests)
+            with csv_store.open_decompressed(remote_fh, compression) as stream:
+                new_data = csv_codec.read_csv(stream)
+        return self.merge_csv_data(new_data, local_file)
+
+    def transfer_tag(self, sftp, entries, manifest, on_tag_ready=None):
+        """Transfer all remote files of one tag; returns how many transferred.
+        
+        on_tag_ready is called with the local target once the tag's files are merged.
+        """
+        transferred_count = 0
+        merged = False
+        start_time = time.time()
+        transferred_bytes = 0
+        for name, size, mtime in entries:
+            try:
+                generation = self.read_remote_generation(sftp, name)
+                entry = self.appended_since(manifest, name, size, generation)
+                appended = self.transfer_appended(sftp, name, entry, size) if entry else None
+                if appended is not None:
+                    end, tail = appended
+                    self.record_transfer(manifest, name, end, mtime, tail, generation)
+                    merged = True
+                    transferred_bytes += end - entry["size"]
+                elif self.transfer_file(sftp, name):
+                    tail = self.read_remote_tail(sftp, name, size) if self.resume_appends else None
+                    self.record_transfer(manifest, name, size, mtime, tail, generation)
+                    merged = True
+                    transferred_bytes += size
+                else:
+                    self.metrics.add("files_failed")
+                transferred_count += 1
+            except Exception as e:
+                self.metrics.add("files_failed")
+                logging.error(f"Error transferring {name}: {e}")
+        self.metrics.add("files_transferred", transferred_count)
+        self.metrics.add("bytes_transferred", transferred_bytes)
+        tag = os.path.basename(self.local_target(entries[0][0]))
+        if tag.endswith(".csv"):
+            tag = tag[:-len(".csv")]
+        self.metrics.record_tag(tag, time.time() - start_time, files=len(entries), bytes=transferred_bytes)
+        if merged and on_tag_ready:
+            on_tag_ready(self.local_target(entries[0][0]))
+        return transferred_count
+
+    def transfer_parallel(self, transport, tag_entries, manifest, on_tag_ready=None):
+        """Transfer tags over several SFTP channels sharing one SSH transport."""
+        local = threading.local()
+        channels = []
+        channels_lock = threading.Lock()
+        
+        def worker(entries):
+            sftp = getattr(local, 'sftp', None)
+            if sftp is None:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                local.sftp = sftp
+                with channels_lock:
+                    channels.append(sftp)
+            return self.transfer_tag(sftp, entries, manifest, on_tag_ready)
+        
+        transferred_count = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.transfer_workers, thread_name_prefix='sftp') as executor:
+                futures = {executor.submit(worker, entries): target for target, entries in tag_entries.items()}
+                for future in as_completed(futures):
+                    try:
+                        transferred_count += future.result()
+                    except Exception as e:
+                        logging.error(f"Error transferring {futures[future]}: {e}")
+        finally:
+            for sftp in channels:
+                try:
+                    sftp.close()
+                except Exception:
+                    pass
+        return transferred_count
+
+    def connect(self):
+        """Open the SSH connection; SFTP channels are opened on its transport."""
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            timeout=30
+        )
+        return ssh
+
+    def transfer_files(self, on_tag_ready=None):
+        """Pull and merge all remote files.
+        
+        on_tag_ready, if given, is called with each tag's local file (or partition
+        directory) as soon as it has been merged, so a consumer can start on it
+        while other tags are still downloading.
+        """
+        lock = RunLock(TRANSFER_LOCK)
+        if not lock.acquire():
             logging.info("Transfer already in progress. Skipping.")
             return
 
-        create_lock_file()
+        self.metrics.reset()
+        ssh = None
         sftp = None
+        manifest = None
 
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(
-                hostname=self.hostname,
-                username=self.username,
-                password=self.password,
-                timeout=30
-            )
+            ssh = self.connect()
             sftp = ssh.open_sftp()
             
-            remote_files = sftp.listdir(self.remote_path)
-            csv_files = [f for f in remote_files if f.endswith('.csv')]
+            remote_files = self.list_remote_files(sftp)
             
-            if not csv_files:
-                logging.warning("No CSV files found in remote directory")
+            if not remote_files:
+                logging.warning(f"No {self.storage_format} files found in remote directory")
                 return
 
-            transferred_count = 0
-            for file in csv_files:
-                try:
-                    remote_file = f"{self.remote_path}\\{file}"
-                    temp_file = os.path.join(self.temp_path, f"temp_{file}")
-                    local_file = os.path.join(self.local_path, file)
-                    
-                    # Download to temp location first
-                    logging.info(f"Transferring {file}")
-                    sftp.get(remote_file, temp_file)
-                    
-                    # Merge with existing file
-                    self.merge_csv_files(temp_file, local_file)
-                    
-                    # Clean up temp file
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                        
-                    transferred_count += 1
-                    
-                except Exception as e:
-                    logging.error(f"Error transferring {file}: {e}")
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
+            manifest = self.load_manifest() if self.skip_unchanged else {}
+            pending = [entry for entry in remote_files if not self.is_unchanged(manifest, *entry)]
+            if len(pending) < len(remote_files):
+                logging.info(f"Skipping {len(remote_files) - len(pending)} unchanged files")
+
+            # Group by local target so all day partitions of a tag travel together
+            tag_entries = {}
+            for entry in pending:
+                tag_entries.setdefault(self.local_target(entry[0]), []).append(entry)
+
+            if self.transfer_workers > 1:
+                transferred_count = self.transfer_parallel(ssh.get_transport(), tag_entries, manifest, on_tag_ready)
+            else:
+                transferred_count = 0
+                for entries in tag_entries.values():
+                    transferred_count += self.transfer_tag(sftp, entries, manifest, on_tag_ready)
 
             logging.info(f"Transfer completed. Processed {transferred_count} files.")
 
@@ -163,18 +446,39 @@ class HistorianTransfer:
                     logging.info("SFTP connection closed")
                 except:
                     pass
+            if ssh:
+                ssh.close()
+            if self.skip_unchanged and manifest is not None:
+                try:
+                    self.save_manifest(manifest)
+                except Exception as e:
+                    logging.error(f"Error saving transfer manifest: {e}")
             # Clean up temp directory
             for file in os.listdir(self.temp_path):
                 try:
                     os.remove(os.path.join(self.temp_path, file))
                 except:
                     pass
-            remove_lock_file()
+            lock.release()
+            self.metrics.finish(logging.info)
 
 def main():
+    parser = argparse.ArgumentParser(description="Pull historian exports over SFTP and merge them locally")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of parallel SFTP channels (default: 1)")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="skip remote files whose size and mtime match the local manifest")
+    parser.add_argument('--resume-appends', action='store_true',
+                        help="download only the rows appended to each CSV since its last transfer "
+                             "(implies --skip-unchanged)")
+    args = parser.parse_args()
+    
     setup_logging()
     logging.info("Starting file transfer")
     transfer = HistorianTransfer()
+    transfer.transfer_workers = max(1, args.workers)
+    transfer.skip_unchanged = args.skip_unchanged or args.resume_appends
+    transfer.resume_appends = args.resume_appends
     transfer.transfer_files()
 
 if __name__ == "__main__":
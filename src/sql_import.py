@@ -1,16 +1,35 @@
-import pyodbc
+import argparse
+import hashlib
 import pandas as pd
+import numpy as np
 import os
 import glob
 import logging
 from datetime import datetime
+from itertools import repeat
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging.handlers import RotatingFileHandler
+from db_backend import SQLServerBackend, SQLServerNarrowBackend
+from watermark_store import WatermarkStore
+from metrics import RunMetrics
+from run_lock import RunLock
+import csv_codec
+import csv_store
+import partition_store
+
+# Held for the whole import so scheduled, manual and file-triggered runs never overlap
+IMPORT_LOCK = "import.lock"
 
 def setup_logging():
     os.makedirs('logs', exist_ok=True)
     logger = logging.getLogger('SQLImporter')
+    if logger.handlers:
+        # Already configured, e.g. by an earlier importer in the same process
+        return logger
     logger.setLevel(logging.INFO)
+    logger.propagate = False
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     file_handler = RotatingFileHandler('logs/sql_import.log', maxBytes=10*1024*1024, backupCount=5)
     file_handler.setFormatter(formatter)
@@ -20,8 +39,77 @@ def setup_logging():
     logger.addHandler(console_handler)
     return logger
 
+def build_insert_params(tag_key, timestamps, values):
+    """Build executemany parameters straight from timestamp/value columns.
+
+    Timestamps are rendered to ISO 8601 strings in one NumPy call and the
+    rows are assembled with zip, so no Python code runs per row. tag_key is
+    the TagName, or the TagId with the narrow schema.
+    """
+    ts = np.datetime_as_string(np.asarray(timestamps, dtype='datetime64[s]'), unit='s')
+    vals = np.asarray(values, dtype=np.float64)
+    return list(zip(repeat(tag_key, len(ts)), ts.tolist(), vals.tolist()))
+
+def build_rollup_params(tag_key, timestamps, values, seconds):
+    """Aggregate rows into (tag_key, bucket, min, max, sum, count) parameters.
+
+    Buckets are seconds wide and aligned to the epoch, so they line up with
+    the intervals of GetTagDataInRange.
+    """
+    epoch_seconds = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+    buckets = epoch_seconds - epoch_seconds % seconds
+    stats = pd.Series(np.asarray(values, dtype=np.float64)).groupby(buckets).agg(['min', 'max', 'sum', 'count'])
+    starts = np.datetime_as_string(stats.index.to_numpy().astype('datetime64[s]'), unit='s')
+    return list(zip(repeat(tag_key, len(stats)), starts.tolist(), stats['min'].tolist(), stats['max'].tolist(),
+                    stats['sum'].tolist(), stats['count'].astype(int).tolist()))
+
+def rollup_range(timestamps, seconds):
+    """[start, end) ISO strings of the whole buckets covering the rows."""
+    epoch_seconds = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+    start = epoch_seconds.min() - epoch_seconds.min() % seconds
+    end = epoch_seconds.max() - epoch_seconds.max() % seconds + seconds
+    bounds = np.array([start, end], dtype='datetime64[s]')
+    return tuple(np.datetime_as_string(bounds, unit='s').tolist())
+
+def block_checksums(timestamps, values, seconds):
+    """Content checksum of the rows in each epoch-aligned block of seconds.
+
+    Returns {block start epoch seconds: hex digest}. Rows are hashed as
+    second-resolution timestamps and float64 values, the form they are
+    stored in, so the same rows hash the same whether read from a file or
+    from the database.
+    """
+    epoch_seconds = np.ascontiguousarray(np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64))
+    # Adding 0.0 turns -0.0 into 0.0 and NaN gets one bit pattern, as drivers may not preserve either
+    vals = np.asarray(values, dtype=np.float64) + 0.0
+    vals[np.isnan(vals)] = np.nan
+    if not len(epoch_seconds):
+        return {}
+    blocks = epoch_seconds - epoch_seconds % seconds
+    starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]])
+    ends = np.r_[starts[1:], len(blocks)]
+    checksums = {}
+    for lo, hi in zip(starts.tolist(), ends.tolist()):
+        digest = hashlib.blake2b(epoch_seconds[lo:hi].tobytes(), digest_size=16)
+        digest.update(vals[lo:hi].tobytes())
+        checksums[int(blocks[lo])] = digest.hexdigest()
+    return checksums
+
+def block_runs(block_starts, seconds):
+    """Merge sorted block starts into contiguous [start, end) epoch second ranges."""
+    runs = []
+    for block_start in block_starts:
+        if runs and runs[-1][1] == block_start:
+            runs[-1][1] = block_start + seconds
+        else:
+            runs.append([block_start, block_start + seconds])
+    return runs
+
+def epoch_iso(epoch_seconds):
+    return np.datetime_as_string(np.datetime64(int(epoch_seconds), 's'), unit='s')
+
 class SQLImporter:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.logger = setup_logging()
         self.conn_str = (
             "DRIVER={ODBC Driver 18 for SQL Server};"
@@ -31,23 +119,187 @@ class SQLImporter:
             "PWD=your_PASSWORD;"
             "TrustServerCertificate=yes"
         )
+        # 'wide' writes TagName per row into TagData (db_setup.sql);
+        # 'narrow' writes TagId rows into TagFacts (sql/narrow_schema.sql)
+        self.schema = "wide"
+        self.backend = backend or self.default_backend()
         self.csv_dir = "/home/mpp/historian_export/historian_exports"
-        self.batch_size = 1000
+        # 'csv' reads <tag>.csv files; 'parquet' reads <tag>/<YYYY-MM-DD>.parquet partitions
+        self.storage_format = "csv"
+        # Local cache of per-tag MAX(Timestamp); resync forces a reload from the database
+        self.watermark_path = os.path.join(self.csv_dir, "watermarks.db")
+        self.resync_watermarks = False
+        self.watermarks = {}
+        self.watermark_store = None
+        self.batch_size = 10000
+        # Commit every N batches; 0 commits once per tag
+        self.commit_batches = 0
+        # 'append' inserts rows newer than the tag watermark;
+        # 'merge' upserts every row through a staging table keyed on (TagName, Timestamp);
+        # 'diff' replaces only the time blocks whose content checksum changed
+        self.ingest_mode = 'append'
+        # Block width for diff mode checksums, a multiple of the rollup bucket widths
+        self.block_seconds = 3600
+        # Keep the 1-minute/1-hour rollup tables up to date as rows are committed
+        self.rollups = True
+        # Number of parallel import workers, each with its own connection
+        self.workers = 1
+        # Skip a tag once it has been imported in this run (backfill imports one tag per day)
+        self.dedupe_tags = True
         self.imported_tags = set()
+        self._active_tags = set()
+        self._tags_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        # TagName -> TagId cache for the narrow schema
+        self.tag_ids = {}
+        # Called as listener(tag_name, first_timestamp, last_timestamp) after each commit
+        self.listeners = []
+        # Per-run counters and latencies, written to logs/metrics.jsonl by finish_run
+        self.metrics = RunMetrics("import", throughput="rows_inserted")
+
+    def default_backend(self):
+        """Production backend for the configured schema."""
+        if self.schema == "narrow":
+            return SQLServerNarrowBackend(self.conn_str)
+        return SQLServerBackend(self.conn_str)
 
     def get_full_tag_name(self, filename):
         """Extract full tag name from filename."""
-        base_name = os.path.basename(filename)
-        # Remove only the .F_CV.csv extension
-        return base_name[:-9] if base_name.endswith('.F_CV.csv') else base_name
+        base_name = os.path.basename(filename.rstrip(os.sep))
+        # Remove only the .F_CV.csv extension (or .F_CV for a partition directory)
+        if base_name.endswith('.F_CV.csv'):
+            return base_name[:-9]
+        return base_name[:-5] if base_name.endswith('.F_CV') else base_name
+
+    def list_tag_sources(self):
+        """Per-tag files (csv) or partition directories (parquet) to import."""
+        if self.storage_format == "parquet":
+            return [entry.path for entry in os.scandir(self.csv_dir) if entry.is_dir()]
+        return glob.glob(os.path.join(self.csv_dir, "*.csv"))
+
+    def read_tag_data(self, path, since=None):
+        """Load a tag's rows; partitioned stores only open days after since, CSVs drop older rows per chunk.
+
+        A CSV is read up to its last complete row, so a row that a running
+        transfer is still appending is left for the next import.
+        """
+        if os.path.isdir(path):
+            return partition_store.read_partitions(path, since)
+        with csv_store.open_complete_rows(path) as f:
+            if since is not None and since > datetime.min:
+                return csv_codec.read_csv_since(f, since)
+            return csv_codec.read_csv(f)
+    
+    def file_is_imported(self, path, watermark):
+        """True when a CSV's last row is not after the watermark, read from the file tail only.
+        
+        Keeps frequent micro-batch runs from parsing the files of tags that did not change.
+        """
+        if os.path.isdir(path) or watermark <= datetime.min:
+            return False
+        last_timestamp = csv_store.read_last_timestamp(path)
+        return last_timestamp is not None and last_timestamp <= watermark
     
     def get_latest_timestamp(self, cursor, tag_name):
         """Get the latest timestamp for a given tag from the database."""
-        query = "SELECT MAX(Timestamp) FROM TagData WHERE TagName = ?"
+        query = self.backend.latest_timestamp_sql
         cursor.execute(query, (tag_name,))
         result = cursor.fetchone()[0]
-        return result or datetime.min
+        return self.backend.to_datetime(result) or datetime.min
     
+    def get_all_latest_timestamps(self, cursor):
+        """Get the latest timestamp of every tag in one grouped query."""
+        cursor.execute(self.backend.all_latest_timestamps_sql)
+        return {tag: self.backend.to_datetime(ts) for tag, ts in cursor.fetchall() if ts is not None}
+
+    def load_watermarks(self):
+        """Preload all tag watermarks from the local cache or, if empty or resyncing, the database."""
+        self.watermark_store = WatermarkStore(self.watermark_path)
+        if self.resync_watermarks:
+            # Recorded block checksums are rebuilt from the database as well
+            self.watermark_store.clear_blocks()
+        if not self.resync_watermarks:
+            self.watermarks = self.watermark_store.load()
+            if self.watermarks:
+                self.logger.info(f"Loaded {len(self.watermarks)} tag watermarks from {self.watermark_path}")
+                return
+        
+        conn = self.backend.connect()
+        try:
+            self.watermarks = self.get_all_latest_timestamps(conn.cursor())
+        finally:
+            conn.close()
+        self.watermark_store.replace_all(self.watermarks)
+        self.logger.info(f"Synchronized {len(self.watermarks)} tag watermarks from the database")
+
+    def start_run(self):
+        """Per-run setup: load watermarks, run the backend's start-of-run SQL and preload TagIds."""
+        self.metrics.reset()
+        # An importer can be reused across runs (arrival imports); dedupe only within one
+        self.imported_tags.clear()
+        self.load_watermarks()
+        if not (self.backend.start_run_sql or self.backend.uses_tag_ids):
+            return
+        conn = self.backend.connect()
+        try:
+            cursor = conn.cursor()
+            if self.backend.start_run_sql:
+                cursor.execute(self.backend.start_run_sql)
+                conn.commit()
+            if self.backend.uses_tag_ids:
+                cursor.execute(self.backend.tag_ids_sql)
+                self.tag_ids = {tag: tag_id for tag, tag_id in cursor.fetchall()}
+                self.logger.info(f"Loaded {len(self.tag_ids)} tag ids")
+        finally:
+            conn.close()
+
+    def get_tag_id(self, conn, cursor, tag_name):
+        """TagId of a tag, adding it to the Tags table on first import."""
+        tag_id = self.tag_ids.get(tag_name)
+        if tag_id is None:
+            cursor.execute(self.backend.ensure_tag_sql, (tag_name,))
+            cursor.execute(self.backend.tag_id_sql, (tag_name,))
+            tag_id = cursor.fetchone()[0]
+            conn.commit()
+            with self._tags_lock:
+                self.tag_ids[tag_name] = tag_id
+        return tag_id
+
+    def block_store(self):
+        """The store of diff mode's block checksums, opened on first use if start_run() was not called."""
+        with self._tags_lock:
+            if self.watermark_store is None:
+                self.watermark_store = WatermarkStore(self.watermark_path)
+            return self.watermark_store
+
+    def get_watermark(self, cursor, tag_name):
+        """Latest imported timestamp for a tag, querying the database only for uncached tags."""
+        watermark = self.watermarks.get(tag_name)
+        if watermark is None:
+            watermark = self.get_latest_timestamp(cursor, tag_name)
+        return watermark
+
+    def update_watermark(self, tag_name, latest_timestamp):
+        """Advance a tag's watermark after its rows are committed."""
+        latest_timestamp = pd.Timestamp(latest_timestamp).to_pydatetime()
+        with self._tags_lock:
+            current = self.watermarks.get(tag_name)
+            if current is None or latest_timestamp > current:
+                self.watermarks[tag_name] = latest_timestamp
+        if self.watermark_store:
+            self.watermark_store.set(tag_name, latest_timestamp)
+
+    def invalidate_watermark(self, tag_name):
+        """Forget a tag's cached watermark so the next run asks the database."""
+        with self._tags_lock:
+            self.watermarks.pop(tag_name, None)
+        if self.watermark_store:
+            try:
+                self.watermark_store.forget(tag_name)
+            except Exception as e:
+                self.logger.error(f"Error invalidating watermark for {tag_name}: {e}")
+
     def is_tag_imported(self, tag_name):
         """Check if tag has already been imported."""
         return tag_name in self.imported_tags
@@ -56,89 +308,437 @@ class SQLImporter:
         """Mark tag as imported."""
         self.imported_tags.add(tag_name)
 
+    def claim_tag(self, tag_name):
+        """Reserve a tag for import; False if already imported or in flight."""
+        with self._tags_lock:
+            if (self.dedupe_tags and self.is_tag_imported(tag_name)) or tag_name in self._active_tags:
+                return False
+            self._active_tags.add(tag_name)
+            return True
+
+    def release_tag(self, tag_name, imported):
+        """Release a claimed tag, marking it imported on success."""
+        with self._tags_lock:
+            self._active_tags.discard(tag_name)
+            if imported:
+                self.add_imported_tag(tag_name)
+
+    def get_worker_connection(self):
+        """Return the calling worker's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.backend.connect()
+            self._local.conn = conn
+            with self._tags_lock:
+                self._connections.append(conn)
+        return conn
+
+    def discard_worker_connection(self):
+        """Drop the calling worker's connection so the next tag reconnects."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._tags_lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_worker_connections(self):
+        with self._tags_lock:
+            connections, self._connections = self._connections, []
+            # Forget every thread's reference, so a later run reconnects instead of using a closed connection
+            self._local = threading.local()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def apply_staging(self, cursor):
+        """Upsert everything in the staging table into the fact table and empty it."""
+        cursor.execute(self.backend.apply_staging_sql)
+        cursor.execute(self.backend.clear_staging_sql)
+
+    def update_rollups(self, cursor, tag_key, timestamps, values, rebuild):
+        """Bring the rollup buckets touched by these rows up to date.
+        
+        Appended rows are new, so their per-bucket aggregates are computed here
+        and combined into the stored buckets. Merged rows may replace existing
+        values, so their buckets are rebuilt from the raw table instead.
+        """
+        backend = self.backend
+        sql_args = {'key': backend.key_column, 'key_type': backend.key_type, 'facts': backend.fact_table}
+        if rebuild:
+            for seconds, table in backend.rollup_tables.items():
+                params = (tag_key, *rollup_range(timestamps, seconds))
+                cursor.execute(backend.delete_rollups_sql.format(table=table, **sql_args), params)
+                cursor.execute(backend.rebuild_rollups_sql.format(table=table, seconds=seconds, **sql_args), params)
+            return
+        cursor.execute(backend.create_rollup_staging_sql.format(**sql_args))
+        cursor.execute(backend.clear_rollup_staging_sql)
+        for seconds, table in backend.rollup_tables.items():
+            cursor.executemany(backend.load_rollup_staging_sql.format(**sql_args),
+                               build_rollup_params(tag_key, timestamps, values, seconds))
+            cursor.execute(backend.apply_rollup_sql.format(table=table, **sql_args))
+            cursor.execute(backend.clear_rollup_staging_sql)
+
+    def find_changed_blocks(self, cursor, tag_name, df):
+        """Compare a tag file's block checksums with those of the imported rows.
+        
+        Returns (checksums, ranges, rows): the file's checksums to record
+        (None when the recorded ones are already equal), the [start, end)
+        epoch second ranges to replace and the file rows inside them. Blocks
+        without a recorded checksum that the database may already hold are
+        hashed from the database once. Only blocks present in the file are
+        compared, and the first block is clipped at the file's first row, as
+        retention may have trimmed rows that the database keeps.
+        """
+        seconds = self.block_seconds
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+        values = df['value'].to_numpy(dtype=np.float64)
+        checksums = block_checksums(timestamps, values, seconds)
+        if not checksums:
+            return None, [], df
+        first = int(timestamps[0].astype('datetime64[s]').astype(np.int64))
+        stored = self.block_store().load_blocks(tag_name)
+        recorded = {block: stored[block] for block in checksums if block in stored}
+        
+        watermark = self.get_watermark(cursor, tag_name)
+        watermark_epoch = (watermark - datetime(1970, 1, 1)).total_seconds()
+        unrecorded = [block for block in checksums if block not in recorded and block <= watermark_epoch]
+        if unrecorded:
+            recorded.update(self.database_block_checksums(cursor, tag_name, max(min(unrecorded), first),
+                                                          max(unrecorded) + seconds, unrecorded))
+        
+        changed = sorted(block for block, checksum in checksums.items() if recorded.get(block) != checksum)
+        self.metrics.add("blocks_checked", len(checksums))
+        self.metrics.add("blocks_changed", len(changed))
+        ranges = block_runs(changed, seconds)
+        if ranges and ranges[0][0] < first:
+            ranges[0][0] = first
+        epoch_seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+        rows = df[np.isin(epoch_seconds - epoch_seconds % seconds, changed)]
+        return (checksums if checksums != stored else None), ranges, rows
+
+    def database_block_checksums(self, cursor, tag_name, start, end, blocks):
+        """Checksums of the given blocks computed from the rows stored in [start, end)."""
+        backend = self.backend
+        if backend.uses_tag_ids:
+            tag_key = self.tag_ids.get(tag_name)
+            if tag_key is None:
+                return {}
+        else:
+            tag_key = tag_name
+        sql = backend.checksum_rows_sql.format(key=backend.key_column, facts=backend.fact_table)
+        with self.metrics.timer("db_roundtrip_seconds"):
+            cursor.execute(sql, (tag_key, epoch_iso(start), epoch_iso(end)))
+            rows = cursor.fetchall()
+        if not rows:
+            return {}
+        timestamps = pd.to_datetime(pd.Series([row[0] for row in rows])).to_numpy(dtype='datetime64[ns]')
+        values = np.array([row[1] for row in rows], dtype=np.float64)
+        checksums = block_checksums(timestamps, values, self.block_seconds)
+        return {block: checksums[block] for block in blocks if block in checksums}
+
+    def replace_blocks(self, conn, cursor, tag_name, df, ranges):
+        """Replace the stored rows of each [start, end) epoch second range with the file's rows.
+        
+        The deletes, inserts and the rollup rebuild of the ranges are committed
+        in one transaction, so a failure leaves the blocks as they were.
+        """
+        backend = self.backend
+        tag_key = self.get_tag_id(conn, cursor, tag_name) if backend.uses_tag_ids else tag_name
+        delete_sql = backend.delete_range_sql.format(key=backend.key_column, facts=backend.fact_table)
+        backend.prepare_cursor(cursor)
+        for start, end in ranges:
+            with self.metrics.timer("db_roundtrip_seconds"):
+                cursor.execute(delete_sql, (tag_key, epoch_iso(start), epoch_iso(end)))
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+        values = df['value'].to_numpy(dtype=np.float64)
+        for i in range(0, len(timestamps), self.batch_size):
+            params = build_insert_params(tag_key, timestamps[i:i + self.batch_size],
+                                         values[i:i + self.batch_size])
+            with self.metrics.timer("db_roundtrip_seconds"):
+                cursor.executemany(backend.insert_sql, params)
+        if self.rollups:
+            # Rebuild whole ranges, including buckets whose rows were all removed
+            with self.metrics.timer("db_rollup_seconds"):
+                for start, end in ranges:
+                    bounds = np.array([start, end - 1], dtype='datetime64[s]')
+                    self.update_rollups(cursor, tag_key, bounds, None, rebuild=True)
+        with self.metrics.timer("db_commit_seconds"):
+            conn.commit()
+        for start, end in ranges:
+            self.notify_listeners(tag_name, np.datetime64(start, 's'), np.datetime64(end - 1, 's'))
+
+    def add_listener(self, listener):
+        """Register a callback run after rows of a tag are committed (e.g. TagReader.invalidate)."""
+        self.listeners.append(listener)
+
+    def notify_listeners(self, tag_name, first_timestamp, last_timestamp):
+        for listener in self.listeners:
+            try:
+                listener(tag_name, first_timestamp, last_timestamp)
+            except Exception as e:
+                self.logger.error(f"Import listener failed for {tag_name}: {e}")
+
+    def insert_frame(self, conn, cursor, tag_name, df, start_time):
+        """Insert a tag's rows in batches, committing per commit_batches.
+        
+        In merge mode the batches are bulk-loaded into the staging table and
+        applied with one set-based upsert per commit. Rollups of the committed
+        rows are updated in the same transaction.
+        """
+        merge = self.ingest_mode == 'merge'
+        tag_key = self.get_tag_id(conn, cursor, tag_name) if self.backend.uses_tag_ids else tag_name
+        self.backend.prepare_cursor(cursor)
+        if merge:
+            cursor.execute(self.backend.create_staging_sql)
+            cursor.execute(self.backend.clear_staging_sql)
+            insert_sql = self.backend.load_staging_sql
+        else:
+            insert_sql = self.backend.insert_sql
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+        values = df['value'].to_numpy(dtype=np.float64)
+        total_rows = len(timestamps)
+        pending_batches = 0
+        committed_rows = 0
+        
+        def commit(upto):
+            if merge:
+                with self.metrics.timer("db_merge_seconds"):
+                    self.apply_staging(cursor)
+            if self.rollups:
+                with self.metrics.timer("db_rollup_seconds"):
+                    self.update_rollups(cursor, tag_key, timestamps[committed_rows:upto],
+                                        values[committed_rows:upto], rebuild=merge)
+            with self.metrics.timer("db_commit_seconds"):
+                conn.commit()
+            if upto > committed_rows:
+                self.notify_listeners(tag_name, timestamps[committed_rows], timestamps[upto - 1])
+        
+        for i in range(0, total_rows, self.batch_size):
+            params = build_insert_params(tag_key, timestamps[i:i + self.batch_size],
+                                         values[i:i + self.batch_size])
+            with self.metrics.timer("db_roundtrip_seconds"):
+                cursor.executemany(insert_sql, params)
+            pending_batches += 1
+            
+            if self.commit_batches and pending_batches >= self.commit_batches:
+                rows_processed = min(i + self.batch_size, total_rows)
+                commit(rows_processed)
+                pending_batches = 0
+                committed_rows = rows_processed
+                speed = rows_processed / (time.time() - start_time)
+                self.logger.info(f"Progress: {rows_processed}/{total_rows} rows - Speed: {speed:.1f} rows/sec")
+        
+        if pending_batches:
+            commit(total_rows)
+
     def import_file(self, file_path, conn, file_number, total_files):
+        tag_name = None
+        claimed = False
+        imported = False
+        inserting = False
         try:
             tag_name = self.get_full_tag_name(file_path)
             
-            # Skip if this tag has already been imported
-            if self.is_tag_imported(tag_name):
+            # Skip if this tag has already been imported (or another worker has it)
+            if not self.claim_tag(tag_name):
                 self.logger.info(f"Skipping duplicate tag file: {tag_name}")
                 return True
+            claimed = True
             
             start_time = time.time()
-            df = pd.read_csv(file_path)
             cursor = conn.cursor()
             
-            # Convert timestamp column
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            
-            # Get latest timestamp for this tag
-            latest_timestamp = self.get_latest_timestamp(cursor, tag_name)
-            
-            # Filter for new records only (after the latest timestamp in database)
-            df = df[df['timestamp'] > latest_timestamp]
+            checksums = replace_ranges = None
+            if self.ingest_mode == 'merge':
+                # Every row is upserted, so the file only needs to be unique per timestamp
+                with self.metrics.timer("parse_seconds"):
+                    df = self.read_tag_data(file_path)
+                self.metrics.add("rows_parsed", len(df))
+                df = df.drop_duplicates(subset='timestamp', keep='last')
+            elif self.ingest_mode == 'diff':
+                # Only the rows of blocks whose checksum differs from the imported one
+                with self.metrics.timer("parse_seconds"):
+                    df = self.read_tag_data(file_path)
+                self.metrics.add("rows_parsed", len(df))
+                df = df.drop_duplicates(subset='timestamp', keep='last').sort_values('timestamp')
+                checksums, replace_ranges, df = self.find_changed_blocks(cursor, tag_name, df)
+            else:
+                # Get latest timestamp for this tag
+                latest_timestamp = self.get_watermark(cursor, tag_name)
+                
+                # Filter for new records only (after the latest timestamp in database)
+                if self.file_is_imported(file_path, latest_timestamp):
+                    df = csv_codec.empty_frame()
+                else:
+                    with self.metrics.timer("parse_seconds"):
+                        df = self.read_tag_data(file_path, latest_timestamp)
+                    self.metrics.add("rows_parsed", len(df))
+                    df = df[df['timestamp'] > latest_timestamp]
             
             if len(df) == 0:
+                if checksums is not None:
+                    # Unchanged, but checksums were read from the database or pruned
+                    self.block_store().set_blocks(tag_name, checksums)
                 self.logger.info(f"No new data found for {tag_name}")
                 return True
 
             total_rows = len(df)
-            self.logger.info(f"Found {total_rows} new records for {tag_name}")
+            if replace_ranges is not None:
+                self.logger.info(f"Found {total_rows} records in {len(replace_ranges)} changed block ranges for {tag_name}")
+            else:
+                self.logger.info(f"Found {total_rows} {'records to merge' if self.ingest_mode == 'merge' else 'new records'} for {tag_name}")
             
-            # Direct insert of records
-            insert_sql = "INSERT INTO TagData (TagName, Timestamp, Value) VALUES (?, ?, ?)"
-            cursor.fast_executemany = True
-            
-            for i in range(0, len(df), self.batch_size):
-                batch = df.iloc[i:i + self.batch_size]
-                values = [(tag_name, row['timestamp'].strftime('%Y-%m-%d %H:%M:%S'), float(row['value']))
-                         for _, row in batch.iterrows()]
-                cursor.executemany(insert_sql, values)
-                conn.commit()
-                
-                rows_processed = i + len(batch)
-                if rows_processed % self.batch_size == 0:
-                    speed = rows_processed / (time.time() - start_time)
-                    self.logger.info(f"Progress: {rows_processed}/{total_rows} rows - Speed: {speed:.1f} rows/sec")
+            # Columnar insert of records
+            inserting = True
+            if replace_ranges is not None:
+                self.replace_blocks(conn, cursor, tag_name, df, replace_ranges)
+                self.block_store().set_blocks(tag_name, checksums)
+            else:
+                self.insert_frame(conn, cursor, tag_name, df, start_time)
+            self.update_watermark(tag_name, df['timestamp'].max())
+            inserting = False
             
             # Mark this tag as imported
-            self.add_imported_tag(tag_name)
+            imported = True
             
             elapsed_time = time.time() - start_time
-            self.logger.info(f"Completed importing {total_rows} records in {elapsed_time:.1f} seconds")
+            speed = total_rows / elapsed_time if elapsed_time > 0 else 0.0
+            self.metrics.add("rows_inserted", total_rows)
+            self.metrics.add("tags_imported")
+            self.metrics.record_tag(tag_name, elapsed_time, rows=total_rows)
+            self.logger.info(f"Completed importing {total_rows} records in {elapsed_time:.1f} seconds - Speed: {speed:.1f} rows/sec")
             return True
             
         except Exception as e:
             self.logger.error(f"Error importing {file_path}: {e}")
+            self.metrics.add("tags_failed")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            if inserting:
+                # Some batches may already be committed; let the database decide next time
+                self.invalidate_watermark(tag_name)
+            return False
+        finally:
+            if claimed:
+                self.release_tag(tag_name, imported)
+
+    def import_source(self, file_path, file_number=0, total_files=0):
+        """Import one tag source on the calling thread's own worker connection."""
+        try:
+            conn = self.get_worker_connection()
+        except Exception as e:
+            self.logger.error(f"Error connecting worker for {file_path}: {e}")
             return False
+        success = self.import_file(file_path, conn, file_number, total_files)
+        if not success:
+            # The failure may have left the connection unusable
+            self.discard_worker_connection()
+        return success
+
+    def import_parallel(self, files, start_time):
+        """Import files on a bounded pool of workers, one connection each."""
+        total_files = len(files)
+        successful_imports = 0
+        completed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='import') as executor:
+                futures = [executor.submit(self.import_source, file, i, total_files)
+                           for i, file in enumerate(files, 1)]
+                for future in as_completed(futures):
+                    completed += 1
+                    if future.result():
+                        successful_imports += 1
+                    elapsed = time.time() - start_time
+                    self.logger.info(f"Overall Progress: {completed}/{total_files} files ({(completed/total_files)*100:.1f}%) - Elapsed time: {elapsed/60:.1f} minutes")
+        finally:
+            self.close_worker_connections()
+        return successful_imports
 
-    def import_all(self):
+    def import_all(self, paths=None):
+        """Import every tag source in csv_dir, or only the given paths.
+        
+        Returns False without importing while another import holds IMPORT_LOCK.
+        """
+        lock = RunLock(IMPORT_LOCK)
+        if not lock.acquire():
+            self.logger.info("Import already in progress. Skipping.")
+            return False
         try:
             start_time = time.time()
             self.logger.info("Starting import process")
-            conn = pyodbc.connect(self.conn_str)
             
-            # Get all CSV files
-            files = glob.glob(os.path.join(self.csv_dir, "*.csv"))
+            # Get all per-tag files
+            files = self.list_tag_sources() if paths is None else list(paths)
             total_files = len(files)
-            self.logger.info(f"Found {total_files} CSV files to process")
+            self.logger.info(f"Found {total_files} {self.storage_format} tag sources to process")
             
-            successful_imports = 0
-            for i, file in enumerate(files, 1):
-                success = self.import_file(file, conn, i, total_files)
-                if success:
-                    successful_imports += 1
-                elapsed = time.time() - start_time
-                self.logger.info(f"Overall Progress: {i}/{total_files} files ({(i/total_files)*100:.1f}%) - Elapsed time: {elapsed/60:.1f} minutes")
+            self.start_run()
+            
+            if self.workers > 1:
+                self.logger.info(f"Importing with {self.workers} parallel workers")
+                successful_imports = self.import_parallel(files, start_time)
+            else:
+                conn = self.backend.connect()
+                successful_imports = 0
+                for i, file in enumerate(files, 1):
+                    success = self.import_file(file, conn, i, total_files)
+                    if success:
+                        successful_imports += 1
+                    elapsed = time.time() - start_time
+                    self.logger.info(f"Overall Progress: {i}/{total_files} files ({(i/total_files)*100:.1f}%) - Elapsed time: {elapsed/60:.1f} minutes")
+                conn.close()
             
             total_time = time.time() - start_time
             self.logger.info(f"Import completed: {successful_imports}/{total_files} files imported successfully in {total_time/60:.1f} minutes")
-            conn.close()
         except Exception as e:
             self.logger.error(f"Error in import_all: {e}")
+        finally:
+            self.finish_run()
+            lock.release()
+        return True
+
+    def finish_run(self):
+        """Close worker connections and the watermark store, and write the run metrics."""
+        self.close_worker_connections()
+        if self.watermark_store:
+            self.watermark_store.close()
+            self.watermark_store = None
+        self.metrics.finish(self.logger.info)
 
 def main():
+    parser = argparse.ArgumentParser(description="Import historian CSV exports into SQL Server")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of parallel import workers (default: 1)")
+    parser.add_argument('--mode', choices=['append', 'merge', 'diff'], default='append',
+                        help="append rows newer than the watermark, upsert all rows via a staging table, "
+                             "or replace only time blocks whose checksum changed")
+    parser.add_argument('--storage-format', choices=['csv', 'parquet'], default='csv',
+                        help="layout of the local export directory")
+    parser.add_argument('--schema', choices=['wide', 'narrow'], default='wide',
+                        help="TagData with TagName per row, or the Tags/TagFacts schema")
+    parser.add_argument('--resync-watermarks', action='store_true',
+                        help="reload tag watermarks (and diff mode block checksums) from the database "
+                             "instead of the local cache")
+    args = parser.parse_args()
+    
     importer = SQLImporter()
+    importer.workers = max(1, args.workers)
+    importer.resync_watermarks = args.resync_watermarks
+    importer.ingest_mode = args.mode
+    importer.storage_format = args.storage_format
+    if args.schema != importer.schema:
+        importer.schema = args.schema
+        importer.backend = importer.default_backend()
     importer.import_all()
 
 if __name__ == "__main__":
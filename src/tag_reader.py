@@ -0,0 +1,313 @@
+"""Read API for imported tag data, with downsampling and a block cache.
+
+TagReader returns a tag's samples for a time range as NumPy arrays:
+
+    reader = TagReader(importer.backend)
+    importer.add_listener(reader.invalidate)
+
+    timestamps, values = reader.read_series("PLANT.FLOW01", start, end, points=1000)
+    buckets = reader.read_buckets("PLANT.FLOW01", start, end, interval=3600)
+    timestamps, values = reader.read_interpolated("PLANT.FLOW01", start, end, interval=5)
+
+Data is fetched in blocks aligned to fixed time boundaries. Raw samples use
+6-hour blocks, 1-minute rollups daily blocks and 1-hour rollups 30-day blocks.
+Blocks are kept in an LRU cache keyed by (tag, resolution, block start), so
+repeated chart queries over the same ranges are served without touching the
+database. When the reader is registered as an importer listener, blocks that
+an import writes into are evicted as soon as the rows are committed.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import series_compression
+
+# Block width in seconds per resolution ('raw' samples or rollup bucket seconds)
+BLOCK_SECONDS = {'raw': 6 * 3600, 60: 86400, 3600: 30 * 86400}
+# Cache capacity in cached rows across all blocks
+CACHE_MAX_ROWS = 2000000
+# How far outside a range read_interpolated looks for the stored points around its edges;
+# matches the exporter's COMPRESSION_MAX_SECONDS
+INTERPOLATION_WINDOW_SECONDS = series_compression.MAX_SECONDS
+
+
+def to_epoch_seconds(value):
+    return int(pd.Timestamp(value).value // 10**9)
+
+
+def _iso(epoch_seconds):
+    return np.datetime_as_string(np.datetime64(int(epoch_seconds), 's'), unit='s')
+
+
+def _empty_columns(width):
+    return (np.empty(0, dtype='datetime64[ns]'),) + tuple(np.empty(0) for _ in range(width - 1))
+
+
+def lttb(timestamps, values, points):
+    """Largest-Triangle-Three-Buckets downsampling to at most points samples.
+
+    Keeps the first and last sample and, from each bucket in between, the
+    sample forming the largest triangle with its neighbours, which preserves
+    the visual shape of the series.
+    """
+    n = len(values)
+    if points >= n or points < 3:
+        return timestamps, values
+    x = timestamps.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    y = values
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        # Average of the next bucket is the third triangle point
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs((x[previous] - avg_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return timestamps[selected], values[selected]
+
+
+class TagReader:
+    """Range reads of raw samples and rollups through an LRU block cache."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            from sql_import import SQLImporter
+            backend = SQLImporter().backend
+        self.backend = backend
+        # Read 1-minute/1-hour buckets from the rollup tables when possible
+        self.use_rollups = True
+        self.max_rows = CACHE_MAX_ROWS
+        # Seconds a cached block stays valid; None keeps it until evicted or
+        # invalidated (use a TTL when the importer runs in another process)
+        self.block_ttl = None
+        self.interpolation_window = INTERPOLATION_WINDOW_SECONDS
+        self._blocks = OrderedDict()
+        self._rows = 0
+        # Bumped by invalidate, so a block fetched before an invalidation is not cached
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._tag_ids = {}
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _cursor(self):
+        if self._conn is None:
+            self._conn = self.backend.connect()
+        return self._conn.cursor()
+
+    def _tag_key(self, cursor, tag_name):
+        """TagName, or its TagId with the narrow schema (None if the tag is unknown)."""
+        if not self.backend.uses_tag_ids:
+            return tag_name
+        if tag_name not in self._tag_ids:
+            cursor.execute(self.backend.tag_id_sql, (tag_name,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            self._tag_ids[tag_name] = row[0]
+        return self._tag_ids[tag_name]
+
+    def _query(self, tag_name, resolution, start, end):
+        """Fetch [start, end) epoch seconds as a tuple of column arrays (timestamps first)."""
+        backend = self.backend
+        sql_args = {'key': backend.key_column, 'facts': backend.fact_table}
+        if resolution == 'raw':
+            sql = backend.read_samples_sql.format(**sql_args)
+            width = 2
+        else:
+            sql = backend.read_rollups_sql.format(table=backend.rollup_tables[resolution], **sql_args)
+            width = 5
+        with self._db_lock:
+            cursor = self._cursor()
+            tag_key = self._tag_key(cursor, tag_name)
+            rows = []
+            if tag_key is not None:
+                cursor.execute(sql, (tag_key, _iso(start), _iso(end)))
+                rows = cursor.fetchall()
+            self._conn.commit()
+        if not rows:
+            return _empty_columns(width)
+        columns = list(zip(*rows))
+        timestamps = pd.to_datetime(pd.Series(columns[0])).to_numpy(dtype='datetime64[ns]')
+        return (timestamps,) + tuple(np.asarray(column, dtype=np.float64) for column in columns[1:])
+
+    def _get_blocks(self, tag_name, resolution, start, end):
+        """Column arrays for [start, end) epoch seconds, assembled from cached blocks."""
+        if start >= end:
+            return _empty_columns(2 if resolution == 'raw' else 5)
+        width = BLOCK_SECONDS[resolution]
+        first = start - start % width
+        block_starts = list(range(first, end, width))
+        now = time.time()
+        found = {}
+        with self._lock:
+            generation = self._generations.get(tag_name, 0)
+            for block_start in block_starts:
+                key = (tag_name, resolution, block_start)
+                entry = self._blocks.get(key)
+                if entry is not None and (self.block_ttl is None or now - entry[0] < self.block_ttl):
+                    self._blocks.move_to_end(key)
+                    found[block_start] = entry[1]
+            missing = [b for b in block_starts if b not in found]
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        # Fetch each run of consecutive missing blocks with one query
+        runs = []
+        for block_start in missing:
+            if runs and runs[-1][1] == block_start:
+                runs[-1][1] = block_start + width
+            else:
+                runs.append([block_start, block_start + width])
+        for run_start, run_end in runs:
+            columns = self._query(tag_name, resolution, run_start, run_end)
+            seconds = columns[0].astype('datetime64[s]').astype(np.int64)
+            for block_start in range(run_start, run_end, width):
+                lo, hi = np.searchsorted(seconds, [block_start, block_start + width])
+                block = tuple(column[lo:hi].copy() for column in columns)
+                found[block_start] = block
+                self._store((tag_name, resolution, block_start), block, generation)
+
+        blocks = [found[b] for b in block_starts]
+        columns = tuple(np.concatenate(parts) for parts in zip(*blocks))
+        seconds = columns[0].astype('datetime64[s]').astype(np.int64)
+        lo, hi = np.searchsorted(seconds, [start, end])
+        return tuple(column[lo:hi] for column in columns)
+
+    def _store(self, key, block, generation):
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                # Invalidated while it was being fetched; it may predate the import
+                return
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self._rows -= len(old[1][0])
+            self._blocks[key] = (time.time(), block)
+            self._rows += len(block[0])
+            while self._rows > self.max_rows and len(self._blocks) > 1:
+                _, (_, evicted) = self._blocks.popitem(last=False)
+                self._rows -= len(evicted[0])
+
+    def invalidate(self, tag_name, first_timestamp=None, last_timestamp=None):
+        """Evict a tag's blocks overlapping [first, last], or all of them.
+
+        Matches the SQLImporter listener signature.
+        """
+        first = to_epoch_seconds(first_timestamp) if first_timestamp is not None else None
+        last = to_epoch_seconds(last_timestamp) if last_timestamp is not None else None
+        with self._lock:
+            self._generations[tag_name] = self._generations.get(tag_name, 0) + 1
+            for key in list(self._blocks):
+                tag, resolution, block_start = key
+                if tag != tag_name:
+                    continue
+                block_end = block_start + BLOCK_SECONDS[resolution]
+                if (first is None or block_end > first) and (last is None or block_start <= last):
+                    _, block = self._blocks.pop(key)
+                    self._rows -= len(block[0])
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._rows = 0
+
+    def read_raw(self, tag_name, start, end):
+        """Raw samples in [start, end) as (timestamps, values) arrays."""
+        timestamps, values = self._get_blocks(tag_name, 'raw', to_epoch_seconds(start), to_epoch_seconds(end))
+        return timestamps, values
+
+    def read_interpolated(self, tag_name, start, end, interval):
+        """Values every interval seconds from start up to end, interpolated linearly.
+
+        Rebuilds a regular series from the points kept by deadband or
+        swinging-door compression in the exporter, within the deviation it
+        was compressed with. Grid times outside the stored points are NaN.
+        """
+        start, end = to_epoch_seconds(start), to_epoch_seconds(end)
+        timestamps, values = self._get_blocks(tag_name, 'raw', start - self.interpolation_window,
+                                              end + self.interpolation_window)
+        grid = np.arange(start, end, interval, dtype=np.int64).astype('datetime64[s]').astype('datetime64[ns]')
+        return grid, series_compression.reinterpolate(timestamps, values, grid)
+
+    def read_buckets(self, tag_name, start, end, interval):
+        """Aggregate [start, end) into epoch-aligned buckets of interval seconds.
+
+        Returns a dict of arrays: timestamp (bucket start), min, max, mean and
+        count. When interval is a multiple of a rollup width, whole rollup
+        buckets come from the rollup tables and only the partial buckets at
+        the edges are computed from raw samples.
+        """
+        start, end = to_epoch_seconds(start), to_epoch_seconds(end)
+        resolution = None
+        if self.use_rollups:
+            for seconds in sorted(self.backend.rollup_tables, reverse=True):
+                if interval % seconds == 0:
+                    resolution = seconds
+                    break
+        parts = []
+        raw_ranges = [(start, end)]
+        if resolution is not None:
+            roll_start = -(-start // resolution) * resolution
+            roll_end = end - end % resolution
+            if roll_start < roll_end:
+                parts.append(self._get_blocks(tag_name, resolution, roll_start, roll_end))
+                raw_ranges = [(start, roll_start), (roll_end, end)]
+        for raw_start, raw_end in raw_ranges:
+            if raw_start < raw_end:
+                timestamps, values = self._get_blocks(tag_name, 'raw', raw_start, raw_end)
+                parts.append((timestamps, values, values, values, np.ones(len(values))))
+        if not parts:
+            # An empty range: no buckets
+            parts.append(_empty_columns(5))
+
+        timestamps, mins, maxs, sums, counts = (np.concatenate(column) for column in zip(*parts))
+        seconds = timestamps.astype('datetime64[s]').astype(np.int64)
+        frame = pd.DataFrame({'bucket': seconds - seconds % interval, 'min': mins, 'max': maxs,
+                              'sum': sums, 'count': counts})
+        stats = frame.groupby('bucket', sort=True).agg({'min': 'min', 'max': 'max', 'sum': 'sum', 'count': 'sum'})
+        return {
+            'timestamp': stats.index.to_numpy().astype('datetime64[s]').astype('datetime64[ns]'),
+            'min': stats['min'].to_numpy(),
+            'max': stats['max'].to_numpy(),
+            'mean': (stats['sum'] / stats['count']).to_numpy(),
+            'count': stats['count'].to_numpy().astype(np.int64),
+        }
+
+    def read_series(self, tag_name, start, end, points=None, method='lttb'):
+        """A tag's series in [start, end), downsampled to about points samples.
+
+        method 'lttb' picks representative raw samples; 'bucket' returns
+        bucket means over intervals rounded up to whole minutes or hours so the
+        rollup tables can serve them.
+        """
+        if points is not None and method == 'bucket':
+            span = to_epoch_seconds(end) - to_epoch_seconds(start)
+            interval = max(1, -(-span // points))
+            for seconds in sorted(self.backend.rollup_tables, reverse=True):
+                if interval >= seconds:
+                    interval = -(-interval // seconds) * seconds
+                    break
+            buckets = self.read_buckets(tag_name, start, end, interval)
+            return buckets['timestamp'], buckets['mean']
+        timestamps, values = self.read_raw(tag_name, start, end)
+        if points is None:
+            return timestamps, values
+        return lttb(timestamps, values, points)
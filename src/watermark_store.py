@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class WatermarkStore:
+    """Local, transactional cache of the latest imported timestamp per tag.
+
+    Backed by a small SQLite file so a run can start without asking the
+    database for MAX(Timestamp) of every tag. The same file keeps the
+    per-block content checksums of the rows imported in diff mode.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks ("
+                "tag_name TEXT PRIMARY KEY, "
+                "latest_timestamp TEXT NOT NULL, "
+                "updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS block_checksums ("
+                "tag_name TEXT NOT NULL, "
+                "block_start INTEGER NOT NULL, "
+                "checksum TEXT NOT NULL, "
+                "PRIMARY KEY (tag_name, block_start)) WITHOUT ROWID"
+            )
+
+    def load(self):
+        """Return all cached watermarks as {tag_name: datetime}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT tag_name, latest_timestamp FROM watermarks").fetchall()
+        return {tag: datetime.fromisoformat(ts) for tag, ts in rows}
+
+    def replace_all(self, watermarks):
+        """Replace the whole cache in one transaction."""
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM watermarks")
+            self._conn.executemany(
+                "INSERT INTO watermarks (tag_name, latest_timestamp, updated_at) VALUES (?, ?, ?)",
+                [(tag, ts.isoformat(), now) for tag, ts in watermarks.items()]
+            )
+
+    def set(self, tag_name, latest_timestamp):
+        """Record a tag's new watermark; never moves it backwards."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO watermarks (tag_name, latest_timestamp, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(tag_name) DO UPDATE SET "
+                "latest_timestamp = MAX(latest_timestamp, excluded.latest_timestamp), "
+                "updated_at = excluded.updated_at",
+                (tag_name, latest_timestamp.isoformat(), datetime.now().isoformat())
+            )
+
+    def forget(self, tag_name):
+        """Drop a tag so its next lookup goes to the database."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM watermarks WHERE tag_name = ?", (tag_name,))
+
+    def load_blocks(self, tag_name):
+        """Return a tag's recorded block checksums as {block start epoch seconds: checksum}."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT block_start, checksum FROM block_checksums WHERE tag_name = ?", (tag_name,)
+            ).fetchall()
+        return dict(rows)
+
+    def set_blocks(self, tag_name, checksums):
+        """Replace a tag's block checksums; blocks no longer in the file are dropped."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM block_checksums WHERE tag_name = ?", (tag_name,))
+            self._conn.executemany(
+                "INSERT INTO block_checksums (tag_name, block_start, checksum) VALUES (?, ?, ?)",
+                [(tag_name, block_start, checksum) for block_start, checksum in checksums.items()]
+            )
+
+    def clear_blocks(self):
+        """Drop all block checksums so they are rebuilt from the database."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM block_checksums")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
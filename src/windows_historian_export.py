@@ -1,15 +1,83 @@
-import PyADO
 import os
 import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime as datetimestr
 import glob
+import time
+import csv_store
+import partition_store
+import series_compression
+from metrics import RunMetrics
+from run_lock import RunLock
+
+try:
+    import PyADO
+    HistorianError = PyADO.adError
+except ImportError:  # Allows running against a fake Historian off Windows
+    PyADO = None
+    HistorianError = Exception
+
+try:
+    import pythoncom  # PyADO is COM based; worker threads must initialize COM
+except ImportError:
+    pythoncom = None
 
 # Configure paths - Using only local paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 EXPORT_PATH = os.path.join(SCRIPT_DIR, "historian_exports")
 LOG_FILE = os.path.join(SCRIPT_DIR, "historian_export_log.txt")
+# 'csv' writes one <tag>.csv per tag; 'parquet' writes <tag>/<YYYY-MM-DD>.parquet day partitions
+STORAGE_FORMAT = "csv"
+# Also keep a compressed copy of each CSV for the SFTP puller: None, 'gzip' or 'zstd'
+WIRE_COMPRESSION = None
+# Tags per ihrawdata query; 1 restores the one-query-per-tag behaviour
+TAG_GROUP_SIZE = 50
+# Adaptive window sizing for grouped queries
+SAMPLE_INTERVAL_SECONDS = 5
+TARGET_ROWS_PER_QUERY = 250000
+MIN_WINDOW_HOURS = 1
+MAX_WINDOW_HOURS = 24
+# Optional lossy compression of each tag's samples before they are written: None, 'deadband'
+# or 'swinging_door'. Only the points needed to rebuild the series by linear interpolation
+# within the tag's deviation (in its engineering units) are kept
+COMPRESSION = None
+COMPRESSION_DEVIATION = 0.1
+# Per-tag deviations, e.g. {'PLANT.FLOW01.F_CV': 0.5}; None exports that tag uncompressed
+COMPRESSION_DEVIATIONS = {}
+# Longest gap between kept points
+COMPRESSION_MAX_SECONDS = series_compression.MAX_SECONDS
+# Historian connection
+HISTORIAN_HOST = '100.114.78.86'
+HISTORIAN_USER = 'administrador'
+HISTORIAN_PASSWORD = 'Melissa2014'
+HISTORIAN_PROVIDER = 'iHOLEDB.iHistorian.1'
+# Callable returning a DB-API style connection; None uses PyADO with the settings above
+CONNECTION_FACTORY = None
+# Rows per cursor.fetchmany call. Rows are copied into preallocated arrays of
+# this size and written out chunk by chunk, so memory does not grow with the window
+FETCH_BATCH_ROWS = 10000
+# Parallel export: Historian connections fetching concurrently, and the
+# number of fetched chunks that may wait for the CSV writer
+EXPORT_WORKERS = 1
+WRITE_QUEUE_SIZE = 32
+# 'daily' exports the previous calendar day. 'incremental' exports each tag from its last
+# exported row up to INCREMENTAL_LAG_SECONDS ago, for Task Scheduler runs every few minutes
+EXPORT_MODE = "daily"
+INCREMENTAL_LAG_SECONDS = 60
+# Furthest back an incremental run reaches, e.g. for a new tag or after a long outage
+INCREMENTAL_MAX_HOURS = 24
+# Held while an export runs; an export started before the previous one finished exits at once
+LOCK_FILE = os.path.join(SCRIPT_DIR, "export.lock")
+# Run metrics (metrics.jsonl and a Prometheus textfile) are written here after each export
+METRICS_DIR = os.path.join(SCRIPT_DIR, "metrics")
+
+METRICS = RunMetrics("export", throughput="rows_fetched", directory=METRICS_DIR)
+
+_log_lock = threading.Lock()
 
 def ensure_directory(path):
     """Create directory if it doesn't exist"""
@@ -22,12 +90,13 @@ def log_message(message):
     """Write log message to file and print to console"""
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_line = f"{timestamp} - {message}"
-    print(log_line)
-    try:
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_line + "\n")
-    except Exception as e:
-        print(f"Warning: Could not write to log file: {str(e)}")
+    with _log_lock:
+        print(log_line)
+        try:
+            with open(LOG_FILE, 'a', encoding='utf-8') as f:
+                f.write(log_line + "\n")
+        except Exception as e:
+            print(f"Warning: Could not write to log file: {str(e)}")
 
 def convert_timestamp(timestamp):
     """Convert timestamp to string format"""
@@ -40,6 +109,13 @@ def convert_timestamp(timestamp):
     except Exception:
         return str(timestamp)
 
+def connect_historian():
+    """Open a Historian connection through CONNECTION_FACTORY or PyADO"""
+    if CONNECTION_FACTORY is not None:
+        return CONNECTION_FACTORY()
+    return PyADO.connect(None, host=HISTORIAN_HOST, user=HISTORIAN_USER,
+                         password=HISTORIAN_PASSWORD, provider=HISTORIAN_PROVIDER)
+
 def get_tags(cursor):
     """Get list of tags from Historian"""
     try:
@@ -52,86 +128,431 @@ def get_tags(cursor):
         log_message(f"Error getting tags: {str(e)}")
         return []
 
-def fetch_data_in_chunks(cursor, tag, date_from, date_to):
-    all_rows = []
+class ChunkBuffer:
+    """Preallocated typed arrays that fetchmany batches are copied into"""
+    def __init__(self, size=None, with_tagname=False):
+        size = size or FETCH_BATCH_ROWS
+        self.timestamps = np.empty(size, dtype='datetime64[us]')
+        self.values = np.empty(size, dtype=np.float64)
+        self.tagnames = np.empty(size, dtype=object) if with_tagname else None
+
+    def fill(self, rows):
+        """Copy a batch of cursor rows into the arrays and return the row count"""
+        n = len(rows)
+        offset = 0
+        if self.tagnames is not None:
+            self.tagnames[:n] = [row[0] for row in rows]
+            offset = 1
+        self.timestamps[:n] = [row[offset].replace(tzinfo=None) for row in rows]
+        self.values[:n] = [row[offset + 1] for row in rows]
+        return n
+
+    def frame(self, n):
+        """DataFrame of the first n rows; pandas copies them, so the buffer can be refilled"""
+        columns = {'timestamp': self.timestamps[:n], 'value': self.values[:n]}
+        if self.tagnames is not None:
+            columns['tagname'] = self.tagnames[:n]
+        return pd.DataFrame(columns)
+
+def stream_tag_data(cursor, tag, date_from, date_to, buffer=None, strict=False):
+    """Yield one tag's rows as DataFrame chunks of at most FETCH_BATCH_ROWS rows
+    
+    A failed window is logged and skipped, or re-raised with strict=True so
+    the caller can retry the whole range.
+    """
+    buffer = buffer or ChunkBuffer()
     current_timestamp = date_from
     query_step_time = 6
     while current_timestamp < date_to:
         start_date = current_timestamp
-        end_date = current_timestamp + datetime.timedelta(hours=query_step_time) - datetime.timedelta(seconds=1)
-        query = f"SELECT timestamp, value FROM ihrawdata WHERE tagname = {tag} AND samplingmode=interpolated AND intervalmilliseconds=5s AND timestamp>= '{start_date}' AND timestamp < '{end_date}'"
+        end_date = min(current_timestamp + datetime.timedelta(hours=query_step_time) - datetime.timedelta(seconds=1), date_to)
+        query = f"SELECT timestamp, value FROM ihrawdata WHERE tagname = {tag} AND samplingmode=interpolated AND intervalmilliseconds={SAMPLE_INTERVAL_SECONDS}s AND timestamp>= '{start_date}' AND timestamp < '{end_date}'"
         try:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            if rows and len(rows) > 0:  # Verificar que hay resultados
-                for row in rows:
-                    if row and len(row) > 0:  # Verificar que la fila tiene datos
-                        row[0] = row[0].replace(tzinfo=None)
-                        all_rows.extend([row])  # Extender con la fila como lista
-            else:
+            with METRICS.timer("query_seconds"):
+                cursor.execute(query)
+            fetched = 0
+            while True:
+                with METRICS.timer("fetch_seconds"):
+                    rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+                if not rows:
+                    break
+                n = buffer.fill(rows)
+                fetched += n
+                METRICS.add("rows_fetched", n)
+                yield buffer.frame(n)
+            if fetched == 0:
                 log_message(f"No data found for tag {tag} between {start_date} and {end_date}")
-        except PyADO.adError as e:
+        except HistorianError as e:
+            METRICS.add("query_errors")
             log_message(f"Error fetching data for tag {tag}: {e}")
-            continue
+            if strict:
+                raise
         current_timestamp += datetime.timedelta(hours=query_step_time)
-    return all_rows
     
-def export_to_csv(tag_name, data, current_batch):
-    """Export data to CSV file with fixed filename and maintain only last 3 months of data"""
-    try:
-        # Create filename without timestamp
-        filename = os.path.join(EXPORT_PATH, f"{tag_name}.csv")
-        
-        # Convert new data to DataFrame
-        new_df = pd.DataFrame(data, columns=['timestamp', 'value'])
-        new_df['timestamp'] = pd.to_datetime(new_df['timestamp'])
-        
-        # If file exists, read it and append/update
-        if os.path.exists(filename):
-            try:
-                existing_df = pd.read_csv(filename)
-                existing_df['timestamp'] = pd.to_datetime(existing_df['timestamp'])
-                
-                # Combine existing and new data
-                combined_df = pd.concat([existing_df, new_df])
-                
-                # Remove duplicates keeping latest value
-                combined_df = combined_df.drop_duplicates(subset='timestamp', keep='last')
-                
-                # Sort by timestamp
-                combined_df = combined_df.sort_values('timestamp')
-                
-                # Keep only last 3 months of data
-                cutoff_date = datetime.datetime.now() - datetime.timedelta(days=10)
-                combined_df = combined_df[combined_df['timestamp'] > cutoff_date]
-                
-            except Exception as e:
-                log_message(f"Error processing existing file {filename}: {str(e)}")
-                combined_df = new_df
+def _window_hours(rows_per_tag_hour, tag_count):
+    """Window length that keeps a grouped query near TARGET_ROWS_PER_QUERY rows"""
+    hours = TARGET_ROWS_PER_QUERY / max(rows_per_tag_hour * tag_count, 1)
+    return max(MIN_WINDOW_HOURS, min(MAX_WINDOW_HOURS, int(hours)))
+
+def split_rows_by_tag(chunk, tags):
+    """Split a (tagname, timestamp, value) chunk into one DataFrame per tag in bulk"""
+    # The Historian may return tag names in a different case than requested
+    by_lower = {tag.lower(): tag for tag in tags}
+    names = chunk['tagname'].str.lower().map(by_lower)
+    return {tag: group[['timestamp', 'value']] for tag, group in chunk.groupby(names, sort=False)}
+
+def stream_tag_group(cursor, tags, date_from, date_to):
+    """Fetch several tags per ihrawdata query, adapting the window to result sizes.
+    
+    Yields (tag, DataFrame) chunks as batches arrive. Returns the time up to
+    which data was fetched: date_to, or the start of the window whose query
+    failed so the caller can continue per tag from there.
+    """
+    tag_filter = " OR ".join(f"tagname = {tag}" for tag in tags)
+    rows_per_tag_hour = 3600 / SAMPLE_INTERVAL_SECONDS
+    window_hours = _window_hours(rows_per_tag_hour, len(tags))
+    buffer = ChunkBuffer(with_tagname=True)
+    queries = 0
+    current_timestamp = date_from
+    while current_timestamp < date_to:
+        start_date = current_timestamp
+        end_date = min(current_timestamp + datetime.timedelta(hours=window_hours), date_to)
+        query = f"SELECT tagname, timestamp, value FROM ihrawdata WHERE ({tag_filter}) AND samplingmode=interpolated AND intervalmilliseconds={SAMPLE_INTERVAL_SECONDS}s AND timestamp>= '{start_date}' AND timestamp < '{end_date}'"
+        fetched = 0
+        try:
+            with METRICS.timer("query_seconds"):
+                cursor.execute(query)
+            queries += 1
+            while True:
+                with METRICS.timer("fetch_seconds"):
+                    rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+                if not rows:
+                    break
+                n = buffer.fill(rows)
+                fetched += n
+                METRICS.add("rows_fetched", n)
+                for tag, frame in split_rows_by_tag(buffer.frame(n), tags).items():
+                    yield tag, frame
+        except HistorianError as e:
+            METRICS.add("query_errors")
+            log_message(f"Grouped query failed at {start_date}, falling back to per-tag queries: {e}")
+            return start_date
+        if fetched:
+            # Resize the next window from the observed density
+            hours = (end_date - start_date).total_seconds() / 3600
+            rows_per_tag_hour = max(fetched / (hours * len(tags)), 1)
+            window_hours = _window_hours(rows_per_tag_hour, len(tags))
         else:
-            combined_df = new_df
-        
-        # Save to CSV
-        combined_df.to_csv(filename, index=False)
-        log_message(f"Updated {filename} with {len(data)} new records")
-        return filename
-    except Exception as e:
-        log_message(f"Error exporting to CSV: {str(e)}")
+            log_message(f"No data found for {len(tags)} tags between {start_date} and {end_date}")
+        current_timestamp = end_date
+    log_message(f"Fetched {len(tags)} tags in {queries} queries")
+    return date_to
+
+def stream_group(cursor, group, start_time, end_time):
+    """Yield (tag, chunk) for a group of tags, grouped query first, per tag from where it failed"""
+    resume_from = start_time
+    if len(group) > 1:
+        resume_from = yield from stream_tag_group(cursor, group, start_time, end_time)
+    if resume_from < end_time:
+        buffer = ChunkBuffer()
+        for tag in group:
+            for frame in stream_tag_data(cursor, tag, resume_from, end_time, buffer):
+                yield tag, frame
+
+def last_exported(tag):
+    """Timestamp of a tag's last exported row, or None"""
+    if STORAGE_FORMAT == "parquet":
+        partitions = partition_store.list_partitions(partition_store.tag_directory(EXPORT_PATH, tag))
+        if not partitions:
+            return None
+        df = partition_store.read_partition(partitions[-1])
+        return df['timestamp'].max() if len(df) else None
+    path = os.path.join(EXPORT_PATH, f"{tag}.csv")
+    if not os.path.exists(path):
         return None
+    return csv_store.read_last_timestamp(path)
+
+def incremental_window(tags, now=None):
+    """Time range of an incremental export and the first timestamp to export per tag.
+    
+    Each tag continues one sample after its last exported row. The range
+    ends INCREMENTAL_LAG_SECONDS before now, aligned to the sample interval,
+    so interpolated samples are only read once the Historian has the raw
+    data around them.
+    """
+    now = now or datetime.datetime.now()
+    end_time = now - datetime.timedelta(seconds=INCREMENTAL_LAG_SECONDS)
+    midnight = end_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = int((end_time - midnight).total_seconds())
+    end_time = midnight + datetime.timedelta(seconds=seconds - seconds % SAMPLE_INTERVAL_SECONDS)
+    earliest = end_time - datetime.timedelta(hours=INCREMENTAL_MAX_HOURS)
+    starts = {}
+    for tag in tags:
+        last = last_exported(tag)
+        if last is None:
+            starts[tag] = earliest
+        else:
+            next_sample = pd.Timestamp(last).to_pydatetime() + datetime.timedelta(seconds=SAMPLE_INTERVAL_SECONDS)
+            starts[tag] = max(next_sample, earliest)
+    start_time = min(starts.values(), default=end_time)
+    return start_time, end_time, starts
+
+def group_start(group, start_time, starts):
+    """Where a group's fetch begins: its earliest tag's start in incremental runs"""
+    if starts is None:
+        return start_time
+    return min(starts[tag] for tag in group)
+
+def tag_compressor(tag):
+    """Compressor for a tag's samples, or None when it is exported as fetched"""
+    if COMPRESSION is None:
+        return None
+    deviation = COMPRESSION_DEVIATIONS.get(tag, COMPRESSION_DEVIATION)
+    if deviation is None:
+        return None
+    return series_compression.make_compressor(COMPRESSION, deviation, COMPRESSION_MAX_SECONDS)
+
+def compress_frame(compressor, frame):
+    """The rows of a chunk a compressor keeps"""
+    with METRICS.timer("compress_seconds"):
+        timestamps, values = compressor.compress(frame['timestamp'].to_numpy(), frame['value'].to_numpy())
+    return pd.DataFrame({'timestamp': timestamps, 'value': values})
+
+def flush_frame(compressor):
+    """The held last row of a compressed tag"""
+    timestamps, values = compressor.flush()
+    return pd.DataFrame({'timestamp': timestamps, 'value': values})
+
+class TagExport:
+    """Streams one tag's chunks to its CSV (or day partitions) as they arrive"""
+    def __init__(self, tag_name):
+        self.tag_name = tag_name
+        self.rows = 0
+        self.days = set()
+        self.failed = False
+        # Time from the tag's first chunk to its close; shared fetches count for every tag in a group
+        self.started = time.time()
+        self.compressor = tag_compressor(tag_name)
+        if STORAGE_FORMAT == "parquet":
+            self.target = partition_store.tag_directory(EXPORT_PATH, tag_name)
+            self.writer = None
+            # Chunks of the day being fetched; each partition is written once, when the day is complete
+            self.day = None
+            self.pending = []
+        else:
+            self.target = os.path.join(EXPORT_PATH, f"{tag_name}.csv")
+            # Append when the new rows are strictly later than the file, rewrite only on overlap
+            self.writer = csv_store.CSVStreamWriter(self.target, csv_store.RETENTION_DAYS,
+                                                    mirror_compression=WIRE_COMPRESSION)
+
+    def write(self, frame):
+        if self.compressor is not None:
+            frame = compress_frame(self.compressor, frame)
+            if frame.empty:
+                return
+        self._write(frame)
+
+    def _write(self, frame):
+        with METRICS.timer("write_seconds"):
+            if self.writer is None:
+                for day, day_frame in frame.groupby(frame['timestamp'].dt.normalize(), sort=True):
+                    if day != self.day:
+                        self._write_day()
+                        self.day = day
+                    self.pending.append(day_frame)
+            else:
+                self.rows += self.writer.write(frame)
+
+    def _write_day(self):
+        """Merge the buffered chunks of the current day into its partition"""
+        if not self.pending:
+            return
+        frame = pd.concat(self.pending, ignore_index=True)
+        self.pending = []
+        partition_store.write_partitions(self.target, frame)
+        self.days.add(self.day)
+        self.rows += len(frame)
+
+    def close(self):
+        if self.compressor is not None:
+            last = flush_frame(self.compressor)
+            if not last.empty:
+                self._write(last)
+        if self.writer is None:
+            with METRICS.timer("write_seconds"):
+                self._write_day()
+        METRICS.add("rows_written", self.rows)
+        METRICS.record_tag(self.tag_name, time.time() - self.started, rows=self.rows)
+        if self.writer is None:
+            partition_store.drop_partitions_before(self.target, csv_store.RETENTION_DAYS)
+            log_message(f"Updated {self.target} with {self.rows} new records in {len(self.days)} partitions")
+            return self.target
+        if self.writer.close() == 'replaced':
+            log_message(f"Error processing existing file {self.target}, replaced it with the new data")
+        log_message(f"Updated {self.target} with {self.rows} new records")
+        return self.target
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.discard()
+        else:
+            self.pending = []
+
+class ExportSink:
+    """Routes streamed (tag, chunk) pairs to per-tag exports and counts the outcomes
+    
+    With starts ({tag: first timestamp}), rows before a tag's start are
+    dropped, as a group's query begins at its earliest tag.
+    """
+    def __init__(self, starts=None):
+        self.exports = {}
+        self.starts = starts
+        self.successful = 0
+        self.failed = 0
+
+    def write(self, tag, frame):
+        if self.starts is not None:
+            frame = frame[frame['timestamp'] >= self.starts[tag]]
+            if frame.empty:
+                return
+        export = self.exports.get(tag)
+        if export is None:
+            export = self.exports[tag] = TagExport(tag)
+        if export.failed:
+            return
+        try:
+            export.write(frame)
+        except Exception as e:
+            export.failed = True
+            export.discard()
+            log_message(f"Error exporting data for tag {tag}: {str(e)}")
+
+    def finish(self, tags):
+        """Close the exports of tags whose data is complete; tags without data are skipped"""
+        for tag in tags:
+            export = self.exports.pop(tag, None)
+            if export is None:
+                continue
+            if not export.failed:
+                try:
+                    export.close()
+                    self.successful += 1
+                    METRICS.add("tags_exported")
+                    log_message(f"Successfully processed tag {tag}")
+                    continue
+                except Exception as e:
+                    log_message(f"Error exporting data for tag {tag}: {str(e)}")
+            self.failed += 1
+            METRICS.add("tags_failed")
+            log_message(f"Failed to export data for tag {tag}")
+
+    def discard(self, tags):
+        """Drop the unfinished exports of tags whose fetch failed"""
+        for tag in tags:
+            export = self.exports.pop(tag, None)
+            if export is not None:
+                export.discard()
+
+def tag_groups(tags):
+    return [tags[i:i + TAG_GROUP_SIZE] for i in range(0, len(tags), TAG_GROUP_SIZE)]
+
+def export_serial(cursor, tags, start_time, end_time, starts=None):
+    """Fetch and write tags one group at a time on a single connection"""
+    sink = ExportSink(starts)
+    processed = 0
+    for group in tag_groups(tags):
+        log_message(f"Processing tags {processed + 1}-{processed + len(group)}/{len(tags)}")
+        try:
+            for tag, frame in stream_group(cursor, group, group_start(group, start_time, starts), end_time):
+                sink.write(tag, frame)
+        except Exception:
+            sink.discard(group)
+            raise
+        sink.finish(group)
+        processed += len(group)
+    return sink.successful, sink.failed
+
+def export_parallel(tags, start_time, end_time, starts=None):
+    """Fetch tag groups on EXPORT_WORKERS connections while one writer persists the chunks"""
+    sink = ExportSink(starts)
+    results = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    local = threading.local()
+    connections = []
+    connections_lock = threading.Lock()
+    
+    def fetch_worker(group):
+        cursor = getattr(local, 'cursor', None)
+        if cursor is None:
+            if pythoncom is not None:
+                pythoncom.CoInitialize()
+            conn = connect_historian()
+            with connections_lock:
+                connections.append(conn)
+            cursor = local.cursor = conn.cursor()
+        try:
+            for tag, frame in stream_group(cursor, group, group_start(group, start_time, starts), end_time):
+                results.put(('chunk', tag, frame))
+        except Exception:
+            results.put(('discard', group, None))
+            raise
+        results.put(('finish', group, None))
+    
+    def writer():
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            kind, key, frame = item
+            try:
+                if kind == 'chunk':
+                    sink.write(key, frame)
+                elif kind == 'finish':
+                    sink.finish(key)
+                else:
+                    sink.discard(key)
+            except Exception as e:
+                log_message(f"Error writing {key}: {str(e)}")
+    
+    writer_thread = threading.Thread(target=writer, name="export-writer")
+    writer_thread.start()
+    log_message(f"Exporting with {EXPORT_WORKERS} Historian connections")
+    fetch_failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='historian') as executor:
+            futures = {executor.submit(fetch_worker, group): group for group in tag_groups(tags)}
+            for future, group in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    fetch_failed += len(group)
+                    log_message(f"Error fetching tags {group[0]}..{group[-1]}: {str(e)}")
+    finally:
+        results.put(None)
+        writer_thread.join()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+    return sink.successful, sink.failed + fetch_failed
 
 def main():
     print("\n" + "="*50)
     print("Historian Data Export Tool")
     print("="*50 + "\n")
     
+    lock = RunLock(LOCK_FILE)
+    if not lock.acquire():
+        log_message("Previous export is still running. Skipping.")
+        return
+    METRICS.reset()
     try:
         # Setup directories
         log_message(ensure_directory(EXPORT_PATH))
         
         # Connect to Historian
         log_message("Connecting to Historian database...")
-        conn = PyADO.connect(None, host='100.114.78.86', user='administrador', 
-                           password='Melissa2014', provider='iHOLEDB.iHistorian.1')
+        conn = connect_historian()
         cursor = conn.cursor()
         log_message("Connected to Historian database successfully")
         
@@ -142,33 +563,23 @@ def main():
             log_message("No tags found. Exiting.")
             return
             
-        # Set time range for previous day
-        end_time = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)  # Inicio del día actual
-        start_time = end_time - datetime.timedelta(days=1)  # Inicio del día anterior
-        end_time = start_time + datetime.timedelta(days=1)
+        starts = None
+        if EXPORT_MODE == "incremental":
+            start_time, end_time, starts = incremental_window(tags)
+        else:
+            # Set time range for previous day
+            end_time = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)  # Inicio del día actual
+            start_time = end_time - datetime.timedelta(days=1)  # Inicio del día anterior
+            end_time = start_time + datetime.timedelta(days=1)
         
         log_message(f"Time range: {start_time.strftime('%Y-%m-%d %H:%M:%S')} to {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         
         # Process each tag
         total_tags = len(tags)
-        successful_exports = 0
-        failed_exports = 0
-        current_batch = 1
-        
-        for index, tag in enumerate(tags, 1):
-            log_message(f"Processing tag {index}/{total_tags}: {tag}")
-            
-            # Fetch data
-            data = fetch_data_in_chunks(cursor, tag, start_time, end_time)
-            if data:
-                # Export to CSV
-                csv_file = export_to_csv(tag, data, current_batch)
-                if csv_file:
-                    successful_exports += 1
-                    log_message(f"Successfully processed tag {tag}")
-                else:
-                    failed_exports += 1
-                    log_message(f"Failed to export data for tag {tag}")
+        if EXPORT_WORKERS > 1:
+            successful_exports, failed_exports = export_parallel(tags, start_time, end_time, starts)
+        else:
+            successful_exports, failed_exports = export_serial(cursor, tags, start_time, end_time, starts)
         
         # Summary
         log_message("\nExport Summary:")
@@ -184,6 +595,8 @@ def main():
         if 'conn' in locals():
             conn.close()
             log_message("Database connection closed")
+        METRICS.finish(log_message)
+        lock.release()
         
         print("\n" + "="*50)
         print(f"Files exported to: {EXPORT_PATH}")
@@ -0,0 +1,50 @@
+"""Shared setup: the scripts in src/ import each other by module name, as they do when run."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import sftp_script  # noqa: E402
+from local_sftp import LocalSFTPServer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run each test in its own directory, where lock files and logs/ are written."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def remote_dir(tmp_path):
+    path = tmp_path / "remote"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def server(remote_dir):
+    """A local SFTP server standing in for the Windows export host, serving remote_dir."""
+    with LocalSFTPServer(str(remote_dir)) as server:
+        yield server
+
+
+@pytest.fixture
+def transfer(tmp_path, server, monkeypatch):
+    """A HistorianTransfer pulling from server into tmp_path/local."""
+    with monkeypatch.context() as m:
+        # The default paths are the production ones; create nothing there
+        m.setattr(sftp_script.os, "makedirs", lambda *args, **kwargs: None)
+        transfer = sftp_script.HistorianTransfer()
+    transfer.hostname, transfer.port = "127.0.0.1", server.port
+    transfer.remote_path = "/"
+    transfer.local_path = str(tmp_path / "local")
+    transfer.temp_path = str(tmp_path / "temp")
+    transfer.manifest_path = str(tmp_path / "local" / "transfer_manifest.json")
+    os.makedirs(transfer.local_path)
+    os.makedirs(transfer.temp_path)
+    return transfer
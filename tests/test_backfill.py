@@ -0,0 +1,130 @@
+import glob
+import os
+from datetime import datetime
+
+import pytest
+
+import backfill
+import sftp_script
+import sql_import
+import windows_historian_export as exporter
+from db_backend import SQLiteBackend
+from fake_historian import FakeHistorian, FakeHistorianConnection, FakeHistorianCursor
+from run_lock import RunLock
+
+START, END = datetime(2024, 1, 1), datetime(2024, 1, 3)
+ROWS_PER_DAY = 86400 // exporter.SAMPLE_INTERVAL_SECONDS
+
+
+class FlakyCursor(FakeHistorianCursor):
+    """Times out on the second window of SYNTH.TAG00001.F_CV on the first day."""
+
+    def execute(self, query):
+        if "tagname = SYNTH.TAG00001.F_CV " in query and "'2024-01-01 06:00:00'" in query:
+            raise exporter.HistorianError("query timed out")
+        super().execute(query)
+
+
+class FlakyConnection(FakeHistorianConnection):
+    def cursor(self):
+        return FlakyCursor(self.historian)
+
+
+@pytest.fixture
+def historian(tmp_path, remote_dir, monkeypatch):
+    """A fake Historian with two tags; the export stage writes into the SFTP server's directory."""
+    historian = FakeHistorian(tag_count=2)
+    monkeypatch.setattr(exporter, "CONNECTION_FACTORY", historian.connect)
+    monkeypatch.setattr(exporter, "LOG_FILE", str(tmp_path / "historian_export_log.txt"))
+    monkeypatch.setattr(backfill, "EXPORT_ROOT", str(remote_dir))
+    monkeypatch.setattr(backfill, "REMOTE_ROOT", "/")
+    monkeypatch.setattr(backfill, "LOCAL_ROOT", str(tmp_path / "backfill"))
+    return historian
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Route the import stage's SQLImporter to SQLite."""
+    backend = SQLiteBackend(str(tmp_path / "historian.db"))
+
+    class LocalImporter(sql_import.SQLImporter):
+        def __init__(self):
+            super().__init__(backend)
+            self.watermark_path = str(tmp_path / "watermarks.db")
+
+    monkeypatch.setattr(sql_import, "SQLImporter", LocalImporter)
+    return backend
+
+
+def make_backfill(tmp_path, **kwargs):
+    return backfill.Backfill(START, END, workers=2, state_file=str(tmp_path / "backfill_state.log"), **kwargs)
+
+
+def row_counts(backend):
+    conn = backend.connect()
+    try:
+        return dict(conn.execute("SELECT TagName, COUNT(*) FROM TagData GROUP BY TagName").fetchall())
+    finally:
+        conn.close()
+
+
+def test_backfill_runs_every_stage_and_resumes(tmp_path, historian, database, transfer, monkeypatch):
+    monkeypatch.setattr(sftp_script, "HistorianTransfer", lambda: transfer)
+
+    assert make_backfill(tmp_path).run(backfill.STAGES) == 0
+
+    for day in ("2024-01-01", "2024-01-02"):
+        assert sorted(glob.glob("*.csv", root_dir=os.path.join(backfill.LOCAL_ROOT, day))) == \
+            [f"{tag}.csv" for tag in historian.tags]
+    assert row_counts(database) == {"SYNTH.TAG00000": 2 * ROWS_PER_DAY, "SYNTH.TAG00001": 2 * ROWS_PER_DAY}
+
+    # Everything is journaled: a re-run queries nothing and imports nothing
+    queries = historian.queries
+    resumed = make_backfill(tmp_path, tags=historian.tags)
+    assert resumed.export() == (0, 0)
+    assert resumed.import_() == (0, 0)
+    assert historian.queries == queries
+
+
+def test_failed_window_leaves_the_unit_pending(tmp_path, historian, monkeypatch):
+    monkeypatch.setattr(exporter, "CONNECTION_FACTORY", lambda: FlakyConnection(historian))
+
+    assert make_backfill(tmp_path, tags=historian.tags).export() == (3, 1)
+    assert not os.path.exists(os.path.join(backfill.EXPORT_ROOT, "2024-01-01", "SYNTH.TAG00001.F_CV.csv"))
+
+    monkeypatch.setattr(exporter, "CONNECTION_FACTORY", historian.connect)
+    queries = historian.queries
+    assert make_backfill(tmp_path, tags=historian.tags).export() == (1, 0)
+    # Only the failed unit is fetched again, in four 6-hour windows
+    assert historian.queries - queries == 4
+
+
+def test_transfer_stage_keeps_its_downloads_out_of_the_shared_temp_dir(tmp_path, historian, transfer, monkeypatch):
+    monkeypatch.setattr(sftp_script, "HistorianTransfer", lambda: transfer)
+    shared_temp = transfer.temp_path
+    merge = transfer.merge_csv_files
+
+    def merge_after_nightly_cleanup(temp_file, local_file):
+        # The nightly transfer finishes meanwhile and empties its temp directory
+        for name in os.listdir(shared_temp):
+            os.remove(os.path.join(shared_temp, name))
+        return merge(temp_file, local_file)
+
+    monkeypatch.setattr(transfer, "merge_csv_files", merge_after_nightly_cleanup)
+    bf = make_backfill(tmp_path, tags=historian.tags)
+    bf.export()
+
+    assert bf.transfer() == (2, 0)
+    for day in ("2024-01-01", "2024-01-02"):
+        assert sorted(glob.glob("*.csv", root_dir=os.path.join(backfill.LOCAL_ROOT, day))) == \
+            [f"{tag}.csv" for tag in historian.tags]
+
+
+def test_import_stage_waits_for_a_running_import(tmp_path, database):
+    lock = RunLock(sql_import.IMPORT_LOCK)
+    assert lock.acquire()
+    try:
+        assert make_backfill(tmp_path).import_() == (0, 0)
+    finally:
+        lock.release()
+    assert not os.path.exists(tmp_path / "backfill_state.log")
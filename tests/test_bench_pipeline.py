@@ -0,0 +1,32 @@
+import argparse
+
+import bench_pipeline
+
+
+def bench_args(**overrides):
+    args = dict(stages=['export', 'import'], tags=2, days=1, sample_seconds=60, workers=1, latency=0.0,
+                compression=None)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def test_profile_key_names_the_workload():
+    assert bench_pipeline.profile_key(bench_args()) == "2x1d@60s/w1"
+    assert bench_pipeline.profile_key(bench_args(workers=4, compression='zstd')) == "2x1d@60s/w4/zstd"
+
+
+def test_compare_flags_slower_or_larger_runs():
+    baseline = {'rows_per_sec': 1000.0, 'peak_rss_mb': 100.0}
+
+    assert bench_pipeline.compare({'rows_per_sec': 850.0, 'peak_rss_mb': 115.0}, baseline, 0.2) == []
+    problems = bench_pipeline.compare({'rows_per_sec': 700.0, 'peak_rss_mb': 130.0}, baseline, 0.2)
+    assert len(problems) == 2
+
+
+def test_run_benchmark_measures_each_stage_in_its_own_process(tmp_path):
+    results = bench_pipeline.run_benchmark(bench_args(), str(tmp_path))
+
+    assert sorted(results) == ['export', 'import']
+    for result in results.values():
+        assert result['rows'] == 2 * 1440
+        assert result['wall_seconds'] > 0 and result['peak_rss_mb'] > 0
@@ -0,0 +1,78 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_codec
+import csv_store
+
+
+@pytest.fixture(params=['pyarrow', 'c'])
+def engine(request, monkeypatch):
+    """Run a test with pyarrow's reader and with the pandas C engine fallback."""
+    if request.param == 'pyarrow':
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(csv_codec, "pyarrow", None)
+    return request.param
+
+
+def random_frame(rows=5000):
+    rng = np.random.default_rng(7)
+    timestamps = pd.date_range("2024-01-01", periods=rows, freq="5s")
+    values = rng.normal(0.0, 1e3, rows) * 10.0 ** rng.integers(-12, 12, rows)
+    return pd.DataFrame({'timestamp': timestamps, 'value': values})
+
+
+def test_read_csv_round_trips_values_bit_for_bit(tmp_path, engine):
+    df = random_frame()
+    path = str(tmp_path / "TAG.csv")
+    csv_store.rewrite(path, df)
+
+    read = csv_codec.read_csv(path)
+
+    assert csv_codec.engine() == engine
+    pd.testing.assert_frame_equal(read, df)
+    assert read['value'].to_numpy().tobytes() == df['value'].to_numpy().tobytes()
+
+
+def test_iter_csv_and_file_objects_parse_like_read_csv(tmp_path, engine):
+    df = random_frame()
+    path = str(tmp_path / "TAG.csv")
+    csv_store.rewrite(path, df)
+
+    chunks = list(csv_codec.iter_csv(path, chunk_rows=1000))
+    with open(path, 'rb') as f:
+        from_file = csv_codec.read_csv(io.BytesIO(f.read()))
+
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df)
+    pd.testing.assert_frame_equal(from_file, df)
+
+
+def test_read_csv_since_keeps_only_later_rows(tmp_path, engine):
+    df = random_frame()
+    path = str(tmp_path / "TAG.csv")
+    csv_store.rewrite(path, df)
+
+    since = datetime(2024, 1, 1, 6)
+    pd.testing.assert_frame_equal(csv_codec.read_csv_since(path, since, chunk_rows=1000),
+                                  df[df['timestamp'] > since].reset_index(drop=True))
+    pd.testing.assert_frame_equal(csv_codec.read_csv_since(path, datetime.min), df)
+
+
+def test_parse_timestamps_falls_back_to_iso_8601():
+    parsed = csv_codec.parse_timestamps(pd.Series(["2024-01-01T00:00:05", "2024-01-01T00:00:10"]))
+    assert parsed.tolist() == [pd.Timestamp("2024-01-01 00:00:05"), pd.Timestamp("2024-01-01 00:00:10")]
+
+
+def test_to_frame_rejects_values_that_are_not_numbers():
+    df = pd.DataFrame({'timestamp': ["2024-01-01 00:00:00", "2024-01-01 00:00:05"], 'value': ["1.5", None]})
+    parsed = csv_codec.to_frame(df.copy())
+    assert parsed['value'].iloc[0] == 1.5 and np.isnan(parsed['value'].iloc[1])
+
+    df.loc[1, 'value'] = "Bad Input"
+    with pytest.raises(ValueError):
+        csv_codec.to_frame(df)
@@ -0,0 +1,135 @@
+import gzip
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import csv_codec
+import csv_store
+
+
+def tag_frame(start, periods, seconds=60):
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.arange(periods) * 0.5})
+
+
+def read_back(path):
+    return csv_codec.read_csv(str(path))
+
+
+def test_merge_into_csv_appends_later_rows_and_rewrites_overlaps(tmp_path):
+    path = str(tmp_path / "TAG.F_CV.csv")
+    df = tag_frame("2024-01-01", 300)
+
+    assert csv_store.merge_into_csv(path, df.iloc[:100], retention_days=None) == 'created'
+    assert csv_store.merge_into_csv(path, df.iloc[100:200], retention_days=None) == 'appended'
+    overlap = df.iloc[150:300].copy()
+    overlap.loc[160, 'value'] = -1.0
+    assert csv_store.merge_into_csv(path, overlap, retention_days=None) == 'rewritten'
+
+    expected = df.copy()
+    expected.loc[160, 'value'] = -1.0
+    pd.testing.assert_frame_equal(read_back(path), expected)
+
+
+def test_merge_into_csv_keeps_the_compressed_mirror_in_step(tmp_path):
+    path = tmp_path / "TAG.F_CV.csv"
+    df = tag_frame("2024-01-01", 300)
+    csv_store.merge_into_csv(str(path), df.iloc[:100], retention_days=None, mirror_compression='gzip')
+    csv_store.merge_into_csv(str(path), df.iloc[100:200], retention_days=None, mirror_compression='gzip')
+    csv_store.merge_into_csv(str(path), df.iloc[200:], retention_days=None, mirror_compression='gzip')
+
+    with gzip.open(csv_store.compressed_path(str(path), 'gzip'), 'rb') as f:
+        assert f.read() == path.read_bytes()
+    pd.testing.assert_frame_equal(read_back(path), df)
+
+
+def test_rewrites_replace_the_generation_marker_and_appends_keep_it(tmp_path):
+    path = str(tmp_path / "TAG.F_CV.csv")
+    df = tag_frame("2024-01-01", 300)
+
+    def generation():
+        with open(csv_store.generation_path(path)) as f:
+            return f.read()
+
+    csv_store.merge_into_csv(path, df.iloc[:100], retention_days=None)
+    created = generation()
+    csv_store.merge_into_csv(path, df.iloc[100:200], retention_days=None)
+    assert generation() == created
+    csv_store.merge_into_csv(path, df.iloc[150:], retention_days=None)
+    rewritten = generation()
+    assert rewritten != created
+    csv_store.compact(path, 1)
+    assert generation() != rewritten
+
+
+def test_read_last_timestamp_reads_the_file_tail(tmp_path, monkeypatch):
+    path = str(tmp_path / "TAG.F_CV.csv")
+    csv_store.rewrite(path, tag_frame("2024-01-01", 1000))
+    # Tail blocks smaller than a line force the backwards scan to extend
+    monkeypatch.setattr(csv_store, "TAIL_BLOCK_SIZE", 7)
+    assert csv_store.read_last_timestamp(path) == pd.Timestamp("2024-01-01 16:39:00")
+    assert csv_store.read_first_timestamp(path) == pd.Timestamp("2024-01-01 00:00:00")
+
+
+def test_merge_into_csv_applies_retention_on_rewrite(tmp_path):
+    path = str(tmp_path / "TAG.F_CV.csv")
+    cutoff = csv_store.retention_cutoff(2)
+    df = tag_frame(cutoff - timedelta(days=1), 3 * 24, seconds=3600)
+    csv_store.merge_into_csv(path, df.iloc[10:], retention_days=None)
+
+    assert csv_store.merge_into_csv(path, df.iloc[:20], retention_days=2) == 'rewritten'
+
+    kept = read_back(path)
+    assert kept['timestamp'].min() == pd.Timestamp(cutoff)
+    pd.testing.assert_frame_equal(kept, df[df['timestamp'] >= cutoff].reset_index(drop=True))
+
+
+def test_find_offset_lands_on_the_first_row_at_or_after_the_cutoff(tmp_path):
+    path = tmp_path / "TAG.F_CV.csv"
+    df = tag_frame("2024-01-01", 500, seconds=37)
+    csv_store.rewrite(str(path), df)
+    data = path.read_bytes()
+    starts = [len(line) for line in data.splitlines(keepends=True)]
+    starts = np.cumsum(starts)[:-1]  # offset of each data line
+
+    with open(path, 'rb') as f:
+        for cutoff in [df['timestamp'].iloc[0] - timedelta(days=1), df['timestamp'].iloc[0],
+                       df['timestamp'].iloc[123], df['timestamp'].iloc[123] + timedelta(seconds=1),
+                       df['timestamp'].iloc[-1], df['timestamp'].iloc[-1] + timedelta(seconds=1)]:
+            # Linear scan for the same answer
+            later = np.flatnonzero((df['timestamp'] >= cutoff).to_numpy())
+            expected = starts[later[0]] if len(later) else len(data)
+            assert csv_store.find_offset(f, cutoff) == expected
+
+
+def test_compact_cuts_at_the_retention_cutoff(tmp_path):
+    path = tmp_path / "TAG.F_CV.csv"
+    cutoff = csv_store.retention_cutoff(3)
+    df = tag_frame(cutoff - timedelta(days=2), 5 * 24 * 6, seconds=600)
+    csv_store.rewrite(str(path), df, mirror_compression='gzip')
+    header, _, body = path.read_bytes().partition(b"\n")
+    kept_rows = df[df['timestamp'] >= cutoff].reset_index(drop=True)
+
+    dropped = csv_store.compact(str(path), 3, mirror_compression='gzip')
+
+    data = path.read_bytes()
+    assert data.startswith(header + b"\n")
+    assert body.endswith(data[len(header) + 1:])
+    assert dropped == len(body) - (len(data) - len(header) - 1)
+    pd.testing.assert_frame_equal(read_back(path), kept_rows)
+    assert csv_store.read_first_timestamp(str(path)) == pd.Timestamp(cutoff)
+    with gzip.open(csv_store.compressed_path(str(path), 'gzip'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_compact_if_due_waits_for_the_slack(tmp_path):
+    path = str(tmp_path / "TAG.F_CV.csv")
+    cutoff = csv_store.retention_cutoff(3)
+    # Half a day past retention: inside the one day of slack
+    csv_store.rewrite(path, tag_frame(cutoff - timedelta(hours=12), 4 * 24, seconds=3600))
+
+    assert not csv_store.compact_if_due(path, 3, slack_days=1)
+    assert csv_store.compact_if_due(path, 3, slack_days=0)
+    assert csv_store.read_first_timestamp(path) == pd.Timestamp(cutoff)
+    assert not csv_store.compact_if_due(path, None)
@@ -0,0 +1,49 @@
+import json
+
+import metrics
+from metrics import Histogram, RunMetrics
+
+
+def test_histogram_quantiles_are_bucket_upper_bounds():
+    histogram = Histogram()
+    for seconds in [0.002] * 90 + [0.3] * 9 + [90.0]:
+        histogram.observe(seconds)
+
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.95) == 0.5
+    assert histogram.quantile(1.0) == 90.0
+    assert histogram.summary()['count'] == 100
+
+
+def test_finish_writes_the_summary_and_prometheus_textfile(tmp_path):
+    run = RunMetrics("import", throughput="rows_inserted", directory=str(tmp_path))
+    run.add("rows_inserted", 500)
+    run.observe("db_commit_seconds", 0.02)
+    run.record_tag("TAG", 1.5, rows=500)
+    messages = []
+
+    summary = run.finish(messages.append)
+
+    with open(tmp_path / "metrics.jsonl") as f:
+        assert [json.loads(line) for line in f] == [summary]
+    assert metrics.last_summary("import", str(tmp_path)) == summary
+    assert metrics.last_summary("transfer", str(tmp_path)) is None
+    prom = (tmp_path / "historian_import.prom").read_text()
+    assert 'historian_rows_inserted{stage="import"} 500' in prom
+    assert 'historian_db_commit_seconds_count{stage="import"} 1' in prom
+    assert 'historian_slow_tag_seconds{stage="import",tag="TAG"} 1.5' in prom
+    assert messages[0].startswith("import run took")
+
+
+def test_finish_flags_a_throughput_regression(tmp_path):
+    previous = {'stage': 'import', 'rates': {'rows_inserted': 1000.0}}
+    (tmp_path / "metrics.jsonl").write_text(json.dumps(previous) + "\n")
+    run = RunMetrics("import", throughput="rows_inserted", directory=str(tmp_path))
+    # At least one second long, so 100 rows are at most 100 rows/s
+    run._start_time -= 1.0
+    run.add("rows_inserted", 100)
+    messages = []
+
+    run.finish(messages.append)
+
+    assert any(message.startswith("Possible regression: rows_inserted rate") for message in messages)
@@ -0,0 +1,68 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import partition_store
+from db_backend import SQLiteBackend
+from sql_import import SQLImporter
+
+
+def tag_frame(start, periods, seconds=3600):
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.arange(periods) * 0.25})
+
+
+def test_write_partitions_writes_one_file_per_day(tmp_path):
+    tag_dir = str(tmp_path / "TAG.F_CV")
+    df = tag_frame("2024-01-01", 72)
+
+    assert partition_store.write_partitions(tag_dir, df) == 3
+
+    names = [os.path.basename(p) for p in partition_store.list_partitions(tag_dir)]
+    assert names == ["2024-01-01.parquet", "2024-01-02.parquet", "2024-01-03.parquet"]
+    pd.testing.assert_frame_equal(partition_store.read_partitions(tag_dir), df)
+
+
+def test_write_partitions_merges_into_existing_days_only(tmp_path):
+    tag_dir = str(tmp_path / "TAG.F_CV")
+    df = tag_frame("2024-01-01", 72)
+    partition_store.write_partitions(tag_dir, df.iloc[:40])
+    first_day = partition_store.partition_path(tag_dir, datetime(2024, 1, 1))
+    first_mtime = os.stat(first_day).st_mtime_ns
+
+    revised = df.iloc[30:].copy()
+    revised.loc[30, 'value'] = -1.0
+    assert partition_store.write_partitions(tag_dir, revised) == 2
+
+    expected = df.copy()
+    expected.loc[30, 'value'] = -1.0
+    pd.testing.assert_frame_equal(partition_store.read_partitions(tag_dir), expected)
+    assert os.stat(first_day).st_mtime_ns == first_mtime
+
+
+def test_read_partitions_skips_days_before_since(tmp_path):
+    tag_dir = str(tmp_path / "TAG.F_CV")
+    partition_store.write_partitions(tag_dir, tag_frame("2024-01-01", 72))
+
+    rows = partition_store.read_partitions(tag_dir, since=datetime(2024, 1, 2, 12))
+
+    assert rows['timestamp'].min() == pd.Timestamp("2024-01-02")
+    assert len(rows) == 48
+
+
+def test_importer_reads_partitioned_tags(tmp_path):
+    importer = SQLImporter(SQLiteBackend(str(tmp_path / "historian.db")))
+    importer.storage_format = "parquet"
+    importer.csv_dir = str(tmp_path / "exports")
+    importer.watermark_path = str(tmp_path / "watermarks.db")
+    df = tag_frame("2024-01-01", 72)
+    partition_store.write_partitions(partition_store.tag_directory(importer.csv_dir, "TAG.F_CV"), df)
+
+    importer.import_all()
+
+    conn = importer.backend.connect()
+    rows = conn.execute("SELECT TagName, COUNT(*), MAX(Timestamp) FROM TagData GROUP BY TagName").fetchall()
+    conn.close()
+    assert rows == [("TAG", 72, "2024-01-03T23:00:00")]
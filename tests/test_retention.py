@@ -0,0 +1,124 @@
+import gzip
+import logging
+import os
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_codec
+import csv_store
+import partition_store
+import retention
+from db_backend import SQLiteBackend, SQLiteNarrowBackend
+from run_lock import RunLock
+from sql_import import IMPORT_LOCK, SQLImporter
+
+TAGS = ["SYNTH.TAG00000", "SYNTH.TAG00001"]
+LOGGER = logging.getLogger("test_retention")
+
+
+def tag_frame(start, periods, seconds=3600):
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.round(np.arange(periods) * 0.25, 2)})
+
+
+@pytest.fixture(params=[SQLiteBackend, SQLiteNarrowBackend], ids=['wide', 'narrow'])
+def backend(request, tmp_path):
+    """A database holding six days of hourly rows for two tags, the oldest four before the cutoff."""
+    importer = SQLImporter(request.param(str(tmp_path / "historian.db")))
+    importer.csv_dir = str(tmp_path / "exports")
+    importer.watermark_path = str(tmp_path / "watermarks.db")
+    os.makedirs(importer.csv_dir)
+    for tag in TAGS:
+        path = os.path.join(importer.csv_dir, f"{tag}.F_CV.csv")
+        csv_store.rewrite(path, tag_frame(cutoff() - timedelta(days=4), 6 * 24))
+    importer.import_all()
+    return importer.backend
+
+
+def cutoff():
+    return csv_store.retention_cutoff(2)
+
+
+def fact_rows(backend):
+    conn = backend.connect()
+    try:
+        return conn.execute(f"SELECT COUNT(*), MIN(Timestamp) FROM {backend.fact_table}").fetchone()
+    finally:
+        conn.close()
+
+
+def test_drop_partitions_archives_and_deletes_the_days_before_the_cutoff(backend, tmp_path):
+    archive_dir = str(tmp_path / "archive")
+    conn = backend.connect()
+    try:
+        assert retention.drop_partitions(backend, conn, cutoff(), archive_dir, LOGGER)
+    finally:
+        conn.close()
+
+    assert fact_rows(backend) == (len(TAGS) * 2 * 24, f"{cutoff():%Y-%m-%dT%H:%M:%S}")
+    archived = []
+    for days in range(4, 0, -1):
+        lower = cutoff() - timedelta(days=days)
+        path = retention.archive_path(archive_dir, backend.fact_table, lower, lower + timedelta(days=1))
+        with gzip.open(path, 'rt') as f:
+            df = pd.read_csv(f, parse_dates=['timestamp'])
+        assert list(df.columns) == retention.ARCHIVE_COLUMNS
+        assert (df['timestamp'] >= lower).all() and (df['timestamp'] < lower + timedelta(days=1)).all()
+        archived.append(df)
+    archived = pd.concat(archived, ignore_index=True)
+    expected = tag_frame(cutoff() - timedelta(days=4), 4 * 24)
+    for tag in TAGS:
+        rows = archived[archived['tag'] == tag].reset_index(drop=True)
+        pd.testing.assert_frame_equal(rows[['timestamp', 'value']], expected, check_dtype=False)
+        assert (rows['status'] == 0).all()
+
+
+def test_drop_partitions_dry_run_changes_nothing(backend, tmp_path):
+    before = fact_rows(backend)
+    conn = backend.connect()
+    try:
+        assert retention.drop_partitions(backend, conn, cutoff(), str(tmp_path / "archive"), LOGGER, dry_run=True)
+    finally:
+        conn.close()
+
+    assert fact_rows(backend) == before
+    assert not os.path.exists(tmp_path / "archive")
+
+
+def test_run_db_keeps_more_days_than_the_local_files(backend):
+    with pytest.raises(ValueError):
+        retention.run_db(backend, csv_store.RETENTION_DAYS, None, LOGGER)
+
+
+def test_run_db_skips_while_an_import_holds_the_lock(backend):
+    before = fact_rows(backend)
+    lock = RunLock(IMPORT_LOCK)
+    assert lock.acquire()
+    try:
+        assert not retention.run_db(backend, csv_store.RETENTION_DAYS + 1, None, LOGGER)
+    finally:
+        lock.release()
+    assert fact_rows(backend) == before
+    assert retention.run_db(backend, csv_store.RETENTION_DAYS + 1, None, LOGGER)
+
+
+def test_sweep_directory_trims_csv_files_and_partitions(tmp_path):
+    root = str(tmp_path / "exports")
+    start = cutoff() - timedelta(days=3)
+    df = tag_frame(start, 5 * 24)
+    path = os.path.join(root, "SYNTH.TAG00000.F_CV.csv")
+    os.makedirs(root)
+    csv_store.rewrite(path, df, mirror_compression='gzip')
+    tag_dir = partition_store.tag_directory(root, "SYNTH.TAG00001.F_CV")
+    partition_store.write_partitions(tag_dir, df)
+
+    assert retention.sweep_directory(root, 2, LOGGER) == (1, 3)
+
+    kept = df[df['timestamp'] >= cutoff()].reset_index(drop=True)
+    pd.testing.assert_frame_equal(csv_codec.read_csv(path), kept)
+    with gzip.open(csv_store.compressed_path(path, 'gzip'), 'rb') as f, open(path, 'rb') as plain:
+        assert f.read() == plain.read()
+    assert len(partition_store.list_partitions(tag_dir)) == 2
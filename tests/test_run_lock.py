@@ -0,0 +1,17 @@
+import os
+
+from run_lock import RunLock
+
+
+def test_lock_is_exclusive_until_released(tmp_path):
+    path = str(tmp_path / "transfer.lock")
+    first, second = RunLock(path), RunLock(path)
+
+    assert first.acquire()
+    assert not second.acquire()
+    with open(path) as f:
+        assert f.read().startswith(f"pid {os.getpid()} since ")
+
+    first.release()
+    assert second.acquire()
+    second.release()
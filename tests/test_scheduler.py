@@ -0,0 +1,114 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import csv_store
+import scheduler
+import sftp_script
+from db_backend import SQLiteBackend
+from run_lock import RunLock
+from sql_import import SQLImporter
+
+logger = logging.getLogger("test_scheduler")
+
+
+def tag_frame(periods, seconds=60):
+    start = pd.Timestamp(datetime.now() - timedelta(days=1)).floor('h')
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.arange(periods) * 0.5})
+
+
+def make_importer(tmp_path):
+    importer = SQLImporter(SQLiteBackend(str(tmp_path / "historian.db")))
+    importer.watermark_path = str(tmp_path / "watermarks.db")
+    return importer
+
+
+def row_counts(importer):
+    conn = importer.backend.connect()
+    try:
+        return dict(conn.execute("SELECT TagName, COUNT(*) FROM TagData GROUP BY TagName").fetchall())
+    finally:
+        conn.close()
+
+
+def test_run_pipeline_imports_each_tag_as_it_is_merged(tmp_path, transfer, remote_dir):
+    for i in range(5):
+        csv_store.rewrite(str(remote_dir / f"SYNTH.TAG{i:05d}.F_CV.csv"), tag_frame(100 + i))
+    transfer.transfer_workers = 2
+    importer = make_importer(tmp_path)
+
+    scheduler.run_pipeline(logger, transfer, importer)
+
+    assert importer.csv_dir == transfer.local_path
+    assert row_counts(importer) == {f"SYNTH.TAG{i:05d}": 100 + i for i in range(5)}
+
+
+def test_import_arrivals_imports_changed_files_on_each_poll(tmp_path):
+    importer = make_importer(tmp_path)
+    importer.csv_dir = str(tmp_path / "local")
+    os.makedirs(importer.csv_dir)
+    path_a = os.path.join(importer.csv_dir, "A.F_CV.csv")
+    df = tag_frame(150)
+    csv_store.rewrite(path_a, df.iloc[:100])
+    imported = {}
+
+    scheduler.import_arrivals(logger, imported, importer)
+    assert row_counts(importer) == {"A": 100}
+    assert imported == {path_a: scheduler.source_state(path_a)}
+
+    csv_store.append(path_a, df.iloc[100:])
+    csv_store.rewrite(os.path.join(importer.csv_dir, "B.F_CV.csv"), df)
+    scheduler.import_arrivals(logger, imported, importer)
+    assert row_counts(importer) == {"A": 150, "B": 150}
+    assert importer.metrics.counters['tags_imported'] == 2
+
+
+def test_import_arrivals_leaves_a_partial_last_row_for_the_next_poll(tmp_path):
+    importer = make_importer(tmp_path)
+    importer.csv_dir = str(tmp_path / "local")
+    os.makedirs(importer.csv_dir)
+    path = os.path.join(importer.csv_dir, "A.F_CV.csv")
+    df = tag_frame(101)
+    df.loc[100, 'value'] = 12.345
+    csv_store.rewrite(path, df.iloc[:100])
+    imported = {}
+
+    # A transfer is appending the last row: its value is cut short
+    row = f"{df['timestamp'].iloc[100]:%Y-%m-%d %H:%M:%S},12.345\n".encode()
+    with open(path, 'ab') as f:
+        f.write(row[:-3])
+    scheduler.import_arrivals(logger, imported, importer)
+    assert row_counts(importer) == {"A": 100}
+
+    with open(path, 'ab') as f:
+        f.write(row[-3:])
+    scheduler.import_arrivals(logger, imported, importer)
+    assert row_counts(importer) == {"A": 101}
+    conn = importer.backend.connect()
+    try:
+        assert conn.execute("SELECT Value FROM TagData ORDER BY Timestamp DESC LIMIT 1").fetchone() == (12.345,)
+    finally:
+        conn.close()
+
+
+def test_import_arrivals_waits_for_a_running_transfer(tmp_path):
+    importer = make_importer(tmp_path)
+    importer.csv_dir = str(tmp_path / "local")
+    os.makedirs(importer.csv_dir)
+    csv_store.rewrite(os.path.join(importer.csv_dir, "A.F_CV.csv"), tag_frame(100))
+    imported = {}
+
+    lock = RunLock(sftp_script.TRANSFER_LOCK)
+    assert lock.acquire()
+    try:
+        scheduler.import_arrivals(logger, imported, importer)
+    finally:
+        lock.release()
+    assert imported == {}
+
+    scheduler.import_arrivals(logger, imported, importer)
+    assert row_counts(importer) == {"A": 100}
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from series_compression import METHODS, compress_series, make_compressor, reinterpolate
+
+TIMESTAMPS = pd.date_range("2024-01-01", periods=17280, freq="5s").to_numpy()
+
+
+def signal(name):
+    seconds = np.arange(len(TIMESTAMPS)) * 5.0
+    rng = np.random.default_rng(3)
+    if name == 'sine':
+        return 50.0 + 10.0 * np.sin(seconds / 3600.0) + rng.normal(0.0, 0.05, len(seconds))
+    if name == 'ramps':
+        return np.abs((seconds % 7200.0) - 3600.0) / 36.0
+    if name == 'steps':
+        return np.floor(seconds / 1800.0) % 4 * 2.5
+    return np.full(len(seconds), 12.0)
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("name", ['sine', 'ramps', 'steps', 'flat'])
+@pytest.mark.parametrize("deviation", [0.05, 0.5])
+def test_reinterpolation_error_stays_within_deviation(method, name, deviation):
+    values = signal(name)
+
+    kept_timestamps, kept_values = compress_series(TIMESTAMPS, values, method, deviation)
+    rebuilt = reinterpolate(kept_timestamps, kept_values, TIMESTAMPS)
+
+    assert np.max(np.abs(rebuilt - values)) <= deviation + 1e-9
+    assert kept_timestamps[0] == TIMESTAMPS[0] and kept_timestamps[-1] == TIMESTAMPS[-1]
+
+
+@pytest.mark.parametrize("name", ['sine', 'ramps', 'steps', 'flat'])
+def test_swinging_door_keeps_fewer_points_than_deadband(name):
+    values = signal(name)
+
+    deadband = compress_series(TIMESTAMPS, values, 'deadband', 0.5)[1]
+    swinging_door = compress_series(TIMESTAMPS, values, 'swinging_door', 0.5)[1]
+
+    assert len(swinging_door) <= len(deadband)
+    assert len(swinging_door) < len(values) / 10
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_kept_points_are_at_most_max_seconds_apart(method):
+    kept_timestamps, _ = compress_series(TIMESTAMPS, signal('flat'), method, 0.5, max_seconds=600)
+
+    gaps = np.diff(kept_timestamps).astype('timedelta64[s]').astype(np.int64)
+    assert gaps.max() <= 600
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_chunked_compression_matches_whole_series(method):
+    values = signal('sine')
+    whole = compress_series(TIMESTAMPS, values, method, 0.1)
+
+    compressor = make_compressor(method, 0.1)
+    parts = [compressor.compress(TIMESTAMPS[i:i + 1000], values[i:i + 1000]) for i in range(0, len(values), 1000)]
+    parts.append(compressor.flush())
+
+    np.testing.assert_array_equal(np.concatenate([part[0] for part in parts]), whole[0])
+    np.testing.assert_array_equal(np.concatenate([part[1] for part in parts]), whole[1])
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_nan_points_and_their_neighbours_are_kept(method):
+    values = signal('flat')
+    values[[100, 5000]] = np.nan
+
+    kept_timestamps, kept_values = compress_series(TIMESTAMPS, values, method, 0.5)
+
+    for i in (100, 5000):
+        index = np.flatnonzero(kept_timestamps == TIMESTAMPS[i])
+        assert len(index) == 1 and np.isnan(kept_values[index[0]])
+        assert TIMESTAMPS[i - 1] in kept_timestamps and TIMESTAMPS[i + 1] in kept_timestamps
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_repeated_and_out_of_order_points_are_dropped(method):
+    values = signal('sine')
+    # A window fetched twice, and one stray older point
+    timestamps = np.concatenate([TIMESTAMPS[:2000], TIMESTAMPS[1500:4000], TIMESTAMPS[10:11], TIMESTAMPS[4000:]])
+    repeated = np.concatenate([values[:2000], values[1500:4000], values[10:11], values[4000:]])
+
+    kept_timestamps, kept_values = compress_series(timestamps, repeated, method, 0.1)
+
+    assert (np.diff(kept_timestamps) > np.timedelta64(0)).all()
+    expected = compress_series(TIMESTAMPS, values, method, 0.1)
+    np.testing.assert_array_equal(kept_timestamps, expected[0])
+    np.testing.assert_array_equal(kept_values, expected[1])
+
+
+def test_make_compressor_rejects_unknown_methods():
+    with pytest.raises(ValueError):
+        make_compressor('gorilla', 0.1)
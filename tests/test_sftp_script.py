@@ -0,0 +1,177 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_codec
+import csv_store
+
+
+def tag_frame(periods, seconds=60):
+    start = pd.Timestamp(datetime.now() - timedelta(days=1)).floor('h')
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.arange(periods) * 0.5})
+
+
+@pytest.fixture
+def transferred(transfer, monkeypatch):
+    """Names of the files transfer_file was called for."""
+    names = []
+    transfer_file = transfer.transfer_file
+
+    def record(sftp, name):
+        names.append(name)
+        return transfer_file(sftp, name)
+
+    monkeypatch.setattr(transfer, "transfer_file", record)
+    return names
+
+
+def write_remote(remote_dir, name, df):
+    csv_store.rewrite(str(remote_dir / name), df)
+
+
+def local_rows(transfer, name):
+    return csv_codec.read_csv(os.path.join(transfer.local_path, name))
+
+
+def test_transfer_files_merges_every_remote_csv(transfer, remote_dir, transferred):
+    frames = {f"SYNTH.TAG{i:05d}.F_CV.csv": tag_frame(100 + i) for i in range(3)}
+    for name, df in frames.items():
+        write_remote(remote_dir, name, df)
+    transfer.transfer_workers = 2
+
+    transfer.transfer_files()
+
+    for name, df in frames.items():
+        pd.testing.assert_frame_equal(local_rows(transfer, name), df)
+    assert sorted(transferred) == sorted(frames)
+
+
+def test_skip_unchanged_transfers_only_changed_files(transfer, remote_dir, transferred):
+    transfer.skip_unchanged = True
+    write_remote(remote_dir, "A.F_CV.csv", tag_frame(100))
+    write_remote(remote_dir, "B.F_CV.csv", tag_frame(100))
+    transfer.transfer_files()
+    assert sorted(transferred) == ["A.F_CV.csv", "B.F_CV.csv"]
+
+    transferred.clear()
+    transfer.transfer_files()
+    assert transferred == []
+
+    write_remote(remote_dir, "B.F_CV.csv", tag_frame(150))
+    transfer.transfer_files()
+    assert transferred == ["B.F_CV.csv"]
+    pd.testing.assert_frame_equal(local_rows(transfer, "B.F_CV.csv"), tag_frame(150))
+
+
+@pytest.mark.parametrize("compression", ['gzip', 'zstd'])
+def test_compressed_mirror_is_preferred_and_streamed(transfer, remote_dir, transferred, compression):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    df = tag_frame(300)
+    path = str(remote_dir / "A.F_CV.csv")
+    # Appends add gzip members / zstd frames to the mirror
+    for start in range(0, 300, 100):
+        csv_store.merge_into_csv(path, df.iloc[start:start + 100], mirror_compression=compression)
+
+    transfer.transfer_files()
+
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), df)
+    suffix = csv_store.COMPRESSION_SUFFIXES[compression]
+    assert transferred == ["A.F_CV.csv" + suffix]
+    assert transfer.metrics.counters['bytes_transferred'] == os.path.getsize(path + suffix)
+    assert not os.listdir(transfer.temp_path)
+
+
+def append_remote(remote_dir, name, df):
+    csv_store.append(str(remote_dir / name), df)
+
+
+def test_resume_appends_transfers_only_the_appended_bytes(transfer, remote_dir):
+    transfer.skip_unchanged = transfer.resume_appends = True
+    df = tag_frame(300)
+    path = remote_dir / "A.F_CV.csv"
+    write_remote(remote_dir, "A.F_CV.csv", df.iloc[:200])
+    transfer.transfer_files()
+    size = path.stat().st_size
+    assert transfer.metrics.counters['bytes_transferred'] == size
+
+    append_remote(remote_dir, "A.F_CV.csv", df.iloc[200:])
+    transfer.transfer_files()
+
+    assert transfer.metrics.counters['bytes_transferred'] == path.stat().st_size - size
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), df)
+    assert transfer.load_manifest()["A.F_CV.csv"]["size"] == path.stat().st_size
+
+
+def test_resume_appends_leaves_a_partial_row_for_the_next_run(transfer, remote_dir):
+    transfer.skip_unchanged = transfer.resume_appends = True
+    df = tag_frame(3)
+    path = remote_dir / "A.F_CV.csv"
+    write_remote(remote_dir, "A.F_CV.csv", df.iloc[:1])
+    transfer.transfer_files()
+
+    # The exporter is mid-way through writing the third row
+    second, third = (f"{ts:%Y-%m-%d %H:%M:%S},{value}\n".encode() for ts, value in df.iloc[1:].itertuples(index=False))
+    with open(path, 'ab') as f:
+        f.write(second + third[:15])
+    transfer.transfer_files()
+    assert len(local_rows(transfer, "A.F_CV.csv")) == 2
+
+    with open(path, 'ab') as f:
+        f.write(third[15:])
+    transfer.transfer_files()
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), df)
+
+
+def test_resume_appends_falls_back_to_a_full_transfer_after_a_rewrite(transfer, remote_dir):
+    transfer.skip_unchanged = transfer.resume_appends = True
+    df = tag_frame(300)
+    write_remote(remote_dir, "A.F_CV.csv", df.iloc[:200])
+    transfer.transfer_files()
+
+    # An overlapping export rewrites the file, shifting the bytes after the corrected row
+    revised = df.copy()
+    revised.loc[150, 'value'] = -1000.25
+    write_remote(remote_dir, "A.F_CV.csv", revised)
+    transfer.transfer_files()
+
+    assert transfer.metrics.counters['bytes_transferred'] == (remote_dir / "A.F_CV.csv").stat().st_size
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), revised)
+
+
+def test_resume_appends_sees_a_same_width_correction_before_the_previous_end(transfer, remote_dir):
+    transfer.skip_unchanged = transfer.resume_appends = True
+    df = tag_frame(300)
+    path = str(remote_dir / "A.F_CV.csv")
+    csv_store.merge_into_csv(path, df.iloc[:200], retention_days=None)
+    transfer.transfer_files()
+
+    # An overlapping export corrects one row without changing its width, and adds later rows:
+    # every byte up to the previous end but that row is unchanged
+    revised = df.copy()
+    revised.loc[150, 'value'] += 1
+    assert len(str(revised.loc[150, 'value'])) == len(str(df.loc[150, 'value']))
+    assert csv_store.merge_into_csv(path, revised.iloc[100:], retention_days=None) == 'rewritten'
+    transfer.transfer_files()
+
+    assert transfer.metrics.counters['bytes_transferred'] == os.path.getsize(path)
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), revised)
+
+
+def test_resume_appends_reads_new_members_of_a_compressed_mirror(transfer, remote_dir):
+    transfer.skip_unchanged = transfer.resume_appends = True
+    df = tag_frame(300)
+    path = str(remote_dir / "A.F_CV.csv")
+    csv_store.merge_into_csv(path, df.iloc[:200], retention_days=None, mirror_compression='gzip')
+    transfer.transfer_files()
+    size = os.path.getsize(path + ".gz")
+
+    csv_store.merge_into_csv(path, df.iloc[200:], retention_days=None, mirror_compression='gzip')
+    transfer.transfer_files()
+
+    assert transfer.metrics.counters['bytes_transferred'] == os.path.getsize(path + ".gz") - size
+    pd.testing.assert_frame_equal(local_rows(transfer, "A.F_CV.csv"), df)
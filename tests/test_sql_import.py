@@ -0,0 +1,306 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_store
+from db_backend import SQLiteBackend, SQLiteNarrowBackend
+from sql_import import SQLImporter, block_checksums, build_insert_params
+from watermark_store import WatermarkStore
+
+TAG = "SYNTH.TAG00000"
+
+
+def tag_frame(start, periods, seconds=60, offset=0.0):
+    timestamps = pd.date_range(start, periods=periods, freq=f"{seconds}s")
+    values = np.round(np.sin(np.arange(periods) / 10.0) * 50 + offset, 6)
+    return pd.DataFrame({'timestamp': timestamps, 'value': values})
+
+
+def expected_rows(df):
+    return list(zip(df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S'), df['value'].tolist()))
+
+
+def write_tag(importer, df, tag=TAG):
+    path = os.path.join(importer.csv_dir, f"{tag}.F_CV.csv")
+    csv_store.rewrite(path, df)
+    return path
+
+
+def stored_rows(backend, tag=TAG):
+    conn = backend.connect()
+    try:
+        if backend.uses_tag_ids:
+            sql = ("SELECT f.Timestamp, f.Value FROM TagFacts f JOIN Tags t ON t.TagId = f.TagId "
+                   "WHERE t.TagName = ? ORDER BY f.Timestamp")
+        else:
+            sql = "SELECT Timestamp, Value FROM TagData WHERE TagName = ? ORDER BY Timestamp"
+        return conn.execute(sql, (tag,)).fetchall()
+    finally:
+        conn.close()
+
+
+def make_importer(tmp_path, backend_class, mode='append'):
+    importer = SQLImporter(backend_class(str(tmp_path / "historian.db")))
+    importer.csv_dir = str(tmp_path / "exports")
+    importer.watermark_path = str(tmp_path / "watermarks.db")
+    importer.ingest_mode = mode
+    os.makedirs(importer.csv_dir, exist_ok=True)
+    return importer
+
+
+@pytest.fixture(params=[SQLiteBackend, SQLiteNarrowBackend], ids=['wide', 'narrow'])
+def backend_class(request):
+    return request.param
+
+
+def test_build_insert_params_renders_iso_timestamps():
+    df = tag_frame("2024-01-01", 2)
+    params = build_insert_params(TAG, df['timestamp'], df['value'])
+    assert params == [(TAG, '2024-01-01T00:00:00', df['value'][0]), (TAG, '2024-01-01T00:01:00', df['value'][1])]
+
+
+@pytest.mark.parametrize("batch_size, commit_batches", [(10000, 0), (64, 3)])
+def test_append_import_loads_every_row(tmp_path, backend_class, batch_size, commit_batches):
+    importer = make_importer(tmp_path, backend_class)
+    importer.batch_size = batch_size
+    importer.commit_batches = commit_batches
+    df = tag_frame("2024-01-01", 500)
+    write_tag(importer, df)
+
+    importer.import_all()
+
+    assert stored_rows(importer.backend) == expected_rows(df)
+    assert importer.metrics.counters['rows_inserted'] == 500
+
+
+def test_append_import_inserts_only_rows_after_the_latest_timestamp(tmp_path, backend_class):
+    importer = make_importer(tmp_path, backend_class)
+    df = tag_frame("2024-01-01", 300)
+    write_tag(importer, df.iloc[:200])
+    importer.import_all()
+
+    write_tag(importer, df)
+    # A fresh importer: one run imports each tag once
+    make_importer(tmp_path, backend_class).import_all()
+
+    assert stored_rows(importer.backend) == expected_rows(df)
+
+
+def test_parallel_import_loads_every_tag(tmp_path, backend_class):
+    importer = make_importer(tmp_path, backend_class)
+    importer.workers = 4
+    frames = {f"SYNTH.TAG{i:05d}": tag_frame("2024-01-01", 200, offset=i) for i in range(6)}
+    for tag, df in frames.items():
+        write_tag(importer, df, tag)
+
+    importer.import_all()
+
+    for tag, df in frames.items():
+        assert stored_rows(importer.backend, tag) == expected_rows(df)
+    assert importer.metrics.counters['tags_imported'] == 6
+
+
+def test_watermarks_are_cached_and_resynchronized(tmp_path):
+    importer = make_importer(tmp_path, SQLiteBackend)
+    df = tag_frame("2024-01-01", 100)
+    write_tag(importer, df)
+    importer.import_all()
+
+    store = WatermarkStore(importer.watermark_path)
+    assert store.load() == {TAG: datetime(2024, 1, 1, 1, 39)}
+    # A cache that is ahead of the database hides the rows after the real watermark
+    store.replace_all({TAG: datetime(2024, 1, 2)})
+    store.close()
+    write_tag(importer, tag_frame("2024-01-01", 150))
+    make_importer(tmp_path, SQLiteBackend).import_all()
+    assert len(stored_rows(importer.backend)) == 100
+
+    importer = make_importer(tmp_path, SQLiteBackend)
+    importer.resync_watermarks = True
+    importer.import_all()
+    assert stored_rows(importer.backend) == expected_rows(tag_frame("2024-01-01", 150))
+
+
+def corrected(df, rows=(10, 11, 250)):
+    """A copy of df with the values of some earlier rows revised, as a Historian backfill would."""
+    df = df.copy()
+    df.loc[list(rows), 'value'] += 1000.0
+    return df
+
+
+def test_merge_import_applies_corrected_values(tmp_path, backend_class):
+    importer = make_importer(tmp_path, backend_class, mode='merge')
+    df = tag_frame("2024-01-01", 400)
+    write_tag(importer, df.iloc[:300])
+    importer.import_all()
+
+    revised = corrected(df)
+    write_tag(importer, revised)
+    make_importer(tmp_path, backend_class, mode='merge').import_all()
+
+    assert stored_rows(importer.backend) == expected_rows(revised)
+
+
+def test_append_import_keeps_values_before_the_watermark(tmp_path):
+    importer = make_importer(tmp_path, SQLiteBackend)
+    df = tag_frame("2024-01-01", 400)
+    write_tag(importer, df.iloc[:300])
+    importer.import_all()
+
+    write_tag(importer, corrected(df))
+    make_importer(tmp_path, SQLiteBackend).import_all()
+
+    assert stored_rows(importer.backend) == expected_rows(df)
+
+
+def test_narrow_schema_keys_rows_by_tag_id(tmp_path):
+    importer = make_importer(tmp_path, SQLiteNarrowBackend)
+    for tag in ("A", "B"):
+        write_tag(importer, tag_frame("2024-01-01", 100), tag)
+    importer.import_all()
+
+    for tag in ("A", "B"):
+        write_tag(importer, tag_frame("2024-01-01", 150), tag)
+    importer = make_importer(tmp_path, SQLiteNarrowBackend)
+    importer.import_all()
+
+    conn = importer.backend.connect()
+    tags = conn.execute("SELECT TagName, TagId FROM Tags ORDER BY TagName").fetchall()
+    facts = conn.execute("SELECT TagId, COUNT(*) FROM TagFacts GROUP BY TagId ORDER BY TagId").fetchall()
+    conn.close()
+    assert importer.tag_ids == dict(tags)
+    assert [count for _, count in facts] == [150, 150]
+    assert sorted(tag_id for _, tag_id in tags) == [tag_id for tag_id, _ in facts]
+
+
+def stored_rollups(backend, table):
+    conn = backend.connect()
+    try:
+        rows = conn.execute(f"SELECT BucketStart, MinValue, MaxValue, SumValue, SampleCount FROM {table} "
+                            "ORDER BY BucketStart").fetchall()
+    finally:
+        conn.close()
+    return pd.DataFrame(rows, columns=['bucket', 'min', 'max', 'sum', 'count'])
+
+
+def expected_rollups(df, seconds):
+    buckets = df['timestamp'].dt.floor(f"{seconds}s").dt.strftime('%Y-%m-%dT%H:%M:%S')
+    stats = df['value'].groupby(buckets.values).agg(['min', 'max', 'sum', 'count'])
+    return stats.rename_axis('bucket').reset_index()
+
+
+@pytest.mark.parametrize("mode", ['append', 'merge', 'diff'])
+def test_rollups_follow_the_imported_rows(tmp_path, backend_class, mode):
+    importer = make_importer(tmp_path, backend_class, mode=mode)
+    df = tag_frame("2024-01-01 00:00:30", 400, seconds=30)
+    write_tag(importer, df.iloc[:300])
+    importer.import_all()
+    final = df if mode == 'append' else corrected(df)
+    write_tag(importer, final)
+    make_importer(tmp_path, backend_class, mode=mode).import_all()
+
+    for seconds, table in importer.backend.rollup_tables.items():
+        pd.testing.assert_frame_equal(stored_rollups(importer.backend, table), expected_rollups(final, seconds),
+                                      check_dtype=False)
+
+
+def test_block_checksums_change_only_with_their_block():
+    df = tag_frame("2024-01-01", 240)
+    checksums = block_checksums(df['timestamp'], df['value'], 3600)
+    assert sorted(checksums) == [1704067200, 1704070800, 1704074400, 1704078000]
+
+    revised = corrected(df, rows=(70,))
+    changed = block_checksums(revised['timestamp'], revised['value'], 3600)
+    assert [block for block in checksums if checksums[block] != changed[block]] == [1704070800]
+
+    # Signed zeros and NaN payloads do not survive every driver, so they hash alike
+    signed = df.copy()
+    signed.loc[0, 'value'] = 0.0
+    negative = signed.copy()
+    negative.loc[0, 'value'] = -0.0
+    assert (block_checksums(signed['timestamp'], signed['value'], 3600)
+            == block_checksums(negative['timestamp'], negative['value'], 3600))
+
+
+def test_diff_import_replaces_only_changed_blocks(tmp_path, backend_class):
+    importer = make_importer(tmp_path, backend_class, mode='diff')
+    df = tag_frame("2024-01-01", 600)
+    write_tag(importer, df)
+    importer.import_all()
+    assert importer.metrics.counters['blocks_changed'] == 10
+
+    importer = make_importer(tmp_path, backend_class, mode='diff')
+    importer.import_all()
+    assert importer.metrics.counters['blocks_changed'] == 0
+
+    revised = corrected(df, rows=(70, 75))
+    write_tag(importer, revised)
+    importer = make_importer(tmp_path, backend_class, mode='diff')
+    importer.import_all()
+    assert importer.metrics.counters['blocks_checked'] == 10
+    assert importer.metrics.counters['blocks_changed'] == 1
+    assert importer.metrics.counters['rows_inserted'] == 60
+    assert stored_rows(importer.backend) == expected_rows(revised)
+
+
+def test_diff_import_hashes_unrecorded_blocks_from_the_database(tmp_path, backend_class):
+    df = tag_frame("2024-01-01", 600)
+    importer = make_importer(tmp_path, backend_class)
+    write_tag(importer, df)
+    importer.import_all()
+
+    # Switching an append-imported database to diff mode rewrites only what differs
+    importer = make_importer(tmp_path, backend_class, mode='diff')
+    revised = corrected(df, rows=(300,))
+    write_tag(importer, revised)
+    importer.import_all()
+
+    assert importer.metrics.counters['blocks_changed'] == 1
+    assert stored_rows(importer.backend) == expected_rows(revised)
+
+
+def test_diff_import_keeps_rows_trimmed_from_the_file(tmp_path, backend_class):
+    importer = make_importer(tmp_path, backend_class, mode='diff')
+    df = tag_frame("2024-01-01", 600)
+    write_tag(importer, df)
+    importer.import_all()
+
+    # Retention dropped the file's first 90 minutes; the database keeps them
+    revised = corrected(df, rows=(100, 101))
+    write_tag(importer, revised.iloc[90:])
+    make_importer(tmp_path, backend_class, mode='diff').import_all()
+
+    assert stored_rows(importer.backend) == expected_rows(revised)
+
+
+def test_diff_import_source_without_start_run(tmp_path):
+    importer = make_importer(tmp_path, SQLiteBackend, mode='diff')
+    df = tag_frame("2024-01-01", 120)
+    path = write_tag(importer, df)
+
+    assert importer.import_source(path)
+    importer.close_worker_connections()
+
+    assert stored_rows(importer.backend) == expected_rows(df)
+    assert os.path.exists(importer.watermark_path)
+
+
+@pytest.mark.parametrize("mode", ['merge', 'diff'])
+def test_corrections_end_with_the_rows_of_a_fresh_import(tmp_path, backend_class, mode):
+    df = tag_frame("2024-01-01", 600)
+    revised = corrected(df, rows=(10, 11, 250, 599))
+
+    fresh = make_importer(tmp_path / "fresh", backend_class)
+    write_tag(fresh, revised)
+    fresh.import_all()
+
+    importer = make_importer(tmp_path / mode, backend_class, mode=mode)
+    write_tag(importer, df.iloc[:500])
+    importer.import_all()
+    write_tag(importer, revised)
+    make_importer(tmp_path / mode, backend_class, mode=mode).import_all()
+
+    assert stored_rows(importer.backend) == stored_rows(fresh.backend) == expected_rows(revised)
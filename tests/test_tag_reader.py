@@ -0,0 +1,153 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_store
+from db_backend import SQLiteBackend, SQLiteNarrowBackend
+from sql_import import SQLImporter
+from tag_reader import BLOCK_SECONDS, TagReader, lttb
+
+TAG = "SYNTH.TAG00000"
+START = pd.Timestamp("2024-01-01")
+
+
+def tag_frame(periods, seconds=30):
+    timestamps = pd.date_range(START, periods=periods, freq=f"{seconds}s")
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.round(np.sin(np.arange(periods) / 50.0) * 10, 6)})
+
+
+def make_importer(backend, tmp_path):
+    importer = SQLImporter(backend)
+    importer.csv_dir = str(tmp_path / "exports")
+    importer.watermark_path = str(tmp_path / "watermarks.db")
+    os.makedirs(importer.csv_dir, exist_ok=True)
+    return importer
+
+
+@pytest.fixture(params=[SQLiteBackend, SQLiteNarrowBackend], ids=['wide', 'narrow'])
+def importer(request, tmp_path):
+    return make_importer(request.param(str(tmp_path / "historian.db")), tmp_path)
+
+
+def import_rows(importer, df):
+    csv_store.rewrite(os.path.join(importer.csv_dir, f"{TAG}.F_CV.csv"), df)
+    importer.import_all()
+
+
+def test_read_raw_serves_repeated_reads_from_the_cache(importer):
+    df = tag_frame(2880)
+    import_rows(importer, df)
+    reader = TagReader(importer.backend)
+
+    timestamps, values = reader.read_raw(TAG, "2024-01-01 03:00", "2024-01-01 15:00")
+    expected = df[(df['timestamp'] >= "2024-01-01 03:00") & (df['timestamp'] < "2024-01-01 15:00")]
+    np.testing.assert_array_equal(timestamps, expected['timestamp'].to_numpy())
+    np.testing.assert_array_equal(values, expected['value'].to_numpy())
+    assert (reader.hits, reader.misses) == (0, 3)
+
+    reader.read_raw(TAG, "2024-01-01 06:00", "2024-01-01 12:00")
+    assert (reader.hits, reader.misses) == (1, 3)
+    reader.close()
+
+
+def test_import_listener_invalidates_cached_blocks(importer, tmp_path):
+    df = tag_frame(2880)
+    import_rows(importer, df.iloc[:1000])
+    reader = TagReader(importer.backend)
+    assert len(reader.read_raw(TAG, START, START + pd.Timedelta(days=1))[0]) == 1000
+
+    # A later run, as the scheduler starts one per day
+    importer = make_importer(importer.backend, tmp_path)
+    importer.add_listener(reader.invalidate)
+    import_rows(importer, df)
+
+    assert len(reader.read_raw(TAG, START, START + pd.Timedelta(days=1))[0]) == 2880
+    reader.close()
+
+
+def test_block_fetched_across_an_invalidation_is_not_cached(importer, tmp_path):
+    df = tag_frame(2880)
+    import_rows(importer, df.iloc[:500])
+    reader = TagReader(importer.backend)
+    importer = make_importer(importer.backend, tmp_path)
+    query = reader._query
+
+    def query_then_import(*args):
+        # The import commits and notifies the reader after this read's query ran
+        columns = query(*args)
+        reader._query = query
+        importer.add_listener(reader.invalidate)
+        import_rows(importer, df)
+        return columns
+
+    reader._query = query_then_import
+    assert len(reader.read_raw(TAG, START, START + pd.Timedelta(hours=6))[0]) == 500
+
+    assert len(reader.read_raw(TAG, START, START + pd.Timedelta(hours=6))[0]) == 720
+    assert (reader.hits, reader.misses) == (0, 2)
+    assert len(reader.read_raw(TAG, START, START + pd.Timedelta(days=1))[0]) == 2880
+    reader.close()
+
+
+def test_read_buckets_from_rollups_match_raw_samples(importer):
+    import_rows(importer, tag_frame(2880))
+    reader = TagReader(importer.backend)
+    raw_reader = TagReader(importer.backend)
+    raw_reader.use_rollups = False
+
+    for interval in (60, 900, 3600):
+        buckets = reader.read_buckets(TAG, "2024-01-01 00:10:30", "2024-01-01 20:50", interval)
+        raw = raw_reader.read_buckets(TAG, "2024-01-01 00:10:30", "2024-01-01 20:50", interval)
+        assert buckets.keys() == raw.keys()
+        for name in buckets:
+            np.testing.assert_allclose(buckets[name].astype(np.float64), raw[name].astype(np.float64))
+    reader.close()
+    raw_reader.close()
+
+
+def test_empty_ranges_return_empty_arrays(importer):
+    import_rows(importer, tag_frame(2880))
+    reader = TagReader(importer.backend)
+
+    for start, end in [("2024-01-01 06:00", "2024-01-01 06:00"), ("2024-01-01 12:00", "2024-01-01 06:00")]:
+        buckets = reader.read_buckets(TAG, start, end, 3600)
+        assert sorted(buckets) == ['count', 'max', 'mean', 'min', 'timestamp']
+        assert all(len(column) == 0 for column in buckets.values())
+        for method in ('lttb', 'bucket'):
+            timestamps, values = reader.read_series(TAG, start, end, points=100, method=method)
+            assert len(timestamps) == len(values) == 0
+    reader.close()
+
+
+def test_lttb_keeps_the_end_points_and_the_peak():
+    timestamps = pd.date_range(START, periods=1000, freq="1s").to_numpy()
+    values = np.zeros(1000)
+    values[500] = 100.0
+
+    sampled_timestamps, sampled_values = lttb(timestamps, values, 50)
+
+    assert len(sampled_values) == 50
+    assert sampled_timestamps[0] == timestamps[0] and sampled_timestamps[-1] == timestamps[-1]
+    assert 100.0 in sampled_values
+
+
+def test_concurrent_reads_count_every_block_once(importer):
+    import_rows(importer, tag_frame(2880))
+    reader = TagReader(importer.backend)
+    blocks = 86400 // BLOCK_SECONDS['raw']
+
+    def read():
+        for _ in range(20):
+            reader.read_raw(TAG, START, START + pd.Timedelta(days=1))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert reader.hits + reader.misses == 8 * 20 * blocks
+    reader.close()
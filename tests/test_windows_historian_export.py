@@ -0,0 +1,189 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csv_codec
+import partition_store
+import series_compression
+import windows_historian_export as exporter
+from fake_historian import FakeHistorian, FakeHistorianConnection, FakeHistorianCursor
+
+
+class GroupFailingCursor(FakeHistorianCursor):
+    """Rejects multi-tag queries, as a Historian without grouped query support would."""
+
+    def execute(self, query):
+        if " OR " in query:
+            self.historian.record_query()
+            raise exporter.HistorianError("grouped queries are not supported")
+        super().execute(query)
+
+
+class GroupFailingConnection(FakeHistorianConnection):
+    def cursor(self):
+        return GroupFailingCursor(self.historian)
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    path = tmp_path / "exports"
+    monkeypatch.setattr(exporter, "EXPORT_PATH", str(path))
+    monkeypatch.setattr(exporter, "LOG_FILE", str(tmp_path / "historian_export_log.txt"))
+    monkeypatch.setattr(exporter, "LOCK_FILE", str(tmp_path / "export.lock"))
+    monkeypatch.setattr(exporter.METRICS, "directory", str(tmp_path / "metrics"))
+    return path
+
+
+def use_historian(monkeypatch, historian, connection_class=FakeHistorianConnection):
+    monkeypatch.setattr(exporter, "CONNECTION_FACTORY", lambda: connection_class(historian))
+    return historian
+
+
+def yesterday():
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return end - timedelta(days=1), end
+
+
+def read_export(export_dir, tag):
+    return csv_codec.read_csv(os.path.join(export_dir, f"{tag}.csv"))
+
+
+def exported_timestamps(export_dir, tag):
+    return read_export(export_dir, tag)['timestamp']
+
+
+def expected_timestamps():
+    start, end = yesterday()
+    return pd.Series(pd.date_range(start, end, freq=f"{exporter.SAMPLE_INTERVAL_SECONDS}s", inclusive="left"),
+                     name='timestamp')
+
+
+def test_grouped_queries_export_every_tag_in_few_queries(export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=3))
+
+    exporter.main()
+
+    for tag in historian.tags:
+        pd.testing.assert_series_equal(exported_timestamps(export_dir, tag), expected_timestamps())
+    # The tag list, then one grouped query for the whole day
+    assert historian.queries == 2
+
+
+def test_per_tag_queries_export_the_same_rows(export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=3))
+    monkeypatch.setattr(exporter, "TAG_GROUP_SIZE", 1)
+
+    exporter.main()
+
+    for tag in historian.tags:
+        pd.testing.assert_series_equal(exported_timestamps(export_dir, tag), expected_timestamps())
+    assert historian.queries == 1 + 3 * 4
+
+
+def test_failed_grouped_query_falls_back_to_per_tag_queries(export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=3), GroupFailingConnection)
+
+    exporter.main()
+
+    for tag in historian.tags:
+        pd.testing.assert_series_equal(exported_timestamps(export_dir, tag), expected_timestamps())
+    # The tag list, the failed grouped query, then four windows per tag
+    assert historian.queries == 2 + 3 * 4
+
+
+def test_split_rows_by_tag_matches_names_case_insensitively():
+    chunk = pd.DataFrame({'tagname': ['a.F_CV', 'B.F_CV', 'A.f_cv'],
+                          'timestamp': pd.date_range("2024-01-01", periods=3, freq="5s"),
+                          'value': [1.0, 2.0, 3.0]})
+
+    frames = exporter.split_rows_by_tag(chunk, ['A.F_CV', 'B.F_CV'])
+
+    assert sorted(frames) == ['A.F_CV', 'B.F_CV']
+    assert frames['A.F_CV']['value'].tolist() == [1.0, 3.0]
+    assert frames['B.F_CV']['value'].tolist() == [2.0]
+
+
+def test_parallel_export_matches_the_serial_export(tmp_path, export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=5))
+    monkeypatch.setattr(exporter, "TAG_GROUP_SIZE", 2)
+    exporter.main()
+    serial = {tag: read_export(export_dir, tag) for tag in historian.tags}
+
+    parallel_dir = tmp_path / "parallel"
+    monkeypatch.setattr(exporter, "EXPORT_PATH", str(parallel_dir))
+    monkeypatch.setattr(exporter, "EXPORT_WORKERS", 3)
+    exporter.main()
+
+    for tag in historian.tags:
+        pd.testing.assert_frame_equal(read_export(parallel_dir, tag), serial[tag])
+
+
+def test_small_fetch_batches_write_the_same_csv(tmp_path, export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=2))
+    exporter.main()
+    whole = {tag: read_export(export_dir, tag) for tag in historian.tags}
+
+    batched_dir = tmp_path / "batched"
+    monkeypatch.setattr(exporter, "EXPORT_PATH", str(batched_dir))
+    monkeypatch.setattr(exporter, "FETCH_BATCH_ROWS", 1000)
+    exporter.main()
+
+    for tag in historian.tags:
+        pd.testing.assert_frame_equal(read_export(batched_dir, tag), whole[tag])
+
+
+def test_parquet_export_writes_each_day_partition_once(export_dir, monkeypatch):
+    monkeypatch.setattr(exporter, "STORAGE_FORMAT", "parquet")
+    writes = []
+    write_partitions = partition_store.write_partitions
+
+    def counting_write_partitions(tag_dir, df):
+        writes.append(len(df))
+        return write_partitions(tag_dir, df)
+
+    monkeypatch.setattr(partition_store, "write_partitions", counting_write_partitions)
+    start, end = yesterday()
+    timestamps = pd.date_range(start - timedelta(days=1), end, freq="60s", inclusive="left")
+    frame = pd.DataFrame({'timestamp': timestamps, 'value': np.arange(len(timestamps)) * 0.5})
+
+    export = exporter.TagExport("TAG")
+    for i in range(0, len(frame), 100):
+        export.write(frame.iloc[i:i + 100])
+    export.close()
+
+    assert writes == [1440, 1440]
+    pd.testing.assert_frame_equal(partition_store.read_partitions(export.target), frame)
+
+
+def test_incremental_window_continues_after_each_tags_last_row(export_dir):
+    os.makedirs(export_dir)
+    exported = pd.DataFrame({'timestamp': pd.to_datetime(["2024-01-01 11:00:00", "2024-01-01 11:30:00"]),
+                             'value': [1.0, 2.0]})
+    exported.to_csv(os.path.join(export_dir, "OLD.csv"), index=False)
+
+    start, end, starts = exporter.incremental_window(["OLD", "NEW"], now=datetime(2024, 1, 1, 12, 0, 33))
+
+    assert end == datetime(2024, 1, 1, 11, 59, 30)
+    assert starts == {'OLD': datetime(2024, 1, 1, 11, 30, 5), 'NEW': datetime(2023, 12, 31, 11, 59, 30)}
+    assert start == starts['NEW']
+
+
+def test_compressed_export_rebuilds_within_the_deviation(tmp_path, export_dir, monkeypatch):
+    historian = use_historian(monkeypatch, FakeHistorian(tag_count=1))
+    exporter.main()
+    tag = historian.tags[0]
+    full = csv_codec.read_csv(os.path.join(export_dir, f"{tag}.csv"))
+
+    monkeypatch.setattr(exporter, "EXPORT_PATH", str(tmp_path / "compressed"))
+    monkeypatch.setattr(exporter, "COMPRESSION", "swinging_door")
+    monkeypatch.setattr(exporter, "COMPRESSION_DEVIATION", 0.5)
+    exporter.main()
+    kept = csv_codec.read_csv(os.path.join(tmp_path / "compressed", f"{tag}.csv"))
+
+    rebuilt = series_compression.reinterpolate(kept['timestamp'].to_numpy(), kept['value'].to_numpy(),
+                                               full['timestamp'].to_numpy())
+    assert len(kept) < len(full) / 2
+    assert abs(rebuilt - full['value'].to_numpy()).max() <= 0.5 + 1e-9